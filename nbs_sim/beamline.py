@@ -1,3 +1,7 @@
+import time
+
+_IMPORT_START = time.perf_counter()
+
 from caproto.server import (
     PVGroup,
     SubGroup,
@@ -6,12 +10,22 @@ from caproto.server import (
     run,
     PvpropertyDouble,
 )
-import time
-from .load import createIOCDevice
+from caproto import ChannelType
+from functools import partial
+from typing import NamedTuple
+import asyncio
+from .load import createIOCDevice, PVCollector, split_deferred
 import numpy as np
 from scipy.special import erf
-from os.path import join, dirname
-from scipy.interpolate import UnivariateSpline
+from os.path import abspath, dirname, join
+from .spectral import SpectralTable
+from .cache import ModelCache
+from .spectral_db import SpectralDatabase
+from .resolution import BroadeningCache
+from .noise import NoiseService
+from .clock import SimClock, default_clock
+from .scheduler import TickScheduler, resolve_scan_policies
+from .profiling import StartupProfile, maybe_phase
 from nbs_core.beamline import BeamlineModel
 from nbs_core.autoconf import generate_device_config
 from nbs_core.autoload import loadFromConfig
@@ -21,51 +35,390 @@ try:
 except ModuleNotFoundError:
     import tomli as tomllib
 
+IMPORT_TIME = time.perf_counter() - _IMPORT_START
 
 def norm_erf(x, width=1):
     return 0.5 * (erf(2.0 * x / width) + 1)
 
 
+class TransmissionProduct:
+    """
+    Incrementally maintained product of the beamline transmission factors.
+
+    Devices push their new value through ``update``; zero factors are
+    counted separately so that closing a shutter does not lose the product
+    of the remaining devices. ``generation`` is bumped on every change and
+    lets cached beam states detect that they are stale.
+    """
+
+    resync_interval = 1000
+
+    def __init__(self):
+        self._factors = {}
+        self._product = 1.0
+        self._zeros = 0
+        self._updates = 0
+        self.generation = 0
+
+    def add(self, key, value=1.0):
+        self._factors[key] = 1.0
+        self.update(key, value)
+
+    def update(self, key, value):
+        old = self._factors[key]
+        if value == old:
+            return
+        if old == 0:
+            self._zeros -= 1
+        else:
+            self._product /= old
+        if value == 0:
+            self._zeros += 1
+        else:
+            self._product *= value
+        self._factors[key] = value
+        self._updates += 1
+        if self._updates % self.resync_interval == 0:
+            self._resync()
+        self.generation += 1
+
+    def _resync(self):
+        """Recompute the product from scratch to shed accumulated rounding."""
+        product = 1.0
+        zeros = 0
+        for value in self._factors.values():
+            if value == 0:
+                zeros += 1
+            else:
+                product *= value
+        self._product = product
+        self._zeros = zeros
+
+    @property
+    def value(self):
+        if self._zeros:
+            return 0.0
+        return self._product
+
+
+class BeamState(NamedTuple):
+    """
+    Immutable snapshot of the beam physics for one simulation tick.
+
+    Detectors read from a shared snapshot instead of re-evaluating the
+    current, transmission, manipulator geometry and splines on every scan.
+    """
+
+    tick: int
+    generation: int
+    timestamp: float
+    current: float
+    transmission: float
+    energy: float
+    sample_overlap: float
+    transmitted_overlap: float
+    sample_yield: float
+    reference_yield: float
+    sample: object = None
+    undulator: float = 1.0
+
+    @property
+    def intensity(self):
+        return self.current * self.transmission * self.undulator
+
+
+class DeviceDict(dict):
+    """Beamline devices; looking up a deferred device builds it."""
+
+    def __init__(self, loader):
+        super().__init__()
+        self.loader = loader
+
+    def __missing__(self, key):
+        if key in self.loader.deferred:
+            self.loader.load(key)
+            return self[key]
+        raise KeyError(key)
+
+
+class DeferredLoader(PVGroup):
+    """
+    Builds deferred devices on first use.
+
+    Devices with ``_defer_loading`` set, or in one of the beamline's
+    ``deferred_groups``, are left out at startup. ``nbs-sim`` takes the
+    groups from sim_conf.toml::
+
+        [loading]
+        deferred_groups = ["mirrors", "vacuum"]
+
+    Looking a device up in ``Beamline.devices``, or writing its key or
+    group name to LOAD, builds it and adds its PVs to the running server.
+    """
+
+    LOAD = pvproperty(
+        value="",
+        dtype=ChannelType.STRING,
+        doc="Device key or group name of deferred devices to build",
+    )
+    PENDING = pvproperty(value=0, read_only=True, doc="Deferred devices not built yet")
+
+    def __init__(self, prefix, deferred, parent=None, **kwargs):
+        super().__init__(prefix, parent=parent)
+        self.deferred = deferred
+        self._async_lib = None
+
+    def keys_for(self, name):
+        if name in self.deferred:
+            return [name]
+        keys = []
+        for key, info in self.deferred.items():
+            groups = info.get("_group", ["misc"])
+            if name in ([groups] if isinstance(groups, str) else groups):
+                keys.append(key)
+        return keys
+
+    def load(self, name):
+        """Build the deferred device or group ``name``; returns the new keys."""
+        keys = self.keys_for(name)
+        if not keys:
+            raise KeyError(f"No deferred device or group named {name!r}")
+        config = {key: self.deferred.pop(key) for key in keys}
+        pvdb = self.parent.load_config(config)
+        if self._async_lib is not None:
+            self.parent.start_pvs(pvdb, self._async_lib)
+            asyncio.ensure_future(self.PENDING.write(len(self.deferred)))
+        return keys
+
+    @LOAD.startup
+    async def LOAD(self, instance, async_lib):
+        self._async_lib = async_lib
+        await self.PENDING.write(len(self.deferred))
+
+    @LOAD.putter
+    async def LOAD(self, instance, value):
+        if value:
+            self.load(value)
+        return value
+
+
 class Beamline(BeamlineModel, PVGroup):
-    def __init__(self, *args, config, **kwargs):
+    def __init__(
+        self,
+        *args,
+        config,
+        tick_period=0.05,
+        energy_resolution=0.05,
+        spectral_tolerance=1e-4,
+        model_cache=None,
+        startup_profile=None,
+        spectral_db=None,
+        scan_config=None,
+        seed=None,
+        clock=None,
+        shard=None,
+        deferred_groups=(),
+        config_dir=None,
+        **kwargs
+    ):
         super().__init__(*args, devices={}, groups={}, roles={}, **kwargs)
-        self.load_detector_data()
-        devices, groups, roles = loadFromConfig(config, createIOCDevice, parent=self)
+        self.config_dir = config_dir
+        self.tick_period = tick_period
+        self.energy_resolution = energy_resolution
+        self.spectral_tolerance = spectral_tolerance
+        self.model_cache = model_cache
+        self._beam_state = None
+        self._sample_tables = {}
+        self._broadened = BroadeningCache()
+        self.transmission_product = TransmissionProduct()
+        self._polled_transmission = []
+        self.clock = clock if clock is not None else default_clock
+        self.noise = NoiseService(seed)
+        self.shard = shard
+        self.scan_config = scan_config
+        control_prefix = self.prefix
+        if shard is not None and shard.index > 0:
+            control_prefix = f"{self.prefix}SHARD{shard.index}:"
+        self.scheduler = TickScheduler(f"{control_prefix}SCHED:", parent=self)
+        self.pvdb.update(self.scheduler.pvdb)
+        config, deferred = split_deferred(config, deferred_groups)
+        self.loader = DeferredLoader(control_prefix, deferred, parent=self)
+        self.pvdb.update(self.loader.pvdb)
+        self.devices = DeviceDict(self.loader)
+        with maybe_phase(startup_profile, "spectral models"):
+            self.load_detector_data()
+            if isinstance(spectral_db, str):
+                spectral_db = SpectralDatabase(spectral_db)
+            self.spectral_db = spectral_db
+        collector = PVCollector()
+        with maybe_phase(startup_profile, "device construction"):
+            devices, groups, roles = loadFromConfig(
+                config,
+                createIOCDevice,
+                parent=self,
+                profile=startup_profile,
+                collector=collector,
+            )
+        with maybe_phase(startup_profile, "pvdb assembly"):
+            collector.merge_into(self.pvdb)
+        with maybe_phase(startup_profile, "beamline configuration"):
+            self.loadDevices(devices, groups, roles)
+            self.transmission_list = []
+
+            self.configure_beamline()
+            self.configure_scan(scan_config, config, groups, roles)
+            if shard is not None:
+                shard.attach(self)
+
+    def load_config(self, config):
+        """
+        Build the devices of ``config`` into the running beamline and
+        return the pvdb they add.
+        """
+        collector = PVCollector()
+        devices, groups, roles = loadFromConfig(
+            config, createIOCDevice, parent=self, collector=collector
+        )
+        pvdb = {}
+        collector.merge_into(pvdb)
+        if not self.pvdb.keys().isdisjoint(pvdb):
+            raise ValueError(
+                f"Duplicate PV names: {sorted(self.pvdb.keys() & pvdb.keys())}"
+            )
+        self.pvdb.update(pvdb)
         self.loadDevices(devices, groups, roles)
-        self.transmission_list = []
+        for group in ("gatevalves", "shutters", "apertures"):
+            for key in groups.get(group, []):
+                print(f"Adding {key} to transmission")
+                self.add_to_transmission(devices[key])
+        self.configure_scan(self.scan_config, config, groups, roles)
+        return pvdb
 
-        self.configure_beamline()
+    def start_pvs(self, pvdb, async_lib):
+        """Run the startup hooks of PVs added after the server started."""
+        for instance in pvdb.values():
+            instances = [instance]
+            if hasattr(instance, "fields"):
+                instances.extend(instance.fields.values())
+            for inst in instances:
+                for attr in ("server_startup", "server_scan"):
+                    method = getattr(inst, attr, None)
+                    if method is not None:
+                        asyncio.ensure_future(method(async_lib))
+
+    def configure_scan(self, scan_config, config, groups, roles):
+        policies = resolve_scan_policies(scan_config, groups, roles, config)
+        for key, policy in policies.items():
+            if key in self.devices:
+                self.scheduler.configure(self.devices[key], policy)
 
     def load_detector_data(self):
         dirpath = dirname(__file__)
         print(dirpath)
-        data = np.load(join(dirpath, "all_edges.npz"))
-        refdata = np.load(join(dirpath, "all_ref.npz"))
-        self.yspl = UnivariateSpline(data["x"], data["y"], s=0)
-        self.refspl = UnivariateSpline(refdata["x"], refdata["y"], s=0)
+        self.yspl = self._load_spectral_table(join(dirpath, "all_edges.npz"))
+        self.refspl = self._load_spectral_table(join(dirpath, "all_ref.npz"))
+
+    def _load_spectral_table(self, path):
+        if self.model_cache is not None:
+            return self.model_cache.spectral_table(
+                path, self.energy_resolution, self.spectral_tolerance
+            )
+        data = np.load(path)
+        return SpectralTable.from_samples(
+            data["x"],
+            data["y"],
+            resolution=self.energy_resolution,
+            tolerance=self.spectral_tolerance,
+        )
+
+    def sample_table(self, sample):
+        """
+        Spectral table of ``sample``: its entry in the spectral database,
+        else the ``spectrum`` file in its metadata, else the default sample
+        spectrum. Relative ``spectrum`` paths from the device config are
+        taken relative to ``config_dir``.
+        """
+        if sample is None or self.primary_manipulator is None:
+            return self.yspl
+        if self.spectral_db is not None and sample in self.spectral_db:
+            return self.spectral_db.table(sample)
+        table = self._sample_tables.get(sample)
+        if table is None:
+            path = self.primary_manipulator.sample_info(sample).get("spectrum")
+            if path is None:
+                table = self.yspl
+            else:
+                if self.config_dir is not None:
+                    path = join(self.config_dir, path)
+                table = self._load_spectral_table(path)
+            self._sample_tables[sample] = table
+        return table
+
+    def resolved(self, table):
+        """``table`` broadened by the resolution of the mono's grating and cff."""
+        if getattr(self.energy, "resolution", None) is None:
+            return table
+        setting = self.energy.mono_setting()
+        resolving_power = self.energy.resolving_power(setting)
+        if resolving_power is None:
+            return table
+        return self._broadened.table(table, setting, resolving_power)
 
     def add_to_transmission(self, device):
         self.transmission_list.append(device)
+        if hasattr(device, "subscribe_transmission"):
+            self.transmission_product.add(device)
+            device.subscribe_transmission(
+                partial(self.transmission_product.update, device)
+            )
+        else:
+            self._polled_transmission.append(device)
+
+    def transmission_func(self):
+        transmission = self.transmission_product.value
+        for trans_dev in self._polled_transmission:
+            transmission *= trans_dev.transmission.value
+        return transmission
 
-    def current_func(self):
-        t = time.monotonic() % (300)
+    def current_func(self, now=None):
+        if now is None:
+            now = self.clock.monotonic()
+        t = now % (300)
         if t < 270:
             current = 500 - 50 * t / 270
         else:
             current = 500 - 50 * (300 - t) / 30
         return current
 
+    def current_trace(self, times):
+        """Vectorized ``current_func`` over an array of monotonic times."""
+        t = np.mod(times, 300)
+        return np.where(t < 270, 500 - 50 * t / 270, 500 - 50 * (300 - t) / 30)
+
     def intensity_func(self, position=-1):
-        base = self.current_func()
-        for trans_dev in self.transmission_list:
-            base *= trans_dev.transmission.value
-        return base
+        return self.current_func() * self.transmission_func()
 
-    def distance_func(self, transmission=False):
+    def beam_distance(self):
         if self.primary_manipulator is not None:
-            dist = self.primary_manipulator.distance_to_beam()
+            return self.primary_manipulator.distance_to_beam()
         else:
-            dist = 0
+            return 0
+
+    def beam_target(self):
+        """Distance from the beam to the sample holder, and the sample hit."""
+        if hasattr(self.primary_manipulator, "beam_target"):
+            return self.primary_manipulator.beam_target()
+        return self.beam_distance(), None
+
+    def undulator_factor(self):
+        """Relative undulator flux at the mono energy, 1 without an EPU model."""
+        if hasattr(self.energy, "flux_factor"):
+            return self.energy.flux_factor()
+        return 1.0
+
+    def distance_func(self, transmission=False, dist=None):
+        if dist is None:
+            dist = self.beam_distance()
         if transmission:
             sgn = 1
         else:
@@ -73,6 +426,84 @@ class Beamline(BeamlineModel, PVGroup):
         intensity = norm_erf(sgn * dist, 1)
         return intensity
 
+    def beam_state(self):
+        """
+        Return the beam state for the current tick, computing it at most once
+        per ``tick_period`` or when a transmission device has changed.
+        """
+        now = self.clock.monotonic()
+        tick = int(now // self.tick_period)
+        state = self._beam_state
+        if (
+            state is None
+            or state.tick != tick
+            or state.generation != self.transmission_product.generation
+        ):
+            state = self.compute_beam_state(now, tick)
+            self._beam_state = state
+        return state
+
+    def compute_beam_state(self, now, tick=None):
+        if tick is None:
+            tick = int(now // self.tick_period)
+        if self.energy is not None:
+            energy = self.energy.value
+        else:
+            energy = 0.0
+        dist, sample = self.beam_target()
+        return BeamState(
+            tick=tick,
+            generation=self.transmission_product.generation,
+            timestamp=now,
+            current=self.current_func(now),
+            transmission=self.transmission_func(),
+            energy=energy,
+            sample_overlap=self.distance_func(transmission=False, dist=dist),
+            transmitted_overlap=self.distance_func(transmission=True, dist=dist),
+            sample_yield=self.resolved(self.sample_table(sample))(energy),
+            reference_yield=self.resolved(self.refspl)(energy),
+            sample=sample,
+            undulator=self.undulator_factor(),
+        )
+
+    def beam_trace(self, times, energy=None):
+        """
+        Beam state along an array of simulation-clock times.
+
+        Returns a BeamState whose current, energy, spectral and undulator
+        fields are arrays over ``times``, with the spectra evaluated in one
+        batch. The transmission, sample and overlaps are taken from the
+        current state.
+        ``energy`` defaults to the energy trajectory of the mono.
+        """
+        times = np.asarray(times, dtype=float)
+        state = self.beam_state()
+        sample_table = self.resolved(self.sample_table(state.sample))
+        if energy is None:
+            if hasattr(self.energy, "energy_at"):
+                energy = self.energy.energy_at(times)
+            else:
+                energy = np.full(times.shape, state.energy)
+        return state._replace(
+            timestamp=times,
+            current=self.current_trace(times),
+            energy=energy,
+            sample_yield=sample_table.evaluate(energy),
+            reference_yield=self.resolved(self.refspl).evaluate(energy),
+            undulator=(
+                self.energy.flux_trace(energy)
+                if hasattr(self.energy, "flux_trace")
+                else state.undulator
+            ),
+        )
+
+    async def record_fly(self, times, energies):
+        """Have every detector record its arrays along a mono fly."""
+        trace = self.beam_trace(times, energies)
+        for device in self.detectors.values():
+            if hasattr(device, "record_fly"):
+                await device.record_fly(trace)
+
     def configure_beamline(self):
         self.configure_gatevalves()
         self.configure_shutters()
@@ -122,8 +553,66 @@ def main(argv=None):
         required=False,
         help="Location of simulation file. Required if --startup-dir is not provided.",
     )
+    parser.add_argument(
+        "--tick-period",
+        type=float,
+        default=0.05,
+        help="Period in seconds over which detectors share one beam-state snapshot.",
+    )
+    parser.add_argument(
+        "--energy-resolution",
+        type=float,
+        default=0.05,
+        help="Initial grid spacing (eV) of the tabulated spectral lookup tables.",
+    )
+    parser.add_argument(
+        "--spectral-tolerance",
+        type=float,
+        default=1e-4,
+        help="Maximum interpolation error of the spectral lookup tables.",
+    )
+    parser.add_argument(
+        "--cache-dir",
+        help="Directory for cached spectral models and device configs. "
+        "Defaults to $NBS_SIM_CACHE or ~/.cache/nbs-sim.",
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Fit spectral models and resolve the device config from scratch.",
+    )
+    parser.add_argument(
+        "--spectral-db",
+        help="Directory of a per-sample spectral database "
+        "(see python -m nbs_sim.spectral_db).",
+    )
+    parser.add_argument(
+        "--time-scale",
+        type=float,
+        default=1.0,
+        help="Simulated seconds per real second, to run plans faster than real time.",
+    )
+    parser.add_argument(
+        "--shards",
+        type=int,
+        default=1,
+        help="Number of IOC processes to split the devices over. Beam inputs "
+        "are shared between them through shared memory.",
+    )
+    parser.add_argument(
+        "--seed",
+        type=int,
+        help="Seed for all simulated noise, for reproducible runs.",
+    )
+    parser.add_argument(
+        "--startup-profile",
+        action="store_true",
+        help="Print the time spent in each startup phase before serving PVs.",
+    )
     args = parser.parse_args()
     ioc_options, run_options = split_args(args)
+    profile = StartupProfile()
+    profile.add("imports", IMPORT_TIME)
 
     # Validate that either startup-dir or both device-file and config-file are provided
     if args.startup_dir:
@@ -137,10 +626,97 @@ def main(argv=None):
             "Either --startup-dir or both --device-file and --config-file must be provided"
         )
 
-    config = generate_device_config(device_file, config_file)
-    ioc = Beamline(config=config, **ioc_options)
+    with open(config_file, "rb") as f:
+        sim_conf = tomllib.load(f)
+    scan_config = sim_conf.get("scan")
+
+    model_cache = None if args.no_cache else ModelCache(args.cache_dir)
+    with profile.phase("config resolution"):
+        if model_cache is not None:
+            config = model_cache.device_config(
+                device_file,
+                config_file,
+                generate_device_config,
+                extra=(_nbs_core_version(),),
+            )
+        else:
+            config = generate_device_config(device_file, config_file)
+    options = dict(
+        tick_period=args.tick_period,
+        energy_resolution=args.energy_resolution,
+        spectral_tolerance=args.spectral_tolerance,
+        model_cache=model_cache,
+        spectral_db=args.spectral_db,
+        scan_config=scan_config,
+        deferred_groups=sim_conf.get("loading", {}).get("deferred_groups", ()),
+        config_dir=dirname(abspath(device_file)),
+        seed=args.seed,
+        **ioc_options,
+    )
+    clock = SimClock(time_scale=args.time_scale)
+    shard = None
+    shared = None
+    workers = []
+    try:
+        if args.shards > 1:
+            from .shard import (
+                SharedBeamInputs,
+                ShardLink,
+                exit_on_signals,
+                partition_config,
+                start_workers,
+            )
+
+            exit_on_signals()
+
+            shard_configs = partition_config(
+                config, args.shards, sim_conf.get("shards")
+            )
+            shared = SharedBeamInputs(args.shards)
+            shard = ShardLink(shared, 0, config, shard_configs)
+            workers = start_workers(
+                shared,
+                config,
+                shard_configs,
+                dict(
+                    options,
+                    time_scale=args.time_scale,
+                    clock_origin=clock.origin,
+                    run_options=run_options,
+                ),
+            )
+            config = shard_configs[0]
+        ioc = Beamline(
+            config=config,
+            startup_profile=profile,
+            clock=clock,
+            shard=shard,
+            **options,
+        )
+        if args.startup_profile:
+            profile.report()
+            print(f"  {len(ioc.pvdb)} PVs")
+            if model_cache is not None:
+                print(
+                    f"  model cache {model_cache.directory}: "
+                    f"{model_cache.hits} hits, {model_cache.misses} misses"
+                )
+
+        run(ioc.pvdb, **run_options)
+    finally:
+        for worker in workers:
+            worker.terminate()
+        if shared is not None:
+            shared.close()
+
+
+def _nbs_core_version():
+    from importlib.metadata import version, PackageNotFoundError
 
-    run(ioc.pvdb, **run_options)
+    try:
+        return version("nbs-core")
+    except PackageNotFoundError:
+        return None
 
 
 if __name__ == "__main__":
@@ -0,0 +1,146 @@
+"""
+Microbenchmarks for the simulation hot paths.
+
+Run with ``python -m nbs_sim.bench <name>``.
+"""
+
+import argparse
+import timeit
+from os.path import join, dirname
+
+import numpy as np
+
+
+def _best_time(stmt, number, repeat=5):
+    return min(timeit.repeat(stmt, number=number, repeat=repeat)) / number
+
+
+def bench_spectral(resolution=0.05, tolerance=1e-4, npoints=10000):
+    """Compare UnivariateSpline evaluation with the tabulated SpectralTable."""
+    from scipy.interpolate import UnivariateSpline
+    from .spectral import SpectralTable
+
+    data = np.load(join(dirname(__file__), "all_edges.npz"))
+    x, y = data["x"], data["y"]
+    spline = UnivariateSpline(x, y, s=0)
+    table = SpectralTable.from_samples(
+        x, y, resolution=resolution, tolerance=tolerance
+    )
+    energy = 0.5 * (x[0] + x[-1]) + 0.0123
+    trajectory = np.linspace(x[0], x[-1], npoints)
+
+    results = {
+        "spline scalar": _best_time(lambda: spline(energy), 10000),
+        "table scalar": _best_time(lambda: table(energy), 10000),
+        f"spline batch[{npoints}]": _best_time(lambda: spline(trajectory), 100),
+        f"table batch[{npoints}]": _best_time(lambda: table(trajectory), 100),
+    }
+    err = np.max(np.abs(spline(trajectory) - table(trajectory)))
+    print(
+        f"SpectralTable: {len(table.values)} points, step {table.step:g} eV, "
+        f"midpoint error {table.max_error:.2e}, trajectory error {err:.2e}"
+    )
+    for name, t in results.items():
+        print(f"{name:>24}: {t * 1e6:10.3f} us")
+    return results
+
+
+def bench_mca(nbins=None, llim=200.0, ulim=1000.0, energy=550.0, scale=500.0):
+    """Frames per second of the MCA spectrum generation at MAXBINS."""
+    from scipy.stats import poisson, norm
+    from .devices.caproto_mca import MCASIM
+    from .devices.spectrum import SpectrumEngine
+
+    if nbins is None:
+        nbins = MCASIM.MAXBINS
+    engine = SpectrumEngine(llim, ulim, nbins, seed=0)
+    centers = engine.centers
+
+    def scipy_frame():
+        counts = poisson.rvs(scale * norm.pdf(centers, loc=energy, scale=1.5))
+        counts += poisson.rvs(
+            0.1 * scale * norm.pdf(centers, loc=energy - 100, scale=1.5)
+        )
+        return counts
+
+    reference = scale * (
+        norm.pdf(centers, loc=energy, scale=1.5)
+        + 0.1 * norm.pdf(centers, loc=energy - 100, scale=1.5)
+    )
+    err = np.max(np.abs(engine.template(energy) * scale - reference))
+    results = {
+        "scipy frame": _best_time(scipy_frame, 50),
+        "engine frame": _best_time(lambda: engine.generate(energy, scale), 500),
+        "engine frame, moving energy": _best_time(
+            lambda: engine.generate(energy + np.random.random(), scale), 500
+        ),
+    }
+    print(f"{nbins} bins, max rate error vs scipy {err:.2e}")
+    for name, t in results.items():
+        print(f"{name:>28}: {t * 1e6:10.1f} us  {1 / t:10.0f} frames/s")
+    return results
+
+
+def bench_geometry(npositions=10000, seed=0):
+    """Compare per-Panel distance_to_beam with the vectorized FaceGeometry."""
+    from .devices.manipulator import Manipulator
+
+    panels = Manipulator.geometry
+    faces = Manipulator.faces
+    rng = np.random.default_rng(seed)
+    positions = np.column_stack(
+        [
+            rng.uniform(-40, 40, npositions),
+            np.zeros(npositions),
+            rng.uniform(-80, 300, npositions),
+            rng.uniform(-180, 180, npositions),
+        ]
+    )
+    position = positions[0]
+
+    def panels_batch():
+        return [min(p.distance_to_beam(*pos) for p in panels) for pos in positions]
+
+    reference = np.array(panels_batch())
+    err = np.max(np.abs(faces.batch_distance_to_beam(positions) - reference))
+    results = {
+        "panels scalar": _best_time(
+            lambda: min(p.distance_to_beam(*position) for p in panels), 1000
+        ),
+        "faces scalar": _best_time(lambda: faces.distance_to_beam(*position), 1000),
+        f"panels batch[{npositions}]": _best_time(panels_batch, 1, repeat=1),
+        f"faces batch[{npositions}]": _best_time(
+            lambda: faces.batch_distance_to_beam(positions), 10
+        ),
+    }
+    print(f"{len(faces)} faces, max error vs nbs_bl {err:.2e}")
+    for name, t in results.items():
+        print(f"{name:>24}: {t * 1e6:12.1f} us")
+    return results
+
+
+BENCHMARKS = {
+    "spectral": bench_spectral,
+    "mca": bench_mca,
+    "geometry": bench_geometry,
+}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="nbs-sim microbenchmarks")
+    parser.add_argument(
+        "names",
+        nargs="*",
+        help=f"Benchmarks to run (default: all of {', '.join(BENCHMARKS)})",
+    )
+    args = parser.parse_args(argv)
+    for name in args.names:
+        if name not in BENCHMARKS:
+            parser.error(f"Unknown benchmark {name!r}")
+    for name in args.names or BENCHMARKS:
+        print(f"== {name} ==")
+        BENCHMARKS[name]()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+import hashlib
+import json
+import os
+import pickle
+from os.path import join, exists, expanduser
+
+import numpy as np
+
+from .spectral import SpectralTable
+
+# Bump when the layout of cached entries or the way they are computed changes.
+CACHE_VERSION = 2
+
+
+def default_cache_dir():
+    return os.environ.get(
+        "NBS_SIM_CACHE", join(expanduser("~"), ".cache", "nbs-sim")
+    )
+
+
+def file_digest(*paths, extra=()):
+    """
+    Hash the contents of ``paths`` together with any ``extra`` parameters.
+    """
+    h = hashlib.sha256()
+    h.update(str(CACHE_VERSION).encode())
+    for path in paths:
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                h.update(chunk)
+    for item in extra:
+        h.update(repr(item).encode())
+    return h.hexdigest()[:32]
+
+
+class ModelCache:
+    """
+    On-disk cache for fitted spectral models and resolved device configs.
+
+    Entries are keyed by a hash of their input files and build parameters,
+    so editing an input simply misses the cache. Spectral tables are stored
+    as ``.npy`` arrays and loaded with a read-only memory map. Configs are
+    pickled, so tuples and non-string keys come back as they went in.
+
+    Parameters
+    ----------
+    directory : str, optional
+        Cache location. Defaults to ``$NBS_SIM_CACHE`` or ``~/.cache/nbs-sim``.
+    """
+
+    def __init__(self, directory=None):
+        if directory is None:
+            directory = default_cache_dir()
+        self.directory = directory
+        self.hits = 0
+        self.misses = 0
+
+    def _path(self, key, suffix):
+        return join(self.directory, f"{key}{suffix}")
+
+    def _write_atomic(self, path, write):
+        os.makedirs(self.directory, exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            write(f)
+        os.replace(tmp, path)
+
+    def spectral_table(self, path, resolution, tolerance):
+        """
+        Load the tabulated spectrum for the ``.npz`` file at ``path``,
+        fitting and storing it on a cache miss.
+        """
+        key = "spectral-" + file_digest(path, extra=(resolution, tolerance))
+        meta_path = self._path(key, ".json")
+        values_path = self._path(key, ".npy")
+        if exists(meta_path) and exists(values_path):
+            with open(meta_path) as f:
+                meta = json.load(f)
+            values = np.load(values_path, mmap_mode="r")
+            self.hits += 1
+            return SpectralTable(
+                meta["x0"], meta["step"], values, max_error=meta["max_error"]
+            )
+        self.misses += 1
+        data = np.load(path)
+        table = SpectralTable.from_samples(
+            data["x"], data["y"], resolution=resolution, tolerance=tolerance
+        )
+        meta = {"x0": table.x0, "step": table.step, "max_error": table.max_error}
+        self._write_atomic(values_path, lambda f: np.save(f, table.values))
+        self._write_atomic(meta_path, lambda f: f.write(json.dumps(meta).encode()))
+        return table
+
+    def device_config(self, device_file, config_file, generate, extra=()):
+        """
+        Return ``generate(device_file, config_file)``, cached on the contents
+        of both files and ``extra``. Configs that cannot be pickled are not
+        cached.
+        """
+        key = "config-" + file_digest(device_file, config_file, extra=extra)
+        path = self._path(key, ".pkl")
+        if exists(path):
+            with open(path, "rb") as f:
+                self.hits += 1
+                return pickle.load(f)
+        self.misses += 1
+        config = generate(device_file, config_file)
+        try:
+            data = pickle.dumps(config, protocol=pickle.HIGHEST_PROTOCOL)
+        except (pickle.PicklingError, TypeError, AttributeError):
+            return config
+        self._write_atomic(path, lambda f: f.write(data))
+        return config
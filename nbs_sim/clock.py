@@ -0,0 +1,146 @@
+"""
+Simulation time.
+
+Devices read the time and sleep through the ``SimClock`` of their beamline
+instead of ``time`` and ``asyncio``, so the whole simulation can run faster
+than real time, or be stepped explicitly.
+
+- In scaled mode simulation time runs ``time_scale`` times faster than the
+  monotonic clock, and sleeps are shortened to match.
+- In stepped mode time stands still until ``advance`` is awaited, which
+  wakes every sleeper whose deadline has passed in deadline order.
+
+Both modes start at the current ``time.monotonic()`` unless given a
+``start``, and ``time()`` is the matching posix time, so by default with
+``time_scale=1`` the clock is the real one.
+"""
+
+import asyncio
+import heapq
+import itertools
+import time
+
+
+class SimClock:
+    """
+    Parameters
+    ----------
+    time_scale : float
+        Simulated seconds per real second in scaled mode.
+    stepped : bool
+        Advance only through ``advance``.
+    start : float, optional
+        Initial ``monotonic()`` value, for runs that must not depend on when
+        they were started.
+    real_origin : float, optional
+        The ``time.monotonic()`` at which simulation time was ``start``, so
+        that clocks in several processes can share one time base.
+    settle_iterations : int
+        Event loop iterations ``advance`` yields after waking sleepers, so
+        that woken tasks run until they block again before time moves on.
+    """
+
+    def __init__(
+        self,
+        time_scale=1.0,
+        stepped=False,
+        start=None,
+        real_origin=None,
+        settle_iterations=20,
+    ):
+        if time_scale <= 0:
+            raise ValueError(f"time_scale must be positive, got {time_scale}")
+        self.time_scale = time_scale
+        self.stepped = stepped
+        self.settle_iterations = settle_iterations
+        if real_origin is None:
+            real_origin = time.monotonic()
+        self._real_origin = real_origin
+        self._origin = real_origin if start is None else start
+        self.epoch_offset = time.time() - time.monotonic() + real_origin - self._origin
+        self._real_time = self._origin == real_origin and time_scale == 1.0
+        self._now = self._origin
+        self._sleepers = []
+        self._counter = itertools.count()
+
+    def monotonic(self):
+        if self.stepped:
+            return self._now
+        if self._real_time:
+            return time.monotonic()
+        return self._origin + self.time_scale * (time.monotonic() - self._real_origin)
+
+    def time(self):
+        """Posix time matching ``monotonic()``."""
+        return self.monotonic() + self.epoch_offset
+
+    @property
+    def origin(self):
+        """``(start, real_origin)``, to build matching clocks elsewhere."""
+        return self._origin, self._real_origin
+
+    async def sleep(self, delay):
+        if delay <= 0:
+            await asyncio.sleep(0)
+            return
+        if not self.stepped:
+            await asyncio.sleep(delay / self.time_scale)
+            return
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._sleepers, (self._now + delay, next(self._counter), future))
+        await future
+
+    async def wait_for(self, awaitable, timeout):
+        """``asyncio.wait_for`` with ``timeout`` in simulation seconds."""
+        if not self.stepped:
+            return await asyncio.wait_for(awaitable, timeout / self.time_scale)
+        task = asyncio.ensure_future(awaitable)
+        timer = asyncio.ensure_future(self.sleep(timeout))
+        try:
+            await asyncio.wait((task, timer), return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            timer.cancel()
+        if task.done():
+            return task.result()
+        task.cancel()
+        raise asyncio.TimeoutError
+
+    async def settle(self):
+        for _ in range(self.settle_iterations):
+            await asyncio.sleep(0)
+
+    async def advance(self, dt):
+        """Move stepped time forward by ``dt``, running every task due."""
+        if not self.stepped:
+            raise RuntimeError("advance() requires a stepped clock")
+        target = self._now + dt
+        await self.settle()
+        while self._sleepers and self._sleepers[0][0] <= target:
+            deadline = self._sleepers[0][0]
+            self._now = max(self._now, deadline)
+            while self._sleepers and self._sleepers[0][0] <= deadline:
+                _, _, future = heapq.heappop(self._sleepers)
+                if not future.done():
+                    future.set_result(None)
+            await self.settle()
+        self._now = target
+        await self.settle()
+
+    def next_deadline(self):
+        """The earliest pending sleep deadline in stepped mode, or None."""
+        while self._sleepers and self._sleepers[0][2].done():
+            heapq.heappop(self._sleepers)
+        return self._sleepers[0][0] if self._sleepers else None
+
+
+default_clock = SimClock()
+
+
+def clock_of(parent):
+    """The SimClock of the nearest ancestor that has one, else the real clock."""
+    while parent is not None:
+        clock = getattr(parent, "clock", None)
+        if isinstance(clock, SimClock):
+            return clock
+        parent = getattr(parent, "parent", None)
+    return default_clock
@@ -0,0 +1,45 @@
+import asyncio
+
+from ..clock import clock_of
+
+
+async def acquisition_loop(device, acquire_frame):
+    """
+    Produce one frame per COUNT_TIME while ``device.ACQUIRE`` is non-zero.
+
+    ``device`` provides ACQUIRE and COUNT_TIME PVs, an ``asyncio.Event``
+    ``_acquire_changed`` set whenever either is written, and ``_start_ts``,
+    the simulation-clock start of the current frame.
+    ``await acquire_frame(start, end)`` is called at the end of each frame.
+    A positive ACQUIRE counts down the remaining frames; a negative one
+    acquires until it is set to zero.
+
+    The loop sleeps until the exact frame deadline, or until ACQUIRE or
+    COUNT_TIME is written, and does not wake at all while idle.
+    """
+    clock = clock_of(device)
+    while True:
+        device._acquire_changed.clear()
+        if device.ACQUIRE.value == 0:
+            await device._acquire_changed.wait()
+            continue
+        deadline = device._start_ts + device.COUNT_TIME.value
+        timeout = deadline - clock.monotonic()
+        if timeout > 0:
+            try:
+                await clock.wait_for(device._acquire_changed.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+            else:
+                continue
+
+        await acquire_frame(device._start_ts, deadline)
+        # Schedule from the deadline rather than from now so that frame
+        # times do not drift, unless we have fallen a whole frame behind.
+        now = clock.monotonic()
+        if now - deadline > device.COUNT_TIME.value:
+            device._start_ts = now
+        else:
+            device._start_ts = deadline
+        if device.ACQUIRE.value > 0:
+            await device.ACQUIRE.write(device.ACQUIRE.value - 1, verify_value=False)
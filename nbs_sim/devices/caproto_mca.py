@@ -8,71 +8,198 @@ export EPICS_CA_ADDR_LIST=10.66.51.255
 from caproto.server import PVGroup, ioc_arg_parser, pvproperty, run
 from caproto import ChannelType
 import asyncio
+from functools import lru_cache
 import zmq.asyncio
 import zmq
 from textwrap import dedent
-import time
 import json
 import numpy as np
 import pickle
 from os.path import exists
-from scipy.stats import poisson, norm
+from .spectrum import SpectrumEngine, PixelArrayEngine
+from .rois import make_roi_bank
+from .acquisition import acquisition_loop
+from ..noise import noise_stream
+from ..clock import clock_of
+from .pulses import (
+    PulseStreamPublisher,
+    convert_to_energy,
+    decode_msg,
+    default_calibration,
+    histogram_uniform,
+    load_cal_file,
+)
+
+# Wire types for the selectable waveform dtypes. Channel Access has no
+# unsigned 16-bit type, so compact counts are signed and clipped.
+COUNTS_DTYPES = {"int32": ChannelType.LONG, "int16": ChannelType.INT}
+CENTERS_DTYPES = {"float64": ChannelType.DOUBLE, "float32": ChannelType.FLOAT}
+
+
+@lru_cache(maxsize=None)
+def _waveform_variant(cls, counts_dtype, centers_dtype):
+    """
+    Return a subclass of ``cls`` whose waveforms use the given dtypes.
+
+    The waveform pvproperties are copied with a new channel type, so their
+    putter and startup hooks carry over unchanged.
+    """
+    attrs = {}
+    for names, dtype, channel_type in (
+        (cls.count_waveforms, counts_dtype, COUNTS_DTYPES[counts_dtype]),
+        (cls.center_waveforms, centers_dtype, CENTERS_DTYPES[centers_dtype]),
+    ):
+        for name in names:
+            pvspec = getattr(cls, name).pvspec
+            attrs[name] = pvproperty.from_pvspec(
+                pvspec._replace(
+                    dtype=channel_type, value=np.asarray(pvspec.value, dtype=dtype)
+                )
+            )
+    return type(f"{cls.__name__}_{counts_dtype}_{centers_dtype}", (cls,), attrs)
 
 
 class MCASIM(PVGroup):
     """
     A class to read ZMQ pulse info from TES
+
+    SPECTRUM and CENTERS are variable-length waveforms holding NBINS
+    elements (up to MAXBINS), so each update only carries the real
+    spectrum. ``counts_dtype`` ("int32" or "int16") and ``centers_dtype``
+    ("float64" or "float32") select the wire types of the waveforms.
     """
 
     MAXBINS = 10000
     DEFAULT_LLIM = 200
     DEFAULT_ULIM = 1000
     DEFAULT_NBINS = 800
+    count_waveforms = ("SPECTRUM", "FLY_COUNTS")
+    center_waveforms = ("CENTERS",)
     COUNTS = pvproperty(value=0, record="ai", dtype=int, doc="ROI Counts")
     SPECTRUM = pvproperty(
-        value=np.zeros(MAXBINS, dtype=int), dtype=int, doc="ROI Histogram"
+        value=np.zeros(DEFAULT_NBINS, dtype=np.int32),
+        dtype=ChannelType.LONG,
+        max_length=MAXBINS,
+        doc="ROI Histogram",
     )
     LLIM = pvproperty(value=DEFAULT_LLIM, record="ai", doc="ROI lower limit")
     ULIM = pvproperty(value=DEFAULT_ULIM, record="ai", doc="ROI upper limit")
     NBINS = pvproperty(value=DEFAULT_NBINS, record="ai", doc="ROI resolution")
-    CENTERS = pvproperty(value=np.zeros(MAXBINS, dtype=float), dtype=float)
+    CENTERS = pvproperty(
+        value=np.zeros(DEFAULT_NBINS), dtype=ChannelType.DOUBLE, max_length=MAXBINS
+    )
     COUNT_TIME = pvproperty(value=1.0, record="ai", doc="ROI Count Time")
     ACQUIRE = pvproperty(value=0, doc="ACQUIRE")
     LOAD_CAL = pvproperty(value=0)
+    MAXPOINTS = 10000
+    FLY_COUNTS = pvproperty(
+        value=np.zeros(1, dtype=np.int32),
+        dtype=ChannelType.LONG,
+        max_length=MAXPOINTS,
+        read_only=True,
+        doc="Counts per point of the last fly",
+    )
+    FLY_TIMES = pvproperty(
+        value=np.zeros(1),
+        dtype=ChannelType.DOUBLE,
+        max_length=MAXPOINTS,
+        read_only=True,
+        doc="Posix time of each point of the last fly",
+    )
+
+    def __new__(cls, *args, counts_dtype="int32", centers_dtype="float64", **kwargs):
+        for name, options in (
+            (counts_dtype, COUNTS_DTYPES),
+            (centers_dtype, CENTERS_DTYPES),
+        ):
+            if name not in options:
+                raise ValueError(
+                    f"Unsupported waveform dtype {name!r}, expected one of "
+                    f"{sorted(options)}"
+                )
+        if (counts_dtype, centers_dtype) != ("int32", "float64"):
+            cls = _waveform_variant(cls, counts_dtype, centers_dtype)
+        return super().__new__(cls)
 
-    def __init__(self, prefix, *args, parent=None, **kwargs):
-        self._start_ts = time.time()
+    def __init__(
+        self,
+        prefix,
+        *args,
+        seed=None,
+        rois=None,
+        nrois=None,
+        counts_dtype="int32",
+        centers_dtype="float64",
+        parent=None,
+        **kwargs,
+    ):
+        """
+        rois: Initial ROIs, as [llim, ulim] pairs or {name, llim, ulim} tables
+        nrois: Number of ROI slots to serve (defaults to len(rois))
+        counts_dtype: Wire type of the count waveforms, "int32" or "int16"
+        centers_dtype: Wire type of CENTERS, "float64" or "float32"
+        """
+        self._counts_dtype = np.dtype(counts_dtype)
+        self._counts_max = np.iinfo(self._counts_dtype).max
+        self._centers_dtype = np.dtype(centers_dtype)
+        self.clock = clock_of(parent)
+        self._start_ts = self.clock.monotonic()
+        self._acquire_changed = asyncio.Event()
         self._poly_dict = {}
-        self._bins = np.linspace(
-            self.DEFAULT_LLIM, self.DEFAULT_ULIM, self.DEFAULT_NBINS + 1
+        if seed is None:
+            seed = noise_stream(parent, prefix).generator
+        self.engine = SpectrumEngine(
+            self.DEFAULT_LLIM, self.DEFAULT_ULIM, self.DEFAULT_NBINS, seed=seed
         )
         super().__init__(prefix, parent=parent)
+        rois = list(rois or [])
+        if nrois is None:
+            nrois = len(rois)
+        self.roi_bank = None
+        if nrois:
+            self.roi_bank = make_roi_bank(int(nrois))(
+                f"{self.prefix}ROI", rois=rois, parent=self
+            )
+            self.pvdb.update(self.roi_bank.pvdb)
+
+    def _as_counts(self, counts):
+        """Convert ``counts`` to the published dtype, saturating on overflow."""
+        return np.minimum(counts, self._counts_max).astype(self._counts_dtype)
+
+    async def _write_centers(self):
+        await self.CENTERS.write(self.engine.centers.astype(self._centers_dtype))
+
+    async def _set_layout(self, llim, ulim, nbins):
+        if self.engine.set_layout(llim, ulim, nbins):
+            await self._write_centers()
 
     @ACQUIRE.putter
     async def ACQUIRE(self, instance, value):
         if value != 0:
-            self._start_ts = time.time()
+            self._start_ts = self.clock.monotonic()
+        self._acquire_changed.set()
+        return value
+
+    @COUNT_TIME.putter
+    async def COUNT_TIME(self, instance, value):
+        if not value > 0:
+            raise ValueError(f"COUNT_TIME must be positive, got {value}")
+        self._acquire_changed.set()
         return value
 
     @LLIM.putter
     async def LLIM(self, instance, value):
-        self._bins = np.linspace(value, self.ULIM.value, self.NBINS.value + 1)
-        centers = (self._bins[1:] + self._bins[:-1]) * 0.5
-        await self.CENTERS.write(centers)
+        await self._set_layout(value, self.ULIM.value, self.NBINS.value)
 
     @ULIM.putter
     async def ULIM(self, instance, value):
-        self._bins = np.linspace(self.LLIM.value, value, self.NBINS.value + 1)
-        centers = (self._bins[1:] + self._bins[:-1]) * 0.5
-        await self.CENTERS.write(centers)
+        await self._set_layout(self.LLIM.value, value, self.NBINS.value)
 
     @NBINS.putter
     async def NBINS(self, instance, value):
-        if value > self.MAXBINS:
-            value = self.MAXBINS
-        self._bins = np.linspace(self.LLIM.value, self.ULIM.value, value + 1)
-        centers = (self._bins[1:] + self._bins[:-1]) * 0.5
-        await self.CENTERS.write(centers)
+        value = min(int(value), self.MAXBINS)
+        await self._set_layout(self.LLIM.value, self.ULIM.value, value)
+        return value
 
     @LOAD_CAL.putter
     async def LOAD_CAL(self, instance, value):
@@ -82,69 +209,290 @@ class MCASIM(PVGroup):
 
     @CENTERS.startup
     async def CENTERS(self, instance, async_lib):
-        centers = (self._bins[1:] + self._bins[:-1]) * 0.5
-        await self.CENTERS.write(centers)
+        await self._write_centers()
+        if self.roi_bank is not None:
+            await self.roi_bank.write_initial()
+
+    def _acquire_frame(self):
+        state = self.parent.beam_state()
+        return self.engine.generate(
+            state.energy,
+            state.sample_overlap * state.intensity * state.sample_yield,
+        )
+
+    def _spectrum(self, counts):
+        """The summed spectrum of a frame from ``_acquire_frame``."""
+        return counts
+
+    async def _publish_frame(self, counts, spectrum):
+        await self.COUNTS.write(np.sum(spectrum))
+        await self.SPECTRUM.write(self._as_counts(spectrum))
+
+    async def record_fly(self, trace):
+        """
+        Record the total counts between successive points of a fly, for a
+        beam trace from ``Beamline.beam_trace``. The last point counts for
+        as long as the interval before it.
+        """
+        times = trace.timestamp
+        dt = np.diff(times)
+        dt = np.append(dt, dt[-1]) if len(dt) else np.zeros(len(times))
+        scales = trace.sample_overlap * trace.intensity * trace.sample_yield
+        rates = self.engine.expected_counts(trace.energy, scales)
+        counts = self.engine.rng.poisson(rates * dt / self.COUNT_TIME.value)
+        await self.FLY_TIMES.write(times + self.clock.epoch_offset)
+        await self.FLY_COUNTS.write(self._as_counts(counts))
+
+    async def _frame(self, start, end):
+        counts = self._acquire_frame()
+        spectrum = self._spectrum(counts)
+        await self._publish_frame(counts, spectrum)
+        # From the full-precision spectrum: SPECTRUM may have been clipped
+        # to a compact counts dtype.
+        if self.roi_bank is not None:
+            await self.roi_bank.update(spectrum, self.engine.centers)
 
     @ACQUIRE.startup
     async def ACQUIRE(self, instance, async_lib):
-        self._start_ts = time.time()
-
-        while True:
-            if (
-                self.ACQUIRE.value != 0
-                and self._start_ts + self.COUNT_TIME.value < time.time()
-            ):
-                overlap = self.parent.distance_func(transmission=False)
-                energy = self.parent.energy.value
-                intensity = self.parent.intensity_func() * self.parent.yspl(energy)
-                counts = poisson.rvs(
-                    overlap
-                    * intensity
-                    * norm.pdf(self.CENTERS.value, loc=energy, scale=1.5)
-                )
-                counts += poisson.rvs(
-                    0.1
-                    * overlap
-                    * intensity
-                    * norm.pdf(self.CENTERS.value, loc=energy - 100, scale=1.5)
-                )
+        await acquisition_loop(self, self._frame)
+
+
+class MCAArray(MCASIM):
+    """
+    A multi-pixel MCA, such as a TES array, simulated as one device.
+
+    All pixels share the bin layout, and each has its own gain and
+    resolution. Every frame is generated as one ``(npixels, nbins)`` array;
+    SPECTRUM and COUNTS hold the sum over pixels, PIXEL_COUNTS the total of
+    each pixel, and PIXEL_SPECTRUM the spectrum of the pixel selected by
+    PIXEL_SELECT.
+    """
+
+    MAXPIXELS = 1024
+    DEFAULT_NPIXELS = 240
+    count_waveforms = ("SPECTRUM", "FLY_COUNTS", "PIXEL_COUNTS", "PIXEL_SPECTRUM")
+    NPIXELS = pvproperty(value=0, read_only=True, doc="Number of pixels")
+    PIXEL_COUNTS = pvproperty(
+        value=np.zeros(DEFAULT_NPIXELS, dtype=np.int32),
+        dtype=ChannelType.LONG,
+        max_length=MAXPIXELS,
+        doc="Counts per pixel",
+    )
+    PIXEL_SELECT = pvproperty(value=0, doc="Pixel shown in PIXEL_SPECTRUM")
+    PIXEL_SPECTRUM = pvproperty(
+        value=np.zeros(MCASIM.DEFAULT_NBINS, dtype=np.int32),
+        dtype=ChannelType.LONG,
+        max_length=MCASIM.MAXBINS,
+        doc="Selected pixel histogram",
+    )
+    GAINS = pvproperty(
+        value=np.ones(DEFAULT_NPIXELS),
+        dtype=float,
+        max_length=MAXPIXELS,
+        doc="Pixel gains",
+    )
+    WIDTHS = pvproperty(
+        value=np.ones(DEFAULT_NPIXELS),
+        dtype=float,
+        max_length=MAXPIXELS,
+        doc="Pixel resolution (sigma, eV)",
+    )
+
+    def __init__(
+        self,
+        prefix,
+        *args,
+        npixels=DEFAULT_NPIXELS,
+        gains=None,
+        widths=None,
+        gain_spread=0.002,
+        width=1.5,
+        width_spread=0.1,
+        seed=None,
+        parent=None,
+        **kwargs,
+    ):
+        super().__init__(prefix, *args, seed=seed, parent=parent, **kwargs)
+        npixels = min(int(npixels), self.MAXPIXELS)
+        spread = self.engine.rng if seed is None else np.random.default_rng(seed)
+        if gains is None:
+            gains = 1.0 + gain_spread * spread.standard_normal(npixels)
+        if widths is None:
+            widths = width * (1.0 + width_spread * np.abs(spread.standard_normal(npixels)))
+        self.engine = PixelArrayEngine(
+            self.DEFAULT_LLIM,
+            self.DEFAULT_ULIM,
+            self.DEFAULT_NBINS,
+            gains=gains,
+            widths=widths,
+            seed=self.engine.rng,
+        )
+
+    async def _set_pixels(self, gains=None, widths=None):
+        engine = self.engine
+        if gains is None:
+            gains = engine.gains
+        if widths is None:
+            widths = engine.widths
+        self.engine = PixelArrayEngine(
+            *engine.layout, gains=gains, widths=widths, seed=engine.rng
+        )
+
+    @NPIXELS.startup
+    async def NPIXELS(self, instance, async_lib):
+        await instance.write(self.engine.npixels)
+        await self.GAINS.write(self.engine.gains, verify_value=False)
+        await self.WIDTHS.write(self.engine.widths, verify_value=False)
+
+    @GAINS.putter
+    async def GAINS(self, instance, value):
+        value = np.asarray(value, dtype=float)[: self.engine.npixels]
+        if len(value) != self.engine.npixels:
+            raise ValueError(f"Expected {self.engine.npixels} gains")
+        await self._set_pixels(gains=value)
+        return value
+
+    @WIDTHS.putter
+    async def WIDTHS(self, instance, value):
+        value = np.asarray(value, dtype=float)[: self.engine.npixels]
+        if len(value) != self.engine.npixels:
+            raise ValueError(f"Expected {self.engine.npixels} widths")
+        await self._set_pixels(widths=value)
+        return value
+
+    def _spectrum(self, counts):
+        return counts.sum(axis=0)
+
+    async def _publish_frame(self, counts, spectrum):
+        pixel = min(max(int(self.PIXEL_SELECT.value), 0), self.engine.npixels - 1)
+        await self.COUNTS.write(np.sum(spectrum))
+        await self.SPECTRUM.write(self._as_counts(spectrum))
+        await self.PIXEL_COUNTS.write(self._as_counts(counts.sum(axis=1)))
+        await self.PIXEL_SPECTRUM.write(self._as_counts(counts[pixel]))
 
-                await self.COUNTS.write(np.sum(counts))
-                await self.SPECTRUM.write(counts)
-                self._start_ts = time.time()
-                if self.ACQUIRE.value > 0:
-                    await self.ACQUIRE.write(self.ACQUIRE.value - 1)
-            await async_lib.sleep(0.05)
 
+class TESPulseMCA(MCASIM):
     """
-    async def __ainit__(self, async_lib):
-        print('* `__ainit__` startup hook called')
-        if exists(self._cal_file_name):
-            await self.LOAD_CAL.write(1)
-
-        while True:
-            msg = await self.socket.recv_multipart()
-            data = self.decode_msg(msg)
-            if self.ACQUIRE.value != 0:
-                #if data['channum'] == 1:
-                e = self.convert_to_energy(data)
-                self._buffer.append(e)
-
-    def decode_msg(self, msg):
-        summaries = np.frombuffer(msg[0], dtype=self._dt1)
-        return summaries
-
-    def convert_to_energy(self, data):
-        if self._cal_loaded:
-            channum = data['channum'][0]
-            try:
-                return self._poly_dict[channum](data['pulseRMS'][0])
-            except:
-                return -1
-        else:
-            return -1    
+    An MCA that histograms a ZMQ stream of TES pulse records.
+
+    Each received frame is decoded, calibrated per channel and binned into
+    the running SPECTRUM in a few vectorized operations. With
+    ``simulate=True`` the device also runs a PulseStreamPublisher on
+    ``address`` whose lines follow the beam energy, so the full pipeline can
+    be load-tested without hardware. A simulated stream defaults to an
+    in-process address derived from the prefix, so several TES devices do
+    not collide; an external stream needs an explicit ``address``.
     """
 
+    LOAD_CAL = pvproperty(value=0)
+    EVENT_RATE = pvproperty(
+        value=0.0, read_only=True, doc="Received events per second"
+    )
+
+    def __init__(
+        self,
+        prefix,
+        *args,
+        address=None,
+        simulate=True,
+        rate=1e5,
+        nchannels=240,
+        period=0.01,
+        cal_file=None,
+        seed=None,
+        parent=None,
+        **kwargs,
+    ):
+        super().__init__(prefix, *args, seed=seed, parent=parent, **kwargs)
+        if address is None:
+            if not simulate:
+                raise ValueError(
+                    f"{prefix}: an address is required to read an external "
+                    f"pulse stream"
+                )
+            address = f"inproc://nbs-sim-pulses-{prefix}"
+        self._address = address
+        self._cal_file_name = cal_file
+        self._nchannels = nchannels
+        self._coeffs = default_calibration(nchannels)
+        self._histogram = np.zeros(self.engine.nbins, dtype=np.int64)
+        self._events = 0
+        self.publisher = None
+        if simulate:
+            self.publisher = PulseStreamPublisher(
+                address,
+                rate=rate,
+                nchannels=nchannels,
+                period=period,
+                energy_func=self._beam_energy,
+                clock=self.clock,
+                seed=(
+                    seed
+                    if seed is not None
+                    else noise_stream(parent, f"{prefix}PULSES").generator
+                ),
+            )
+
+    def _beam_energy(self):
+        if self.parent is None:
+            return 500.0
+        return self.parent.beam_state().energy
+
+    async def _set_layout(self, llim, ulim, nbins):
+        if self.engine.set_layout(llim, ulim, nbins):
+            self._histogram = np.zeros(self.engine.nbins, dtype=np.int64)
+            await self._write_centers()
+
+    def _acquire_frame(self):
+        counts = self._histogram
+        self._histogram = np.zeros_like(counts)
+        return counts
+
+    def load_cal_file(self, filename):
+        coeffs = load_cal_file(filename)
+        if len(coeffs) < self._nchannels:
+            raise ValueError(
+                f"Calibration {filename} covers {len(coeffs)} channels, "
+                f"expected {self._nchannels}"
+            )
+        self._coeffs = coeffs
+
+    @LOAD_CAL.putter
+    async def LOAD_CAL(self, instance, value):
+        if value != 0 and self._cal_file_name is not None:
+            self.load_cal_file(self._cal_file_name)
+        return value
+
+    @EVENT_RATE.startup
+    async def EVENT_RATE(self, instance, async_lib):
+        if self._cal_file_name is not None and exists(self._cal_file_name):
+            self.load_cal_file(self._cal_file_name)
+        if self.publisher is not None:
+            asyncio.ensure_future(self.publisher.run())
+
+        socket = zmq.asyncio.Context.instance().socket(zmq.SUB)
+        socket.connect(self._address)
+        socket.setsockopt(zmq.SUBSCRIBE, b"")
+        last = self.clock.monotonic()
+        try:
+            while True:
+                msg = await socket.recv_multipart(copy=False)
+                if self.ACQUIRE.value != 0:
+                    data = decode_msg(msg[0].buffer)
+                    energies = convert_to_energy(data, self._coeffs)
+                    llim, ulim, nbins = self.engine.layout
+                    histogram_uniform(
+                        energies, llim, ulim, nbins, out=self._histogram
+                    )
+                    self._events += len(data)
+                now = self.clock.monotonic()
+                if now - last >= 1.0:
+                    await instance.write(self._events / (now - last))
+                    self._events = 0
+                    last = now
+        finally:
+            socket.close(linger=0)
+
 
 if __name__ == "__main__":
     ioc_options, run_options = ioc_arg_parser(
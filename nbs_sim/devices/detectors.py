@@ -1,7 +1,6 @@
 import asyncio
 
 import textwrap
-import time
 
 import numpy as np
 from scipy.special import erf
@@ -16,42 +15,169 @@ from caproto.server import (
 from caproto import ChannelType
 from os.path import join, dirname
 from scipy.interpolate import UnivariateSpline
+from .acquisition import acquisition_loop
+from ..noise import noise_stream
+from ..clock import clock_of
+from ..scheduler import scan_loop, scheduler_of
 
 
 class SSTADCBase(PVGroup):
     Volt = pvproperty(value=0, dtype=float, read_only=True, doc="ADC Value")
     sigma = 0.05
+    scan_period = 0.5
 
     def __init__(self, prefix, kind="sc", parent=None, **kwargs):
         super().__init__(prefix, parent=parent)
         self.kind = kind
+        self.noise = noise_stream(parent, prefix)
+        self.clock = clock_of(parent)
+        self._scan_job = None
+        scheduler = scheduler_of(parent)
+        if scheduler is not None:
+            self._scan_job = scheduler.add(
+                self.Volt, self._scan, self.scan_period, owner=self
+            )
 
-    @Volt.scan(period=0.5)
-    async def Volt(self, instance, async_lib):
+    async def _scan(self):
         value = await self._read()
-        v = np.random.normal(value, self.sigma)
-        await instance.write(value=v)
+        return value + self.sigma * self.noise.standard_normal()
+
+    @Volt.startup
+    async def Volt(self, instance, async_lib):
+        if self._scan_job is None:
+            await scan_loop(instance, self._scan, self.scan_period, self.clock)
 
 
 class DetectorKindMixin:
-    async def _read(self):
+    def _gain(self, state):
+        """Signal per unit beam intensity for this detector kind."""
         if self.kind == "i0":
-            intensity = self.parent.intensity_func()
-            return intensity
+            return 1.0
         elif self.kind == "sc":
-            energy = self.parent.energy.value
-            overlap = self.parent.distance_func(transmission=False)
-            intensity = self.parent.intensity_func() * self.parent.yspl(energy)
-            return intensity * overlap
+            return state.sample_yield * state.sample_overlap
         elif self.kind == "ref":
-            energy = self.parent.energy.value
-            intensity = self.parent.intensity_func() * self.parent.refspl(energy)
-            return intensity
+            return state.reference_yield
         elif self.kind == "i1":
-            overlap = self.parent.distance_func(transmission=True)
-            intensity = self.parent.intensity_func()
-            return intensity * overlap
+            return state.transmitted_overlap
+
+    async def _read(self):
+        state = self.parent.beam_state()
+        return state.intensity * self._gain(state)
 
 
 class SSTADC(SSTADCBase, DetectorKindMixin):
-    pass
+    MAXPOINTS = 10000
+    FLY_VOLT = pvproperty(
+        value=np.zeros(1),
+        dtype=ChannelType.DOUBLE,
+        max_length=MAXPOINTS,
+        read_only=True,
+        doc="ADC value at each point of the last fly",
+    )
+    FLY_TIMES = pvproperty(
+        value=np.zeros(1),
+        dtype=ChannelType.DOUBLE,
+        max_length=MAXPOINTS,
+        read_only=True,
+        doc="Posix time of each point of the last fly",
+    )
+
+    async def record_fly(self, trace):
+        """Record readings along a beam trace from ``Beamline.beam_trace``."""
+        values = trace.intensity * self._gain(trace)
+        values = values + self.noise.normal(0.0, self.sigma, len(trace.timestamp))
+        await self.FLY_TIMES.write(trace.timestamp + self.clock.epoch_offset)
+        await self.FLY_VOLT.write(values)
+
+
+class SSTBufferedADC(SSTADC):
+    """
+    An SSTADC that also runs buffered acquisitions, like an electrometer.
+
+    While ACQUIRE is non-zero, every COUNT_TIME the device publishes a
+    waveform of SAMPLE_RATE * COUNT_TIME readings with their timestamps,
+    along with the MEAN and STD of the buffer. Each buffer is generated in
+    one vectorized pass over ``Beamline.beam_trace``, so it follows the ring
+    current and a flying mono, with one draw of the noise.
+    """
+
+    MAXSAMPLES = 100000
+    SAMPLE_RATE = pvproperty(value=1000.0, doc="Samples per second")
+    COUNT_TIME = pvproperty(value=1.0, doc="Acquisition time (s)")
+    ACQUIRE = pvproperty(value=0, doc="ACQUIRE")
+    NSAMPLES = pvproperty(value=0, read_only=True, doc="Samples per buffer")
+    BUFFER = pvproperty(
+        value=np.zeros(1),
+        dtype=ChannelType.DOUBLE,
+        max_length=MAXSAMPLES,
+        read_only=True,
+        doc="Buffered readings",
+    )
+    TIMESTAMPS = pvproperty(
+        value=np.zeros(1),
+        dtype=ChannelType.DOUBLE,
+        max_length=MAXSAMPLES,
+        read_only=True,
+        doc="Posix time of each buffered reading",
+    )
+    MEAN = pvproperty(value=0.0, read_only=True, doc="Buffer mean")
+    STD = pvproperty(value=0.0, read_only=True, doc="Buffer standard deviation")
+
+    def __init__(self, prefix, kind="sc", parent=None, **kwargs):
+        super().__init__(prefix, kind=kind, parent=parent, **kwargs)
+        self._start_ts = self.clock.monotonic()
+        self._acquire_changed = asyncio.Event()
+
+    def _nsamples(self, sample_rate, count_time):
+        return max(min(int(sample_rate * count_time), self.MAXSAMPLES), 1)
+
+    @property
+    def nsamples(self):
+        return self._nsamples(self.SAMPLE_RATE.value, self.COUNT_TIME.value)
+
+    def acquire_buffer(self, start, end):
+        """
+        Readings and monotonic sample times for an acquisition over
+        [start, end).
+        """
+        n = self.nsamples
+        times = start + (end - start) * np.arange(n) / n
+        trace = self.parent.beam_trace(times)
+        values = trace.intensity * self._gain(trace)
+        values = values + self.noise.normal(0.0, self.sigma, n)
+        return values, times
+
+    async def _frame(self, start, end):
+        values, times = self.acquire_buffer(start, end)
+        await self.TIMESTAMPS.write(times + self.clock.epoch_offset)
+        await self.BUFFER.write(values)
+        await self.MEAN.write(np.mean(values))
+        await self.STD.write(np.std(values))
+
+    @ACQUIRE.putter
+    async def ACQUIRE(self, instance, value):
+        if value != 0:
+            self._start_ts = self.clock.monotonic()
+        self._acquire_changed.set()
+        return value
+
+    @COUNT_TIME.putter
+    async def COUNT_TIME(self, instance, value):
+        if not value > 0:
+            raise ValueError(f"COUNT_TIME must be positive, got {value}")
+        self._acquire_changed.set()
+        await self.NSAMPLES.write(self._nsamples(self.SAMPLE_RATE.value, value))
+        return value
+
+    @SAMPLE_RATE.putter
+    async def SAMPLE_RATE(self, instance, value):
+        await self.NSAMPLES.write(self._nsamples(value, self.COUNT_TIME.value))
+        return value
+
+    @NSAMPLES.startup
+    async def NSAMPLES(self, instance, async_lib):
+        await instance.write(self.nsamples)
+
+    @ACQUIRE.startup
+    async def ACQUIRE(self, instance, async_lib):
+        await acquisition_loop(self, self._frame)
@@ -1,5 +1,7 @@
 import asyncio
 import functools
+
+import numpy as np
 from caproto.server import (
     PVGroup,
     SubGroup,
@@ -8,7 +10,10 @@ from caproto.server import (
     run,
     PvpropertyDouble,
 )
-from caproto.ioc_examples.fake_motor_record import FakeMotor
+from .motors import SimMotor
+from ..undulator import UndulatorModel
+from ..resolution import MonoResolution
+from ..clock import clock_of
 from caproto import ChannelType, SkipWrite
 import contextvars
 
@@ -29,6 +34,24 @@ def no_reentry(func):
     return inner
 
 
+def fly_times(t0, duration, rate, maxpoints):
+    """Readback times of a fly of ``duration`` seconds from ``t0``."""
+    period = 1.0 / rate
+    if duration / period > maxpoints - 2:
+        period = duration / (maxpoints - 2)
+    times = t0 + period * np.arange(int(duration // period) + 1)
+    if times[-1] < t0 + duration:
+        times = np.append(times, t0 + duration)
+    return times
+
+
+def trajectory_energy(trajectory, times):
+    """Energy at ``times`` along a ``(t0, e0, e1, velocity)`` trajectory."""
+    t0, e0, e1, velocity = trajectory
+    energy = e0 + np.copysign(velocity, e1 - e0) * (np.asarray(times) - t0)
+    return np.clip(energy, min(e0, e1), max(e0, e1))
+
+
 class SST1MonoGrating(PVGroup):
     setpoint = pvproperty(
         name="_TYPE_SP",
@@ -66,30 +89,137 @@ class SST1MonoGrating(PVGroup):
     def __init__(self, prefix, delay=0.5, parent=None, **kwargs):
         super().__init__(prefix, parent=parent)
         self._delay = delay
+        self.clock = clock_of(parent)
 
     @actuate.putter
     async def actuate(self, instance, value):
         await self.done.write(0)
-        await asyncio.sleep(self._delay)
+        await self.clock.sleep(self._delay)
         sp = self.setpoint.value
         await self.readback.write(value=sp)
         await self.done.write(1)
 
 
 class SST1MonoMotor(PVGroup):
+    """
+    The mono energy axis.
+
+    In step mode a move waits ``delay`` and then jumps to the setpoint. In
+    fly mode the energy follows a linear trajectory at ENERGY_VELO, the
+    readback is updated FLY_RATE times per second, and when the move ends
+    the readback times and energies are published in FLY_TIMES and
+    FLY_ENERGIES, and the beamline detectors record their own arrays at the
+    same times.
+
+    Subscribers added with ``subscribe_target`` are awaited with the energy
+    the mono is heading to: the setpoint of a step move, and every readback
+    of a fly. ``flights`` counts completed flies and ``last_fly`` holds the
+    trajectory and FLY_RATE of the latest one.
+    """
+
+    MAXPOINTS = 10000
     setpoint = pvproperty(name=":ENERGY_SP", value=500.0)
     readback = pvproperty(name=":ENERGY_MON", value=500.0, read_only=True)
     velocity = pvproperty(name=":ENERGY_VELO", value=200.0)
     done = pvproperty(name=":ERDY_STS")
+    fly_mode = pvproperty(name=":FLY_MODE", value=0, doc="Fly to setpoints")
+    fly_rate = pvproperty(
+        name=":FLY_RATE", value=20.0, doc="Readback updates per second when flying"
+    )
+    fly_times = pvproperty(
+        name=":FLY_TIMES",
+        value=np.zeros(1),
+        dtype=ChannelType.DOUBLE,
+        max_length=MAXPOINTS,
+        read_only=True,
+        doc="Posix time of each readback of the last fly",
+    )
+    fly_energies = pvproperty(
+        name=":FLY_ENERGIES",
+        value=np.zeros(1),
+        dtype=ChannelType.DOUBLE,
+        max_length=MAXPOINTS,
+        read_only=True,
+        doc="Energy of each readback of the last fly",
+    )
 
     def __init__(self, prefix, delay=0.1, parent=None, **kwargs):
         super().__init__(prefix, parent=parent)
         self._delay = delay
+        self.clock = clock_of(parent)
+        self._trajectory = None
+        self._flight = None
+        self._target_callbacks = []
+        self.flights = 0
+        self.last_fly = None
+
+    def subscribe_target(self, callback):
+        self._target_callbacks.append(callback)
+
+    async def _notify_target(self, energy):
+        for callback in self._target_callbacks:
+            await callback(energy)
+
+    @fly_rate.putter
+    async def fly_rate(self, instance, value):
+        if not value > 0:
+            raise ValueError(f"FLY_RATE must be positive, got {value}")
+        return value
+
+    @velocity.putter
+    async def velocity(self, instance, value):
+        if not value > 0:
+            raise ValueError(f"ENERGY_VELO must be positive, got {value}")
+        return value
+
+    def energy_at(self, times):
+        """Mono energy at the simulation-clock times ``times``."""
+        if self._trajectory is None:
+            return np.full(np.shape(times), self.readback.value, dtype=float)
+        return trajectory_energy(self._trajectory, times)
+
+    def _beamline(self):
+        parent = self.parent
+        while parent is not None and not hasattr(parent, "record_fly"):
+            parent = parent.parent
+        return parent
+
+    async def _fly(self, target):
+        await self.done.write(0)
+        start = self.readback.value
+        velocity = self.velocity.value
+        duration = abs(target - start) / velocity
+        t0 = self.clock.monotonic()
+        self._trajectory = (t0, start, target, velocity)
+        rate = self.fly_rate.value
+        times = fly_times(t0, duration, rate, self.MAXPOINTS)
+        for t in times:
+            await self.clock.sleep(t - self.clock.monotonic())
+            energy = float(self.energy_at(t))
+            await self._notify_target(energy)
+            await self.readback.write(energy)
+        energies = self.energy_at(times)
+        await self.fly_times.write(times + self.clock.epoch_offset)
+        await self.fly_energies.write(energies)
+        self.flights += 1
+        self.last_fly = self._trajectory + (rate,)
+        beamline = self._beamline()
+        if beamline is not None:
+            await beamline.record_fly(times, energies)
+        await self.done.write(1)
 
     @setpoint.putter
     async def setpoint(self, instance, value):
+        if self._flight is not None:
+            self._flight.cancel()
+            self._flight = None
+        if self.fly_mode.value:
+            self._flight = asyncio.ensure_future(self._fly(value))
+            return value
+        self._trajectory = None
         await self.done.write(0)
-        await asyncio.sleep(self._delay)
+        await self._notify_target(value)
+        await self.clock.sleep(self._delay)
         await instance.write(value, verify_value=False)
         await self.readback.write(value)
         await self.done.write(1)
@@ -106,14 +236,106 @@ class SST1Mono(PVGroup):
 
 
 class SST1Energy(PVGroup):
+    """
+    The mono and the EPU.
+
+    The EPU is only modelled if ``undulator`` is given, as a (possibly
+    empty) table of keyword arguments for the UndulatorModel, plus an
+    optional ``gap_velocity`` in mm/s (default 50). Without it the gap and
+    phase are plain motors and the beam flux does not depend on them. With
+    it, while TRACKING is on, every energy the mono heads to also moves the
+    gap to the brightest undulator harmonic for that energy and the phase to
+    the one of the polarization mode. The flux factor of the beam follows
+    the gap readback, so it drops while the gap lags behind the mono.
+    Spectra are only broadened by the mono resolution if ``resolution`` is
+    given, as a (possibly empty) table of keyword arguments for the
+    MonoResolution of the grating and cff. Each new grating or cff then
+    costs one convolution per spectrum on the next beam state.
+    """
+
     mono = SubGroup(SST1Mono, prefix="MonoMtr")
-    gap = SubGroup(FakeMotor, prefix="GapMtr", velocity=5000.0, precision=3)
-    phase = SubGroup(FakeMotor, prefix="PhaseMtr", velocity=5000.0, precision=3)
-    mode = SubGroup(FakeMotor, prefix="ModeMtr", velocity=100.0, precision=3)
+    gap = SubGroup(SimMotor, prefix="GapMtr", velocity=5000.0, precision=3)
+    phase = SubGroup(SimMotor, prefix="PhaseMtr", velocity=5000.0, precision=3)
+    mode = SubGroup(SimMotor, prefix="ModeMtr", velocity=100.0, precision=3)
+    tracking = pvproperty(name="TRACKING", value=1, doc="Move the EPU with the mono")
+    harmonic = pvproperty(
+        name="HARMONIC", value=1, read_only=True, doc="Tracked undulator harmonic"
+    )
 
-    def __init__(self, prefix, parent=None, **kwargs):
+    def __init__(self, prefix, parent=None, undulator=None, resolution=None, **kwargs):
         super().__init__(prefix, parent=parent)
+        self.resolution = None
+        if resolution is not None:
+            self.resolution = MonoResolution(**resolution)
+        self.undulator = None
+        if undulator is not None:
+            undulator = dict(undulator)
+            gap_velocity = undulator.pop("gap_velocity", 50.0)
+            self.undulator = UndulatorModel(**undulator)
+            self.gap.defaults.update(velocity=gap_velocity, user_limits=(0.0, 250.0))
+            energy = self.mono.mono.setpoint.value
+            self.gap.initial_position = self.undulator.gap(energy)
+            self.phase.initial_position = self.undulator.phase(self.mode.motor.value)
+            self.mono.mono.subscribe_target(self._track)
 
     @property
     def value(self):
         return self.mono.mono.readback.value
+
+    @property
+    def gap_readback(self):
+        return self.gap.motor.field_inst.user_readback_value.value
+
+    def energy_at(self, times):
+        return self.mono.mono.energy_at(times)
+
+    @property
+    def trajectory(self):
+        """``(t0, e0, e1, velocity)`` of the current fly, or None."""
+        return self.mono.mono._trajectory
+
+    def mono_setting(self):
+        """The grating (lines/mm) and cff the mono is at."""
+        grating = self.mono.gratingx.readback.value
+        return int(grating.partition("l")[0]), self.mono.cff.value
+
+    def resolving_power(self, setting=None):
+        """Resolving power of the mono, or None without a resolution model."""
+        if self.resolution is None:
+            return None
+        if setting is None:
+            setting = self.mono_setting()
+        return self.resolution.resolving_power(*setting)
+
+    def flux_factor(self, energy=None):
+        """Relative undulator flux at ``energy`` for the current gap."""
+        if self.undulator is None:
+            return 1.0
+        if energy is None:
+            energy = self.value
+        return self.undulator.flux_factor(energy, self.gap_readback)
+
+    def flux_trace(self, energies):
+        """Relative undulator flux along a mono trajectory."""
+        if self.undulator is None:
+            return np.ones(np.shape(energies))
+        if self.tracking.value:
+            return self.undulator.tracked_flux.evaluate(energies)
+        return self.undulator.flux_factor(energies, self.gap_readback)
+
+    async def _track(self, energy):
+        if not self.tracking.value:
+            return
+        harmonic = self.undulator.harmonic(energy)
+        if harmonic != self.harmonic.value:
+            await self.harmonic.write(harmonic)
+        await self.gap.motor.write(self.undulator.gap(energy, harmonic))
+        phase = self.undulator.phase(self.mode.motor.value)
+        if phase != self.phase.motor.value:
+            await self.phase.motor.write(phase)
+
+    @harmonic.startup
+    async def harmonic(self, instance, async_lib):
+        if self.undulator is None:
+            return
+        await instance.write(self.undulator.harmonic(self.mono.mono.setpoint.value))
@@ -1,36 +1,83 @@
-from caproto.ioc_examples.fake_motor_record import FakeMotor
+from .motors import SimMotor
 from caproto.server import PVGroup, SubGroup
 from nbs_bl.geometry.frames import make_regular_polygon
 from nbs_bl.geometry.linalg import vec
 import numpy as np
+from ..geometry import FaceGeometry, SampleHolder
 
 
 class Manipulator(PVGroup):
     """
     A fake 4-axis manipulator
+
+    holder: Regular polygonal bar as {width, height, nsides}
+    faces: Explicit holder faces, as lists of corners in the manipulator frame
+    samples: Samples keyed by id, each with a position {side, coordinates}
+    sample_file: nbs_bl sample CSV with more samples
     """
 
-    x = SubGroup(FakeMotor, velocity=2, precision=3, prefix="SampX}}Mtr")
-    y = SubGroup(FakeMotor, velocity=2, precision=3, prefix="SampY}}Mtr")
-    z = SubGroup(FakeMotor, velocity=2, precision=3, prefix="SampZ}}Mtr")
-    r = SubGroup(FakeMotor, velocity=2, precision=3, prefix="SampTh}}Mtr")
+    x = SubGroup(SimMotor, velocity=2, precision=3, prefix="SampX}}Mtr")
+    y = SubGroup(SimMotor, velocity=2, precision=3, prefix="SampY}}Mtr")
+    z = SubGroup(SimMotor, velocity=2, precision=3, prefix="SampZ}}Mtr")
+    r = SubGroup(SimMotor, velocity=2, precision=3, prefix="SampTh}}Mtr")
 
     geometry = make_regular_polygon(24.5, 215, 4)
+    faces = FaceGeometry.from_panels(geometry)
     origin = vec(0, 0, 464, 0)
 
-    def distance_to_beam(self):
-        mp = (
+    def __init__(
+        self,
+        prefix,
+        parent=None,
+        holder=None,
+        faces=None,
+        samples=None,
+        sample_file=None,
+        **kwargs,
+    ):
+        super().__init__(prefix, parent=parent)
+        self.holder = SampleHolder.from_config(
+            holder=holder, faces=faces, samples=samples, sample_file=sample_file
+        )
+        self.faces = self.holder.faces
+        self._target_key = None
+        self._target = None
+
+    def readbacks(self):
+        return (
             self.x.motor.field_inst.user_readback_value.value,
             self.y.motor.field_inst.user_readback_value.value,
             self.z.motor.field_inst.user_readback_value.value,
             self.r.motor.field_inst.user_readback_value.value,
         )
-        beam_pos = tuple(x - ox for x, ox in zip(mp, self.origin))
-        distances = [side.distance_to_beam(*beam_pos) for side in self.geometry]
-        return np.min(distances)
 
-    def __init__(self, prefix, parent=None, **kwargs):
-        super().__init__(prefix, parent=parent)
+    def beam_target(self):
+        """
+        Signed distance from the beam to the nearest face of the holder, and
+        the id of the sample under the beam (or None). The result is cached
+        until one of the readbacks changes.
+        """
+        mp = self.readbacks()
+        if mp != self._target_key:
+            x, y, z, r = (p - o for p, o in zip(mp, self.origin))
+            self._target = self.holder.beam_target(x, y, z, r)
+            self._target_key = mp
+        return self._target
+
+    def distance_to_beam(self):
+        return self.beam_target()[0]
+
+    def sample_info(self, sample):
+        return self.holder.sample_info.get(sample, {})
+
+    def batch_distance_to_beam(self, positions):
+        """
+        Distance to beam for an ``(npositions, 4)`` array of manipulator
+        x, y, z, r positions, e.g. to pre-evaluate an alignment scan.
+        """
+        return self.faces.batch_distance_to_beam(
+            np.asarray(positions, dtype=float) - self.origin
+        )
 
 
 class MultiMesh(PVGroup):
@@ -38,7 +85,7 @@ class MultiMesh(PVGroup):
     A fake 1-axis manipulator
     """
 
-    x = SubGroup(FakeMotor, velocity=10.0, precision=3, prefix="MMesh}}Mtr")
+    x = SubGroup(SimMotor, velocity=10.0, precision=3, prefix="MMesh}}Mtr")
 
     def __init__(self, prefix, parent=None, **kwargs):
         super().__init__(prefix, parent=parent)
@@ -0,0 +1,106 @@
+import asyncio
+
+from caproto.server import pvproperty
+from caproto.ioc_examples.fake_motor_record import (
+    FakeMotor,
+    broadcast_precision_to_fields,
+)
+
+from ..clock import clock_of
+
+
+async def motor_simulator(device, instance, async_lib):
+    """
+    Event-driven version of caproto's ``motor_record_simulator``.
+
+    The loop sleeps until a new position is requested instead of waking at
+    ``tick_rate_hz`` while idle, and reports every readback change to
+    ``device.readback_changed``. The motor starts at
+    ``device.initial_position`` if that is set.
+    """
+    defaults = device.defaults
+    clock = clock_of(device)
+    fields = instance.field_inst
+    new_position = asyncio.Event()
+
+    if device.initial_position is not None:
+        await instance.write(device.initial_position, verify_value=False)
+        await fields.user_readback_value.write(device.initial_position)
+
+    async def value_write_hook(fields, value):
+        new_position.set()
+
+    fields.value_write_hook = value_write_hook
+
+    await instance.write_metadata(precision=defaults["precision"])
+    await broadcast_precision_to_fields(instance)
+
+    await fields.velocity.write(defaults["velocity"])
+    await fields.seconds_to_velocity.write(defaults["acceleration"])
+    await fields.motor_step_size.write(defaults["resolution"])
+    await fields.user_low_limit.write(defaults["user_limits"][0])
+    await fields.user_high_limit.write(defaults["user_limits"][1])
+    await device.readback_changed(fields.user_readback_value.value)
+
+    while True:
+        await new_position.wait()
+        new_position.clear()
+
+        dwell = 1.0 / device.tick_rate_hz
+        target_pos = instance.value
+        diff = target_pos - fields.user_readback_value.value
+        total_time = abs(diff / fields.velocity.value)
+        num_steps = int(total_time // dwell)
+
+        if fields.stop.value != 0:
+            await fields.stop.write(0)
+
+        await fields.done_moving_to_value.write(0)
+        await fields.motor_is_moving.write(1)
+
+        readback = fields.user_readback_value.value
+        step_size = diff / num_steps if num_steps > 0 else 0.0
+        resolution = max((fields.motor_step_size.value, 1e-10))
+
+        for _ in range(num_steps):
+            # Stopping writes the readback back to .VAL, which is not a new
+            # move request.
+            if fields.stop.value != 0:
+                await fields.stop.write(0)
+                await instance.write(readback)
+                new_position.clear()
+                break
+            if fields.stop_pause_move_go.value == "Stop":
+                await instance.write(readback)
+                new_position.clear()
+                break
+
+            readback += step_size
+            await fields.user_readback_value.write(readback)
+            await fields.dial_readback_value.write(readback)
+            await fields.raw_readback_value.write(readback / resolution)
+            await device.readback_changed(readback)
+            await clock.sleep(dwell)
+        else:
+            await fields.user_readback_value.write(target_pos)
+            await device.readback_changed(target_pos)
+
+        await fields.motor_is_moving.write(0)
+        await fields.done_moving_to_value.write(1)
+
+
+class SimMotor(FakeMotor):
+    """
+    A FakeMotor that does not poll while idle and notifies subclasses of
+    readback changes through ``readback_changed``.
+    """
+
+    motor = pvproperty(value=0.0, name="", record="motor", precision=3)
+    initial_position = None
+
+    @motor.startup
+    async def motor(self, instance, async_lib):
+        await motor_simulator(self, instance, async_lib)
+
+    async def readback_changed(self, readback):
+        pass
@@ -0,0 +1,252 @@
+"""
+Simulated TES list-mode pulse stream.
+
+Photons are published over ZMQ as packed binary frames of ``PULSE_DTYPE``
+records, one frame per publishing period. Run a standalone publisher with::
+
+    python -m nbs_sim.devices.pulses --address tcp://*:5556 --rate 1e5
+"""
+
+import argparse
+import asyncio
+import json
+
+import numpy as np
+import zmq
+import zmq.asyncio
+
+from ..clock import default_clock
+
+PULSE_DTYPE = np.dtype(
+    [("channum", "<i4"), ("pulseRMS", "<f4"), ("timestamp", "<f8")]
+)
+
+
+def default_calibration(nchannels):
+    """
+    Deterministic per-channel linear calibration, energy = gain * pulseRMS.
+
+    Returned as polynomial coefficients (highest power first), shape
+    ``(nchannels, 2)``, so publisher and consumer agree without sharing a file.
+    """
+    channels = np.arange(nchannels)
+    gains = 1.0 + 0.05 * np.sin(channels)
+    return np.stack([gains, np.zeros(nchannels)], axis=1)
+
+
+def calibration_from_dict(cal):
+    """
+    Convert ``{channum: [coefficients...]}`` into a coefficient matrix.
+
+    Rows of channels without a calibration are NaN, so their pulses convert
+    to NaN energies and fall out of every histogram.
+    """
+    cal = {int(k): np.atleast_1d(np.asarray(v, dtype=float)) for k, v in cal.items()}
+    if not cal:
+        return np.full((0, 1), np.nan)
+    order = max(len(v) for v in cal.values())
+    coeffs = np.full((max(cal) + 1, order), np.nan)
+    for channum, c in cal.items():
+        coeffs[channum] = 0.0
+        coeffs[channum, order - len(c):] = c
+    return coeffs
+
+
+def load_cal_file(filename):
+    with open(filename) as f:
+        return calibration_from_dict(json.load(f))
+
+
+def encode_pulses(records):
+    return np.ascontiguousarray(records, dtype=PULSE_DTYPE).tobytes()
+
+
+def decode_msg(msg):
+    """Decode a (multipart) ZMQ message into an array of pulse records."""
+    if isinstance(msg, (list, tuple)):
+        msg = msg[0]
+    return np.frombuffer(msg, dtype=PULSE_DTYPE)
+
+
+def convert_to_energy(data, coeffs):
+    """
+    Vectorized per-channel polynomial calibration of ``pulseRMS``.
+
+    Pulses from channels outside the calibration table become NaN.
+    """
+    channum = data["channum"]
+    rms = data["pulseRMS"].astype(float)
+    known = (channum >= 0) & (channum < len(coeffs))
+    rows = coeffs[np.where(known, channum, 0)]
+    energy = np.zeros(len(data))
+    for k in range(coeffs.shape[1]):
+        energy = energy * rms + rows[:, k]
+    energy[~known] = np.nan
+    return energy
+
+
+def histogram_uniform(energies, llim, ulim, nbins, out=None):
+    """
+    Histogram ``energies`` into ``nbins`` uniform bins on [llim, ulim).
+
+    Bin indices are computed arithmetically and counted with ``bincount``,
+    which is much cheaper than ``np.histogram`` for uniform bins. If ``out``
+    is given the counts are added to it.
+    """
+    idx = np.floor((energies - llim) * (nbins / (ulim - llim)))
+    idx = idx[(idx >= 0) & (idx < nbins)].astype(np.intp)
+    counts = np.bincount(idx, minlength=nbins)
+    if out is None:
+        return counts
+    out += counts
+    return out
+
+
+class PulseStreamPublisher:
+    """
+    Publishes simulated per-photon records over a ZMQ PUB socket.
+
+    Parameters
+    ----------
+    address : str
+        ZMQ address to bind, e.g. ``tcp://127.0.0.1:5556``.
+    rate : float
+        Mean photon rate in events/s, summed over all channels.
+    nchannels : int
+        Number of TES channels.
+    period : float
+        Seconds of events per published frame.
+    energy_func : callable, optional
+        Returns the current beam energy; lines are placed relative to it.
+        Defaults to a fixed 500 eV.
+    rate_func : callable, optional
+        Returns a factor applied to ``rate`` for each frame.
+    lines : sequence of (offset, relative_intensity), optional
+        Emission lines relative to the beam energy.
+    width : float
+        Gaussian sigma of each line in eV.
+    background : float
+        Fraction of events drawn uniformly over ``background_range``.
+    calibration : array, optional
+        Per-channel coefficient matrix; must be linear (gain, offset) and
+        have a row for each of the ``nchannels`` channels.
+    seed : int, optional
+        Seed for the event generator.
+    clock : SimClock, optional
+        Clock for frame timing and timestamps; defaults to real time.
+    """
+
+    def __init__(
+        self,
+        address,
+        rate=1e5,
+        nchannels=240,
+        period=0.01,
+        energy_func=None,
+        rate_func=None,
+        lines=((0.0, 1.0), (-100.0, 0.1)),
+        width=1.5,
+        background=0.05,
+        background_range=(200.0, 1000.0),
+        calibration=None,
+        seed=None,
+        context=None,
+        clock=None,
+    ):
+        self.address = address
+        self.rate = rate
+        self.nchannels = nchannels
+        self.period = period
+        self.energy_func = energy_func if energy_func is not None else lambda: 500.0
+        self.rate_func = rate_func
+        offsets, weights = np.asarray(lines, dtype=float).T
+        self._offsets = offsets
+        self._line_cdf = np.cumsum(weights) / np.sum(weights)
+        self.width = width
+        self.background = background
+        self.background_range = background_range
+        if calibration is None:
+            calibration = default_calibration(nchannels)
+        calibration = np.asarray(calibration, dtype=float)
+        if calibration.ndim != 2 or calibration.shape[1] != 2:
+            raise ValueError(
+                f"Calibration must be linear, one (gain, offset) row per "
+                f"channel; got shape {calibration.shape}"
+            )
+        if len(calibration) < nchannels:
+            raise ValueError(
+                f"Calibration covers {len(calibration)} channels, "
+                f"expected {nchannels}"
+            )
+        self._gain = calibration[:nchannels, 0]
+        self._offset = calibration[:nchannels, 1]
+        self.rng = np.random.default_rng(seed)
+        self.context = context
+        self.clock = clock if clock is not None else default_clock
+        self.events_sent = 0
+
+    def generate(self, t0, duration):
+        """Draw the photon records for ``duration`` seconds starting at ``t0``."""
+        rate = self.rate
+        if self.rate_func is not None:
+            rate *= self.rate_func()
+        n = self.rng.poisson(rate * duration)
+        records = np.empty(n, dtype=PULSE_DTYPE)
+        channum = self.rng.integers(self.nchannels, size=n)
+        line = np.searchsorted(self._line_cdf, self.rng.random(n))
+        energy = self.energy_func() + self._offsets[line]
+        energy += self.rng.normal(0.0, self.width, n)
+        nbg = self.rng.binomial(n, self.background)
+        lo, hi = self.background_range
+        energy[:nbg] = self.rng.uniform(lo, hi, nbg)
+        records["channum"] = channum
+        records["pulseRMS"] = (energy - self._offset[channum]) / self._gain[channum]
+        records["timestamp"] = np.sort(t0 + duration * self.rng.random(n))
+        return records
+
+    async def run(self):
+        context = self.context or zmq.asyncio.Context.instance()
+        socket = context.socket(zmq.PUB)
+        socket.bind(self.address)
+        try:
+            clock = self.clock
+            last = clock.time()
+            deadline = clock.monotonic()
+            while True:
+                deadline += self.period
+                await clock.sleep(deadline - clock.monotonic())
+                now = clock.time()
+                records = self.generate(last, now - last)
+                last = now
+                await socket.send(encode_pulses(records), copy=False)
+                self.events_sent += len(records)
+        finally:
+            socket.close(linger=0)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Simulated TES pulse publisher")
+    parser.add_argument("--address", default="tcp://127.0.0.1:5556")
+    parser.add_argument("--rate", type=float, default=1e5, help="events/s")
+    parser.add_argument("--channels", type=int, default=240)
+    parser.add_argument("--period", type=float, default=0.01)
+    parser.add_argument("--energy", type=float, default=500.0)
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args(argv)
+    publisher = PulseStreamPublisher(
+        args.address,
+        rate=args.rate,
+        nchannels=args.channels,
+        period=args.period,
+        energy_func=lambda: args.energy,
+        seed=args.seed,
+    )
+    print(f"Publishing {args.rate:g} events/s on {args.address}")
+    try:
+        asyncio.run(publisher.run())
+    except KeyboardInterrupt:
+        print(f"Sent {publisher.events_sent} events")
+
+
+if __name__ == "__main__":
+    main()
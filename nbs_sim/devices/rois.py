@@ -0,0 +1,101 @@
+from functools import lru_cache
+
+import numpy as np
+from caproto.server import PVGroup, SubGroup, pvproperty
+
+
+class ROI(PVGroup):
+    """One energy window of an ROIBank."""
+
+    NAME = pvproperty(value="", dtype=str, max_length=40, doc="ROI name")
+    LLIM = pvproperty(value=0.0, doc="ROI lower limit")
+    ULIM = pvproperty(value=0.0, doc="ROI upper limit")
+    COUNTS = pvproperty(value=0, dtype=int, read_only=True, doc="ROI Counts")
+
+    def __init__(self, prefix, *, index, parent=None, **kwargs):
+        super().__init__(prefix, parent=parent, **kwargs)
+        self.index = index
+
+    @LLIM.putter
+    async def LLIM(self, instance, value):
+        self.parent.set_limits(self.index, llim=value)
+        return value
+
+    @ULIM.putter
+    async def ULIM(self, instance, value):
+        self.parent.set_limits(self.index, ulim=value)
+        return value
+
+
+class ROIBank(PVGroup):
+    """
+    A bank of ROIs evaluated together from one prefix sum of a spectrum.
+
+    Use ``make_roi_bank`` to get a bank class with a given number of ROIs.
+    Only the COUNTS PVs whose totals changed are written on each update.
+    """
+
+    nrois = 0
+
+    def __init__(self, prefix, rois=(), parent=None, **kwargs):
+        super().__init__(prefix, parent=parent, **kwargs)
+        self.roi_groups = [getattr(self, f"roi{i}") for i in range(self.nrois)]
+        self._llims = np.zeros(self.nrois)
+        self._ulims = np.zeros(self.nrois)
+        self._totals = np.zeros(self.nrois, dtype=np.int64)
+        self._cumsum = None
+        self._index_key = None
+        self._initial = []
+        for i, roi in enumerate(rois[: self.nrois]):
+            if isinstance(roi, dict):
+                name, llim, ulim = roi.get("name", ""), roi["llim"], roi["ulim"]
+            else:
+                llim, ulim = roi
+                name = ""
+            self._llims[i] = llim
+            self._ulims[i] = ulim
+            self._initial.append((self.roi_groups[i], name, llim, ulim))
+
+    async def write_initial(self):
+        for group, name, llim, ulim in self._initial:
+            await group.NAME.write(name)
+            await group.LLIM.write(llim, verify_value=False)
+            await group.ULIM.write(ulim, verify_value=False)
+
+    def set_limits(self, index, llim=None, ulim=None):
+        if llim is not None:
+            self._llims[index] = llim
+        if ulim is not None:
+            self._ulims[index] = ulim
+        self._index_key = None
+
+    def _indices(self, centers):
+        key = (len(centers), centers[0], centers[-1]) if len(centers) else (0,)
+        if self._index_key != key:
+            lo = np.searchsorted(centers, self._llims, side="left")
+            hi = np.searchsorted(centers, self._ulims, side="right")
+            self._lo = lo
+            self._hi = np.maximum(hi, lo)
+            self._index_key = key
+        return self._lo, self._hi
+
+    async def update(self, spectrum, centers):
+        """Recompute all ROI totals for ``spectrum`` binned at ``centers``."""
+        n = len(spectrum)
+        if self._cumsum is None or len(self._cumsum) != n + 1:
+            self._cumsum = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum(spectrum, out=self._cumsum[1:])
+        lo, hi = self._indices(centers)
+        totals = self._cumsum[hi] - self._cumsum[lo]
+        for i in np.flatnonzero(totals != self._totals):
+            await self.roi_groups[i].COUNTS.write(int(totals[i]))
+        self._totals = totals
+
+
+@lru_cache(maxsize=None)
+def make_roi_bank(nrois):
+    """Return an ROIBank subclass with ``nrois`` ROI subgroups."""
+    attrs = {"nrois": nrois}
+    for i in range(nrois):
+        attrs[f"roi{i}"] = SubGroup(ROI, prefix=f"{i + 1}:", index=i)
+    return type(f"ROIBank{nrois}", (ROIBank,), attrs)
@@ -1,8 +1,9 @@
-import asyncio
 from caproto.server import PVGroup, pvproperty
+from .transmission import TransmissionMixin
+from ..clock import clock_of
 
 
-class SSTShutter(PVGroup):
+class SSTShutter(TransmissionMixin, PVGroup):
     state = pvproperty(
         value=0,
         dtype=int,
@@ -22,9 +23,15 @@ class SSTShutter(PVGroup):
         name="Err-Sts")
     transmission = pvproperty(value=0, dtype=float, read_only=True)
 
+    @transmission.putter
+    async def transmission(self, instance, value):
+        self._notify_transmission(value)
+        return value
+
     def __init__(self, prefix, delay=0.5, openval=0, closeval=1, parent=None, **kwargs):
         super().__init__(prefix, parent=parent)
         self._delay = delay
+        self.clock = clock_of(parent)
         self._openval = openval
         self._closeval = closeval
 
@@ -35,12 +42,12 @@ class SSTShutter(PVGroup):
 
     @cls.putter
     async def cls(self, instance, value):
-        await asyncio.sleep(self._delay)
+        await self.clock.sleep(self._delay)
         await self.state.write(value=self._closeval)
         await self.transmission.write(value=0)
 
     @opn.putter
     async def opn(self, instance, value):
-        await asyncio.sleep(self._delay)
+        await self.clock.sleep(self._delay)
         await self.state.write(value=self._openval)
         await self.transmission.write(value=1)
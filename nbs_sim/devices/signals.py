@@ -3,16 +3,31 @@ from caproto.server import (
     pvproperty,
 )
 
+from ..clock import clock_of
+from ..scheduler import scan_loop, scheduler_of
+
 
 class RingCurrent(PVGroup):
     current = pvproperty(
         value=0, dtype=float, read_only=True, doc="Ring Current", name=""
     )
 
+    scan_period = 0.1
+
     def __init__(self, prefix, parent=None, **kwargs):
         super().__init__(prefix, parent=parent)
+        self.clock = clock_of(parent)
+        self._scan_job = None
+        scheduler = scheduler_of(parent)
+        if scheduler is not None:
+            self._scan_job = scheduler.add(
+                self.current, self._scan, self.scan_period, owner=self
+            )
+
+    def _scan(self):
+        return self.parent.beam_state().current
 
-    @current.scan(period=0.1)
+    @current.startup
     async def current(self, instance, async_lib):
-        value = self.parent.current_func()
-        await instance.write(value=value)
+        if self._scan_job is None:
+            await scan_loop(instance, self._scan, self.scan_period, self.clock)
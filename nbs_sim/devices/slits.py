@@ -13,12 +13,13 @@ from caproto.server import (
     run,
     PvpropertyDouble,
 )
-from caproto.ioc_examples.fake_motor_record import FakeMotor
 from caproto import ChannelType
 from os.path import join, dirname
+from .motors import SimMotor
+from .transmission import TransmissionMixin
 
 
-class Slit(FakeMotor):
+class Slit(TransmissionMixin, SimMotor):
     """A slit simulation device."""
 
     transmission = pvproperty(
@@ -28,10 +29,10 @@ class Slit(FakeMotor):
         doc="Transmission through slit",
     )
 
-    @transmission.scan(period=0.05)
-    async def transmission(self, instance, async_lib):
-        value = await self._read()
-        await self.transmission.write(value=value)
+    @transmission.putter
+    async def transmission(self, instance, value):
+        self._notify_transmission(value)
+        return value
 
     def __init__(
         self,
@@ -53,11 +54,16 @@ class Slit(FakeMotor):
             velocity=velocity,
             precision=precision,
             user_limits=user_limits,
-            parent=None
+            parent=parent
         )
         self.trans_min = trans_min
         self.trans_max = trans_max
 
+    async def readback_changed(self, readback):
+        value = await self._read()
+        if value != self.transmission.value:
+            await self.transmission.write(value=value)
+
     async def _read(self):
         rbv = self.motor.field_inst.user_readback_value.value
         if rbv < self.trans_min:
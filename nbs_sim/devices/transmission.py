@@ -0,0 +1,17 @@
+class TransmissionMixin:
+    """
+    Pushes changes of a device's ``transmission`` value to subscribers.
+
+    Devices call ``_notify_transmission`` from their ``transmission`` putter,
+    so every write reaches the beamline as soon as it happens.
+    """
+
+    def subscribe_transmission(self, callback):
+        if "_transmission_callbacks" not in self.__dict__:
+            self._transmission_callbacks = []
+        self._transmission_callbacks.append(callback)
+        callback(self.transmission.value)
+
+    def _notify_transmission(self, value):
+        for callback in self.__dict__.get("_transmission_callbacks", ()):
+            callback(value)
@@ -0,0 +1,409 @@
+"""
+Vectorized sample-holder geometry.
+
+Faces are convex polygons stored as one ``(nfaces, ncorners, 3)`` array of
+corner coordinates in the manipulator frame. For a manipulator position
+``(x, y, z, r)`` a corner ``c`` sits at ``rotz(-r) @ c + (x, y, z)``, and the
+beam is the y axis, so only the projection onto the x-z plane matters. The
+distance from the beam to a face is negative when the beam is inside it,
+matching ``nbs_bl.geometry.frames.Panel.distance_to_beam``.
+
+Holders with many faces or samples are searched through a uniform grid
+over the projected polygons, rebuilt only when the rotation changes.
+"""
+
+import csv
+from os.path import abspath, dirname, join
+
+import numpy as np
+from nbs_bl.geometry.linalg import vec
+
+_EMPTY = np.zeros(0, dtype=np.intp)
+
+
+def polygon_edges(px, pz):
+    """
+    Edge arrays of convex polygons with corners ``(px, pz)``, each of shape
+    ``(..., ncorners)``, for use with ``signed_distance``.
+    """
+    ax = np.roll(px, 1, axis=-1)
+    az = np.roll(pz, 1, axis=-1)
+    ex = px - ax
+    ez = pz - az
+    length2 = ex * ex + ez * ez
+    degenerate = np.isclose(length2, 0.0)
+    inv_length2 = np.where(degenerate, 0.0, 1.0 / np.where(degenerate, 1.0, length2))
+    return ax, az, ex, ez, inv_length2, degenerate
+
+
+def signed_distance(edges, qx=0.0, qz=0.0):
+    """
+    Signed distance from the points ``(qx, qz)`` to convex polygons.
+
+    Parameters
+    ----------
+    edges : tuple
+        Polygon edges from ``polygon_edges``, with shape (..., ncorners).
+    qx, qz : array-like, broadcastable to shape (...)
+        Points to test.
+
+    Returns
+    -------
+    distance : array, shape (...)
+        Distance to the nearest edge, negative for points inside.
+    """
+    ax, az, ex, ez, inv_length2, degenerate = edges
+    dx = np.asarray(qx, dtype=float)[..., None] - ax
+    dz = np.asarray(qz, dtype=float)[..., None] - az
+    t = (dx * ex + dz * ez) * inv_length2
+    np.clip(t, 0.0, 1.0, out=t)
+    rx = dx - t * ex
+    rz = dz - t * ez
+    distance = np.sqrt(np.min(rx * rx + rz * rz, axis=-1))
+    # Twice the signed area of the triangle (q, a, b) for every edge a -> b;
+    # the point is inside a convex polygon when all of them share a sign.
+    # Zero-length edges are skipped, like nbs_bl's prunePoints.
+    cross = dx * ez - dz * ex
+    inside = np.all((cross < 0) | degenerate, axis=-1) | np.all(
+        (cross > 0) | degenerate, axis=-1
+    )
+    return np.where(inside, -distance, distance)
+
+
+class GridIndex:
+    """
+    Uniform grid over the bounding boxes of projected polygons.
+
+    Each polygon is registered in every cell its bounding box, grown by
+    ``reach``, overlaps. Any polygon within ``reach`` of a point is therefore
+    among the candidates of the point's cell. The (cell, polygon) pairs are
+    built with array operations and kept sorted by cell, so building the
+    index has no per-polygon Python loop and a lookup is one binary search.
+
+    Parameters
+    ----------
+    px, pz : array, shape (npolygons, ncorners)
+        Projected polygon corners.
+    reach : float
+        Search radius around each polygon.
+    cell : float, optional
+        Grid spacing. Defaults to the median polygon size.
+    """
+
+    def __init__(self, px, pz, reach=0.0, cell=None):
+        self.keys = np.zeros(0, dtype=np.int64)
+        self.starts = np.zeros(1, dtype=np.intp)
+        self.polygons = _EMPTY
+        if len(px) == 0:
+            self.x0 = self.z0 = 0.0
+            self.cell = 1.0
+            self.ncols = 1
+            return
+        xlo = px.min(axis=-1) - reach
+        xhi = px.max(axis=-1) + reach
+        zlo = pz.min(axis=-1) - reach
+        zhi = pz.max(axis=-1) + reach
+        if cell is None:
+            cell = float(np.median(np.maximum(xhi - xlo, zhi - zlo)))
+        self.cell = max(cell, 1e-9)
+        self.x0 = float(xlo.min())
+        self.z0 = float(zlo.min())
+        i0, i1 = self._cell(xlo, self.x0), self._cell(xhi, self.x0)
+        j0, j1 = self._cell(zlo, self.z0), self._cell(zhi, self.z0)
+        self.ncols = int(j1.max()) + 1
+        # Enumerate the cells of every polygon's box: polygon n covers
+        # ni[n] * nj[n] cells, numbered row by row from (i0[n], j0[n]).
+        ni = i1 - i0 + 1
+        nj = j1 - j0 + 1
+        counts = ni * nj
+        polygons = np.repeat(np.arange(len(px)), counts)
+        k = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        i = i0[polygons] + k // nj[polygons]
+        j = j0[polygons] + k % nj[polygons]
+        keys = i.astype(np.int64) * self.ncols + j
+        order = np.argsort(keys, kind="stable")
+        keys = keys[order]
+        self.polygons = polygons[order]
+        first = np.flatnonzero(np.diff(keys, prepend=-1))
+        self.keys = keys[first]
+        self.starts = np.append(first, len(keys))
+
+    def _cell(self, v, v0):
+        return np.floor((v - v0) / self.cell).astype(np.intp)
+
+    def candidates(self, qx, qz):
+        """Indices of the polygons that may lie within ``reach`` of a point."""
+        i = int(np.floor((qx - self.x0) / self.cell))
+        j = int(np.floor((qz - self.z0) / self.cell))
+        if i < 0 or not 0 <= j < self.ncols:
+            return _EMPTY
+        key = i * self.ncols + j
+        n = int(np.searchsorted(self.keys, key))
+        if n == len(self.keys) or self.keys[n] != key:
+            return _EMPTY
+        return self.polygons[self.starts[n] : self.starts[n + 1]]
+
+
+class _Projection:
+    """Faces projected at one rotation, with their edges and grid index."""
+
+    def __init__(self, corners, r, reach):
+        theta = np.deg2rad(r)
+        c = corners
+        self.px = np.cos(theta) * c[..., 0] + np.sin(theta) * c[..., 1]
+        self.py = np.cos(theta) * c[..., 1] - np.sin(theta) * c[..., 0]
+        self.pz = c[..., 2]
+        self.edges = polygon_edges(self.px, self.pz)
+        self.reach = reach
+        self._index = None
+
+    @property
+    def index(self):
+        if self._index is None:
+            self._index = GridIndex(self.px, self.pz, reach=self.reach)
+        return self._index
+
+    def subset(self, indices):
+        return tuple(a[indices] for a in self.edges)
+
+    def intercept(self, indices, qx, qz):
+        """
+        y coordinate at which the beam crosses each of the faces
+        ``indices``, from the plane through their first three corners.
+        """
+        x = self.px[indices, :3]
+        y = self.py[indices, :3]
+        z = self.pz[indices, :3]
+        # Solve y = a + b * x + c * z through the three corners.
+        dx1, dz1, dy1 = x[:, 1] - x[:, 0], z[:, 1] - z[:, 0], y[:, 1] - y[:, 0]
+        dx2, dz2, dy2 = x[:, 2] - x[:, 0], z[:, 2] - z[:, 0], y[:, 2] - y[:, 0]
+        det = dx1 * dz2 - dx2 * dz1
+        det = np.where(np.isclose(det, 0.0), np.nan, det)
+        b = (dy1 * dz2 - dy2 * dz1) / det
+        c = (dx1 * dy2 - dx2 * dy1) / det
+        return y[:, 0] + b * (qx - x[:, 0]) + c * (qz - z[:, 0])
+
+
+class FaceGeometry:
+    """
+    A set of convex faces attached to a rotating manipulator.
+
+    Parameters
+    ----------
+    corners : array-like, shape (nfaces, ncorners, 3)
+        Face corners in the manipulator frame at zero rotation.
+    reach : float, optional
+        Distances up to ``reach`` are found through the grid index; beyond
+        that all faces are evaluated.
+    """
+
+    def __init__(self, corners, reach=5.0):
+        self.corners = np.asarray(corners, dtype=float)
+        self.reach = reach
+        self._projection_r = None
+        self._projection = None
+
+    @classmethod
+    def from_panels(cls, panels):
+        """Build from ``nbs_bl`` Panels, e.g. from ``make_regular_polygon``."""
+        origin = vec(0, 0, 0)
+        return cls([panel.real_edges(origin, 0) for panel in panels])
+
+    def __len__(self):
+        return len(self.corners)
+
+    def _rotated_x(self, r):
+        theta = np.deg2rad(r)
+        c = self.corners
+        return np.cos(theta) * c[..., 0] + np.sin(theta) * c[..., 1]
+
+    def project(self, r):
+        """
+        Faces projected onto the x-z plane after a rotation of ``r`` degrees,
+        before the manipulator translation. The last rotation is cached.
+        """
+        if r != self._projection_r:
+            self._projection = _Projection(self.corners, r, self.reach)
+            self._projection_r = r
+        return self._projection
+
+    def face_distances(self, x, y, z, r):
+        """Signed distance from the beam to every face."""
+        return signed_distance(self.project(r).edges, -x, -z)
+
+    def nearest(self, x, y, z, r):
+        """Signed distance from the beam to the nearest face, and its index."""
+        projection = self.project(r)
+        candidates = projection.index.candidates(-x, -z)
+        if len(candidates):
+            distances = signed_distance(projection.subset(candidates), -x, -z)
+            n = np.argmin(distances)
+            if distances[n] <= self.reach:
+                return distances[n], candidates[n]
+        if len(self) == 0:
+            return np.inf, None
+        distances = signed_distance(projection.edges, -x, -z)
+        n = np.argmin(distances)
+        return distances[n], n
+
+    def distance_to_beam(self, x, y, z, r):
+        """Signed distance from the beam to the nearest face."""
+        return self.nearest(x, y, z, r)[0]
+
+    def hits(self, x, y, z, r):
+        """
+        Indices of the faces the beam passes through, upstream first,
+        for a beam travelling along +y.
+        """
+        projection = self.project(r)
+        candidates = projection.index.candidates(-x, -z)
+        if not len(candidates):
+            return candidates
+        distances = signed_distance(projection.subset(candidates), -x, -z)
+        hit = candidates[distances < 0]
+        if len(hit) > 1:
+            hit = hit[np.argsort(projection.intercept(hit, -x, -z))]
+        return hit
+
+    def batch_distance_to_beam(self, positions):
+        """
+        Evaluate ``distance_to_beam`` for many manipulator positions at once.
+
+        Parameters
+        ----------
+        positions : array-like, shape (npositions, 4)
+            Beam-relative ``(x, y, z, r)`` positions.
+
+        Returns
+        -------
+        distances : array, shape (npositions,)
+        """
+        positions = np.atleast_2d(np.asarray(positions, dtype=float))
+        x, _, z, r = positions.T
+        px = self._rotated_x(r[:, None, None])
+        pz = np.broadcast_to(self.corners[..., 2], px.shape)
+        edges = polygon_edges(px, pz)
+        distances = signed_distance(edges, -x[:, None], -z[:, None])
+        return np.min(distances, axis=-1)
+
+
+def panel_corners(corners, coordinates):
+    """
+    Corners of the rectangle ``(x1, y1, x2, y2)`` on a rectangular face.
+
+    Coordinates are measured from the face's first corner, x towards the
+    second corner and y towards the last, like ``Panel.make_sample_frame``.
+    """
+    c0 = corners[0]
+    u = corners[1] - c0
+    v = corners[-1] - c0
+    u = u / np.linalg.norm(u)
+    v = v / np.linalg.norm(v)
+    x1, y1, x2, y2 = coordinates
+    return np.array(
+        [
+            c0 + x1 * u + y1 * v,
+            c0 + x2 * u + y1 * v,
+            c0 + x2 * u + y2 * v,
+            c0 + x1 * u + y2 * v,
+        ]
+    )
+
+
+def read_sample_csv(filename):
+    """
+    Read a sample file in the ``nbs_bl`` bar format: a header row with
+    sample_id, side, x1, y1, x2, y2 and any extra metadata columns. A
+    relative ``spectrum`` path is taken relative to the file.
+    """
+    samples = {}
+    with open(filename) as f:
+        rows = list(csv.reader(f, skipinitialspace=True))
+    names = [n for n in rows[0] if n != ""]
+    for row in rows[1:]:
+        if not row:
+            continue
+        info = {key: value for key, value in zip(names[1:], row[1:]) if value != ""}
+        coordinates = [float(info.pop(k)) for k in ("x1", "y1", "x2", "y2")]
+        info["position"] = {"side": int(info.pop("side")), "coordinates": coordinates}
+        if "sample_name" in info:
+            info["name"] = info.pop("sample_name")
+        if "spectrum" in info:
+            info["spectrum"] = join(dirname(abspath(filename)), info["spectrum"])
+        samples[row[0]] = info
+    return samples
+
+
+class SampleHolder:
+    """
+    A multi-face holder carrying any number of rectangular samples.
+
+    Parameters
+    ----------
+    faces : FaceGeometry
+        The holder faces.
+    samples : dict, optional
+        ``{sample_id: info}``, where ``info["position"]`` holds the one-indexed
+        ``side`` and the ``coordinates`` (x1, y1, x2, y2) on that side, as in
+        ``nbs_bl`` sample files. Other entries are kept as sample metadata.
+    """
+
+    def __init__(self, faces, samples=None):
+        self.faces = faces
+        samples = dict(samples or {})
+        self.sample_ids = list(samples)
+        self.sample_info = samples
+        corners = []
+        for info in samples.values():
+            position = info.get("position", info)
+            side = int(position["side"]) - 1
+            corners.append(panel_corners(faces.corners[side], position["coordinates"]))
+        self.samples = FaceGeometry(np.reshape(corners, (-1, 4, 3)), reach=0.0)
+
+    @classmethod
+    def from_config(
+        cls, holder=None, faces=None, samples=None, sample_file=None, reach=5.0
+    ):
+        """
+        Build a holder from device config.
+
+        ``faces`` is a list of corner lists in the manipulator frame; if it
+        is not given, ``holder`` describes a regular polygonal bar with
+        ``width``, ``height`` and ``nsides`` (default 24.5 x 215, 4 sides).
+        ``samples`` is a table of samples keyed by id, or a list of tables
+        with an ``id`` entry, and ``sample_file`` an ``nbs_bl`` sample CSV.
+        """
+        if faces is not None:
+            geometry = FaceGeometry(faces, reach=reach)
+        else:
+            from nbs_bl.geometry.frames import make_regular_polygon
+
+            holder = dict(holder or {})
+            panels = make_regular_polygon(
+                holder.get("width", 24.5),
+                holder.get("height", 215),
+                holder.get("nsides", 4),
+            )
+            geometry = FaceGeometry.from_panels(panels)
+            geometry.reach = reach
+        all_samples = {}
+        if sample_file is not None:
+            all_samples.update(read_sample_csv(sample_file))
+        if isinstance(samples, dict):
+            all_samples.update(samples)
+        elif samples is not None:
+            all_samples.update({str(s["id"]): s for s in samples})
+        return cls(geometry, all_samples)
+
+    def beam_target(self, x, y, z, r):
+        """
+        Signed distance from the beam to the holder, and the id of the
+        upstream-most sample the beam hits (None if it hits no sample).
+        """
+        distance = self.faces.distance_to_beam(x, y, z, r)
+        sample = None
+        if self.sample_ids:
+            hits = self.samples.hits(x, y, z, r)
+            if len(hits):
+                sample = self.sample_ids[hits[0]]
+        return distance, sample
@@ -0,0 +1,163 @@
+"""
+In-process simulation without Channel Access.
+
+``HeadlessSim`` builds the same Beamline as ``nbs-sim``, runs the startup
+hooks of its PVs on the current event loop, and lets Python code get and
+put PV values and move simulation time directly. Nothing is served over
+the network. With the default stepped clock, time only moves inside
+``step``, ``put`` and ``wait_until``, which jump straight to the next
+pending deadline, so simulated scans run as fast as the device code::
+
+    async with HeadlessSim(startup_dir="sim_startup", seed=0) as sim:
+        await sim.put("EN:MonoMtr:ENERGY_SP", 600)
+        await sim.step(1.0)
+        print(sim.get("I0:Volt"))
+"""
+
+import asyncio
+from os.path import abspath, dirname, join
+
+from caproto.asyncio.server import AsyncioAsyncLayer
+from nbs_core.autoconf import generate_device_config
+
+from .beamline import Beamline, tomllib
+from .clock import SimClock
+
+
+class HeadlessSim:
+    """
+    Parameters
+    ----------
+    config : dict, optional
+        Resolved device config, as from ``generate_device_config``.
+    startup_dir : str, optional
+        Directory with devices.toml and sim_conf.toml.
+    device_file, config_file : str, optional
+        Used instead of ``startup_dir``.
+    stepped : bool
+        Use a stepped clock starting at 0, so that runs with the same seed
+        are identical. Otherwise time runs at ``time_scale``.
+    time_scale : float
+        Simulated seconds per real second when not stepped.
+    **kwargs
+        Passed on to Beamline, e.g. ``prefix`` or ``seed``.
+    """
+
+    def __init__(
+        self,
+        config=None,
+        *,
+        startup_dir=None,
+        device_file=None,
+        config_file=None,
+        stepped=True,
+        time_scale=1.0,
+        **kwargs,
+    ):
+        if startup_dir is not None:
+            device_file = join(startup_dir, "devices.toml")
+            config_file = join(startup_dir, "sim_conf.toml")
+        if config is None:
+            if device_file is None or config_file is None:
+                raise ValueError(
+                    "Either config, startup_dir, or both device_file and "
+                    "config_file must be given"
+                )
+            config = generate_device_config(device_file, config_file)
+        if device_file is not None:
+            kwargs.setdefault("config_dir", dirname(abspath(device_file)))
+        if config_file is not None and "scan_config" not in kwargs:
+            with open(config_file, "rb") as f:
+                kwargs["scan_config"] = tomllib.load(f).get("scan")
+        kwargs.setdefault("prefix", "SIM:")
+        self.clock = SimClock(
+            time_scale=time_scale, stepped=stepped, start=0.0 if stepped else None
+        )
+        self.beamline = Beamline(config=config, clock=self.clock, **kwargs)
+        self.pvdb = self.beamline.pvdb
+        self._tasks = []
+
+    @property
+    def devices(self):
+        return self.beamline.devices
+
+    def _hook_methods(self, *attrs):
+        for name, instance in self.pvdb.items():
+            instances = [instance]
+            if hasattr(instance, "fields"):
+                instances.extend(instance.fields.values())
+            for inst in instances:
+                for attr in attrs:
+                    method = getattr(inst, attr, None)
+                    if method is not None:
+                        yield method
+
+    async def start(self):
+        """Run the startup hooks of every PV, as the CA server would."""
+        async_lib = AsyncioAsyncLayer()
+        for method in self._hook_methods("server_startup", "server_scan"):
+            self._tasks.append(asyncio.ensure_future(method(async_lib)))
+        await self.clock.settle()
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        async_lib = AsyncioAsyncLayer()
+        await asyncio.gather(
+            *(method(async_lib) for method in self._hook_methods("server_shutdown")),
+            return_exceptions=True,
+        )
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.stop()
+
+    def get(self, name):
+        return self.pvdb[name].value
+
+    async def put(self, name, value, wait=True, timeout=60.0):
+        """
+        Write ``value`` to PV ``name`` through its putter, like a CA put.
+
+        With ``wait`` the call returns once the putter has finished, moving
+        simulation time as needed, and raises ``asyncio.TimeoutError`` after
+        ``timeout`` simulated seconds. Otherwise the write task is returned.
+        """
+        task = asyncio.ensure_future(self.pvdb[name].write(value))
+        if not wait:
+            return task
+        await self.wait_until(task.done, timeout)
+        return task.result()
+
+    async def step(self, dt):
+        """Move simulation time forward by ``dt`` seconds."""
+        if self.clock.stepped:
+            await self.clock.advance(dt)
+        else:
+            await self.clock.sleep(dt)
+
+    async def wait_until(self, predicate, timeout=60.0, poll=0.01):
+        """
+        Run the simulation until ``predicate()`` is true, for at most
+        ``timeout`` simulated seconds. A stepped clock jumps from deadline to
+        deadline; otherwise the predicate is polled every ``poll`` seconds.
+        """
+        clock = self.clock
+        end = clock.monotonic() + timeout
+        await clock.settle()
+        while not predicate():
+            now = clock.monotonic()
+            if now >= end:
+                raise asyncio.TimeoutError(f"Condition not met within {timeout} s")
+            if clock.stepped:
+                deadline = clock.next_deadline()
+                if deadline is None:
+                    deadline = end
+                await clock.advance(min(max(deadline - now, 0.0), end - now))
+            else:
+                await clock.sleep(min(poll, end - now))
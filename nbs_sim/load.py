@@ -1,8 +1,69 @@
+from functools import lru_cache
+
 from nbs_core.autoload import simpleResolver
-from copy import deepcopy
+from .profiling import maybe_phase
+
+
+resolve_class = lru_cache(maxsize=None)(simpleResolver)
+resolve_class.__doc__ = "``simpleResolver``, imported once per distinct ``_target``."
+
+
+class PVCollector:
+    """
+    Gathers the pvdbs of many devices and merges them into one in a single
+    pass, failing on PV names that more than one device defines.
+    """
+
+    def __init__(self):
+        self.pvdbs = []
+
+    def add(self, device_key, pvdb):
+        self.pvdbs.append((device_key, pvdb))
+
+    def merge_into(self, pvdb):
+        """Add every collected PV to ``pvdb``, which must not define them yet."""
+        merged = {}
+        total = 0
+        for _, device_pvdb in self.pvdbs:
+            merged.update(device_pvdb)
+            total += len(device_pvdb)
+        if len(merged) != total or not merged.keys().isdisjoint(pvdb):
+            raise ValueError(f"Duplicate PV names: {self.duplicates(pvdb)}")
+        pvdb.update(merged)
+        self.pvdbs = []
+
+    def duplicates(self, pvdb=()):
+        """``{pvname: [device_key, ...]}`` for every PV defined more than once."""
+        owners = {name: ["<existing>"] for name in pvdb}
+        for device_key, device_pvdb in self.pvdbs:
+            for name in device_pvdb:
+                owners.setdefault(name, []).append(device_key)
+        return {name: keys for name, keys in owners.items() if len(keys) > 1}
 
 
-def createIOCDevice(device_key, info, cls=None, parent=None, **kwargs):
+def _copy_containers(value):
+    if isinstance(value, dict):
+        return {key: _copy_containers(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_copy_containers(item) for item in value]
+    return value
+
+
+def device_kwargs(info):
+    """
+    The constructor arguments in ``info``: everything but ``_`` keys, with
+    dicts and lists copied so that devices cannot modify the shared config.
+    """
+    return {
+        key: _copy_containers(value)
+        for key, value in info.items()
+        if not key.startswith("_")
+    }
+
+
+def createIOCDevice(
+    device_key, info, cls=None, parent=None, profile=None, collector=None, **kwargs
+):
     """
     Instantiate a device with given information.
 
@@ -11,31 +72,62 @@ def createIOCDevice(device_key, info, cls=None, parent=None, **kwargs):
     device_key : str
         The key identifying the device.
     info : dict
-        The information dictionary for the device.
+        The information dictionary for the device. It is not modified; only
+        its dicts and lists are copied for the device, scalars are shared.
     cls : type, optional
         The class to instantiate the device with. If not provided, it will be resolved from the info dictionary.
     namespace : dict, optional
         The namespace to add the instantiated device to.
+    profile : StartupProfile, optional
+        If given, time spent importing device classes and merging the device
+        pvdb is recorded as "device imports" and "pvdb assembly".
+    collector : PVCollector, optional
+        If given, the device pvdb is added to it, to be merged into the
+        parent pvdb later, instead of being merged right away.
 
     Returns
     -------
     object
         The instantiated device.
     """
-    device_info = deepcopy(info)
-    if cls is not None:
-        device_info.pop("_target", None)
-    elif device_info.get("_target", None) is not None:
-        cls = simpleResolver(device_info.pop("_target"))
-    else:
-        raise KeyError("Could not find '_target' in {}".format(device_info))
-
-    popkeys = [key for key in device_info if key.startswith("_")]
-    for key in popkeys:
-        device_info.pop(key)
+    if cls is None:
+        target = info.get("_target", None)
+        if target is None:
+            raise KeyError("Could not find '_target' in {}".format(info))
+        with maybe_phase(profile, "device imports"):
+            cls = resolve_class(target)
 
+    device_info = device_kwargs(info)
     prefix = device_info.pop("prefix", "")
     device = cls(prefix, parent=parent, **device_info)
-    if parent is not None:
-        parent.pvdb.update(**device.pvdb)
+    if collector is not None:
+        collector.add(device_key, device.pvdb)
+    elif parent is not None:
+        with maybe_phase(profile, "pvdb assembly"):
+            collector = PVCollector()
+            collector.add(device_key, device.pvdb)
+            collector.merge_into(parent.pvdb)
     return device
+
+
+def split_deferred(config, deferred_groups=()):
+    """
+    Split ``config`` into the devices to build at startup and those to
+    build on first use: devices with ``_defer_loading`` set, or in one of
+    ``deferred_groups``.
+    """
+    deferred_groups = set(deferred_groups)
+    eager = {}
+    deferred = {}
+    for key, info in config.items():
+        if isinstance(info, dict):
+            groups = info.get("_group", [])
+            if isinstance(groups, str):
+                groups = [groups]
+            if info.get("_defer_loading", False) or not deferred_groups.isdisjoint(
+                groups
+            ):
+                deferred[key] = dict(info, _defer_loading=False)
+                continue
+        eager[key] = info
+    return eager, deferred
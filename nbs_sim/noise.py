@@ -0,0 +1,95 @@
+"""
+Central, seeded source of simulation noise.
+
+Every device draws from its own ``NoiseStream``, whose generator is derived
+from the service seed and a CRC of the stream name. Streams are therefore
+independent of each other and of the order in which devices are built, and
+a run with a fixed ``--seed`` is reproducible.
+"""
+
+import zlib
+
+import numpy as np
+
+
+class NoiseStream:
+    """
+    A ``numpy.random.Generator`` with a ring buffer of standard normals.
+
+    Normals are drawn from the generator ``block`` at a time, so a scalar
+    read is an index into the buffer rather than a call into the generator.
+    Requests larger than a block are drawn directly. Poisson variates depend
+    on a rate that changes on every read, so ``poisson`` passes through.
+    """
+
+    def __init__(self, generator, block=4096):
+        self.generator = generator
+        self.block = block
+        self._buffer = None
+        self._pos = block
+
+    def _refill(self):
+        self._buffer = self.generator.standard_normal(self.block)
+        self._pos = 0
+
+    def standard_normal(self, size=None):
+        if size is None:
+            if self._pos >= self.block:
+                self._refill()
+            value = self._buffer[self._pos]
+            self._pos += 1
+            return float(value)
+        if size > self.block:
+            return self.generator.standard_normal(size)
+        if self._pos + size > self.block:
+            self._refill()
+        values = self._buffer[self._pos : self._pos + size]
+        self._pos += size
+        return values
+
+    def normal(self, loc=0.0, scale=1.0, size=None):
+        return loc + scale * self.standard_normal(size)
+
+    def poisson(self, lam, size=None):
+        return self.generator.poisson(lam, size)
+
+
+class NoiseService:
+    """
+    Hands out one NoiseStream per name, all derived from ``seed``.
+
+    Parameters
+    ----------
+    seed : int, optional
+        Root seed. Without one, fresh OS entropy is used.
+    block : int
+        Size of the normal buffers of the streams.
+    """
+
+    def __init__(self, seed=None, block=4096):
+        self.seed_sequence = np.random.SeedSequence(seed)
+        self.block = block
+        self._streams = {}
+
+    def stream(self, name):
+        stream = self._streams.get(name)
+        if stream is None:
+            seed = np.random.SeedSequence(
+                self.seed_sequence.entropy, spawn_key=(zlib.crc32(name.encode()),)
+            )
+            stream = NoiseStream(np.random.default_rng(seed), self.block)
+            self._streams[name] = stream
+        return stream
+
+
+def noise_stream(parent, name):
+    """
+    The stream ``name`` of the NoiseService of the nearest ancestor that has
+    one, or an unseeded stream if there is none.
+    """
+    while parent is not None:
+        noise = getattr(parent, "noise", None)
+        if isinstance(noise, NoiseService):
+            return noise.stream(name)
+        parent = getattr(parent, "parent", None)
+    return NoiseStream(np.random.default_rng())
@@ -0,0 +1,60 @@
+import sys
+import time
+from contextlib import contextmanager
+
+
+class StartupProfile:
+    """
+    Accumulates wall time spent in named startup phases.
+
+    Phases may be nested; time spent in an inner phase is not counted
+    towards the enclosing one, so the phase totals add up to the overall
+    startup time.
+    """
+
+    def __init__(self):
+        self.phases = {}
+        self._stack = []
+
+    def add(self, name, seconds):
+        self.phases[name] = self.phases.get(name, 0.0) + seconds
+
+    @contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        self._stack.append(0.0)
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            inner = self._stack.pop()
+            self.add(name, elapsed - inner)
+            if self._stack:
+                self._stack[-1] += elapsed
+
+    @property
+    def total(self):
+        return sum(self.phases.values())
+
+    def report(self, file=None):
+        if file is None:
+            file = sys.stdout
+        total = self.total
+        width = max([len(name) for name in self.phases] + [5])
+        print("Startup profile:", file=file)
+        for name, seconds in self.phases.items():
+            fraction = seconds / total if total else 0
+            print(
+                f"  {name:<{width}}  {seconds * 1e3:9.1f} ms  {fraction:6.1%}",
+                file=file,
+            )
+        print(f"  {'total':<{width}}  {total * 1e3:9.1f} ms", file=file)
+
+
+@contextmanager
+def maybe_phase(profile, name):
+    if profile is None:
+        yield
+    else:
+        with profile.phase(name):
+            yield
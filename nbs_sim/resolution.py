@@ -0,0 +1,114 @@
+"""
+Monochromator resolution broadening of tabulated spectra.
+
+The bandwidth of the mono is modelled as a Gaussian of FWHM ``E / R`` at a
+resolving power ``R`` set by the grating and cff. On a logarithmic energy
+grid that kernel has the same width everywhere, so a whole table is
+broadened by one FFT convolution and then resampled onto its original
+linear grid; reads of the broadened table are ordinary table lookups.
+"""
+
+import weakref
+from collections import OrderedDict
+
+import numpy as np
+from scipy.signal import fftconvolve
+
+from .spectral import SpectralTable
+
+FWHM_TO_SIGMA = 1.0 / (2.0 * np.sqrt(2.0 * np.log(2.0)))
+
+
+class MonoResolution:
+    """
+    Resolving power of the mono versus grating and cff.
+
+    Parameters
+    ----------
+    resolving_powers : dict, optional
+        Resolving power of each grating (lines/mm) at ``reference_cff``.
+    reference_cff : float
+        cff at which ``resolving_powers`` apply.
+    cff_exponent : float
+        The resolving power scales as ``(cff / reference_cff) ** cff_exponent``.
+    """
+
+    def __init__(self, resolving_powers=None, reference_cff=1.55, cff_exponent=1.0):
+        if resolving_powers is None:
+            resolving_powers = {250: 3000.0, 1200: 10000.0}
+        self.resolving_powers = {int(k): float(v) for k, v in resolving_powers.items()}
+        self.reference_cff = reference_cff
+        self.cff_exponent = cff_exponent
+
+    def resolving_power(self, grating, cff):
+        """Resolving power, or None for a grating without a model."""
+        power = self.resolving_powers.get(grating)
+        if power is None or cff <= 0:
+            return None
+        return power * (cff / self.reference_cff) ** self.cff_exponent
+
+
+def broaden(table, resolving_power):
+    """
+    Convolve a SpectralTable with a Gaussian of FWHM ``E / resolving_power``.
+
+    The table is resampled onto a logarithmic grid fine enough to keep the
+    spacing of the original grid at its upper end, padded with its end
+    values so the edges do not droop, convolved, and resampled back.
+    """
+    energies = table.grid
+    log_min, log_max = np.log(energies[0]), np.log(energies[-1])
+    log_step = table.step / energies[-1]
+    npts = int(np.ceil((log_max - log_min) / log_step)) + 1
+    log_grid = log_min + log_step * np.arange(npts)
+    values = table.evaluate(np.exp(log_grid))
+
+    sigma = FWHM_TO_SIGMA / resolving_power / log_step
+    half = int(np.ceil(5 * sigma))
+    if half < 1:
+        return table
+    kernel = np.exp(-0.5 * (np.arange(-half, half + 1) / sigma) ** 2)
+    kernel /= kernel.sum()
+    padded = np.pad(values, half, mode="edge")
+    smoothed = fftconvolve(padded, kernel, mode="same")[half:-half]
+    return SpectralTable(
+        table.x0, table.step, np.interp(np.log(energies), log_grid, smoothed)
+    )
+
+
+class BroadeningCache:
+    """
+    Broadened tables for the most recent mono settings.
+
+    Entries are keyed by mono setting, e.g. ``(grating, cff)``, and hold the
+    broadened version of every table read at that setting, weakly keyed by
+    the source table so that tables dropped elsewhere (e.g. evicted from a
+    SpectralDatabase) are dropped here too. The least recently used setting
+    is evicted beyond ``maxsize``, so switching back and forth between
+    settings does not recompute anything, and switching to a new one costs
+    one convolution per table.
+    """
+
+    def __init__(self, maxsize=4):
+        self.maxsize = maxsize
+        self._settings = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def table(self, table, setting, resolving_power):
+        tables = self._settings.get(setting)
+        if tables is None:
+            tables = weakref.WeakKeyDictionary()
+            self._settings[setting] = tables
+            if len(self._settings) > self.maxsize:
+                self._settings.popitem(last=False)
+        else:
+            self._settings.move_to_end(setting)
+        broadened = tables.get(table)
+        if broadened is not None:
+            self.hits += 1
+            return broadened
+        self.misses += 1
+        broadened = broaden(table, resolving_power)
+        tables[table] = broadened
+        return broadened
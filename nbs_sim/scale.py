@@ -0,0 +1,331 @@
+"""
+Synthetic beamline configs for scale testing.
+
+``nbs-sim-config generate`` writes a devices.toml and sim_conf.toml with
+any number of motors, ADCs, shutters, slits and MCAs built from the
+simulation device classes, around the ring current, mono and manipulator
+that every beamline has::
+
+    nbs-sim-config generate big_beamline -n 500 --mcas 20
+    nbs-sim --startup-dir big_beamline
+
+``nbs-sim-config scale-report`` generates configs of growing size and
+builds each one in a fresh process, reporting startup time, peak resident
+memory, PV count and CPU time per scheduler tick. By default every MCA
+acquires continuously while it is measured; ``--acquiring`` sets the
+fraction that does, the rest stay idle::
+
+    nbs-sim-config scale-report --sizes 10 100 1000 --seconds 5
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import math
+import subprocess
+import sys
+import tempfile
+import time
+from os import makedirs
+from os.path import join
+
+KINDS = ("motors", "adcs", "shutters", "slits", "mcas")
+
+LOADERS = {
+    "RingCurrent": "nbs_sim.devices.signals.RingCurrent",
+    "SST1Energy": "nbs_sim.devices.energy.SST1Energy",
+    "Manipulator": "nbs_sim.devices.manipulator.Manipulator",
+    "SimMotor": "nbs_sim.devices.motors.SimMotor",
+    "SSTADC": "nbs_sim.devices.detectors.SSTADC",
+    "SSTShutter": "nbs_sim.devices.shutters.SSTShutter",
+    "Slit": "nbs_sim.devices.slits.Slit",
+    "MCASIM": "nbs_sim.devices.caproto_mca.MCASIM",
+}
+
+ADC_KINDS = ("i0", "sc", "ref", "i1")
+
+
+def generate_config(motors=0, adcs=0, shutters=0, slits=0, mcas=0, nrois=4):
+    """
+    Build a device config and a sim_conf for a synthetic beamline.
+
+    Returns
+    -------
+    devices : dict
+        Contents of devices.toml.
+    sim_conf : dict
+        Contents of sim_conf.toml.
+    """
+    devices = {
+        "ring_current": {
+            "_target": "RingCurrent",
+            "_role": "beam_current",
+            "_group": "source",
+            "prefix": "RING:",
+        },
+        "en": {
+            "_target": "SST1Energy",
+            "_role": "energy",
+            "_group": "source",
+            "prefix": "EN:",
+        },
+        "manipulator": {
+            "_target": "Manipulator",
+            "_role": "primary_manipulator",
+            "_group": "manipulators",
+            "prefix": "MANIP:",
+        },
+    }
+    for i in range(motors):
+        devices[f"mtr{i}"] = {
+            "_target": "SimMotor",
+            "_group": "motors",
+            "prefix": f"MTR{i}:",
+            "velocity": 10.0,
+            "user_limits": [-100.0, 100.0],
+        }
+    for i in range(adcs):
+        devices[f"adc{i}"] = {
+            "_target": "SSTADC",
+            "_group": "detectors",
+            "prefix": f"ADC{i}:",
+            "kind": ADC_KINDS[i % len(ADC_KINDS)],
+        }
+    for i in range(shutters):
+        devices[f"sh{i}"] = {
+            "_target": "SSTShutter",
+            "_group": "shutters",
+            "prefix": f"SH{i}:",
+        }
+    for i in range(slits):
+        devices[f"slit{i}"] = {
+            "_target": "Slit",
+            "_group": "apertures",
+            "prefix": f"SLIT{i}:",
+            "trans_min": 10,
+            "trans_max": 40,
+            "user_limits": [0, 50],
+        }
+    for i in range(mcas):
+        devices[f"mca{i}"] = {
+            "_target": "MCASIM",
+            "_group": "detectors",
+            "prefix": f"MCA{i}:",
+            "nrois": nrois,
+        }
+    return devices, {"loaders": dict(LOADERS)}
+
+
+def _toml_value(value):
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, (int, float)):
+        return repr(value)
+    if isinstance(value, str):
+        return json.dumps(value)
+    if isinstance(value, (list, tuple)):
+        return "[" + ", ".join(_toml_value(v) for v in value) + "]"
+    raise TypeError(f"Cannot write {value!r} to TOML")
+
+
+def dump_toml(tables, f):
+    """Write ``{name: {key: value}}`` as TOML tables of plain values."""
+    for name, table in tables.items():
+        f.write(f"[{name}]\n")
+        for key, value in table.items():
+            f.write(f"{key} = {_toml_value(value)}\n")
+        f.write("\n")
+
+
+def write_config(directory, devices, sim_conf):
+    """Write devices.toml and sim_conf.toml into ``directory``."""
+    makedirs(directory, exist_ok=True)
+    with open(join(directory, "devices.toml"), "w") as f:
+        dump_toml(devices, f)
+    with open(join(directory, "sim_conf.toml"), "w") as f:
+        dump_toml(sim_conf, f)
+
+
+def _peak_rss_mb():
+    import resource
+
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def fraction(text):
+    """argparse type for a fraction between 0 and 1."""
+    value = float(text)
+    if not 0 <= value <= 1:
+        raise argparse.ArgumentTypeError(f"{text} is not between 0 and 1")
+    return value
+
+
+def measure(startup_dir, seconds=5.0, acquiring=1.0):
+    """
+    Build and run the beamline in ``startup_dir`` in this process.
+
+    The first ``acquiring`` fraction of the MCAs is put into continuous
+    acquisition after startup. The beamline then runs in real time for
+    ``seconds``, so the CPU per tick includes everything the devices do
+    between ticks.
+    """
+    import asyncio
+
+    from .devices.caproto_mca import MCASIM
+    from .headless import HeadlessSim
+
+    if not 0 <= acquiring <= 1:
+        raise ValueError(f"acquiring must be between 0 and 1, got {acquiring}")
+
+    async def run():
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            sim = HeadlessSim(startup_dir=startup_dir, stepped=False, seed=0)
+            await sim.start()
+        startup = time.perf_counter() - start
+        mcas = [d for d in sim.devices.values() if isinstance(d, MCASIM)]
+        for mca in mcas[: math.ceil(acquiring * len(mcas))]:
+            await mca.ACQUIRE.write(-1)
+        scheduler = sim.beamline.scheduler
+        ticks = scheduler.ticks
+        cpu = time.process_time()
+        await asyncio.sleep(seconds)
+        cpu = time.process_time() - cpu
+        ticks = scheduler.ticks - ticks
+        acquiring_mcas = sum(1 for mca in mcas if mca.ACQUIRE.value != 0)
+        await sim.stop()
+        return {
+            "devices": len(sim.devices),
+            "mcas_acquiring": acquiring_mcas,
+            "pvs": len(sim.pvdb),
+            "startup_s": startup,
+            "peak_rss_mb": _peak_rss_mb(),
+            "ticks": ticks,
+            "cpu_per_tick_ms": 1e3 * cpu / ticks if ticks else float("nan"),
+            "cpu_load": cpu / seconds,
+        }
+
+    return asyncio.run(run())
+
+
+def scale_report(
+    sizes, kinds=KINDS, seconds=5.0, directory=None, file=None, acquiring=1.0
+):
+    """
+    Generate a config with N devices of every one of ``kinds`` for each N in
+    ``sizes``, measure it in a fresh process, and print a table. The
+    ``acquiring`` fraction of the MCAs acquires continuously while measured.
+    """
+    if file is None:
+        file = sys.stdout
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        print(
+            f"{'N':>6} {'devices':>8} {'PVs':>8} {'startup s':>10} "
+            f"{'RSS MB':>8} {'ticks':>6} {'ms/tick':>8} {'CPU':>6} "
+            f"{'MCAs acq':>8}",
+            file=file,
+        )
+        for n in sizes:
+            startup_dir = join(directory or tmp, f"n{n}")
+            write_config(startup_dir, *generate_config(**{k: n for k in kinds}))
+            proc = subprocess.run(
+                [
+                    sys.executable,
+                    "-m",
+                    "nbs_sim.scale",
+                    "measure",
+                    startup_dir,
+                    "--seconds",
+                    str(seconds),
+                    "--acquiring",
+                    str(acquiring),
+                ],
+                capture_output=True,
+                text=True,
+            )
+            if proc.returncode != 0:
+                print(f"{n:>6} failed:\n{proc.stderr}", file=file)
+                break
+            result = dict(json.loads(proc.stdout.splitlines()[-1]), n=n)
+            results.append(result)
+            print(
+                f"{n:>6} {result['devices']:>8} {result['pvs']:>8} "
+                f"{result['startup_s']:>10.2f} {result['peak_rss_mb']:>8.0f} "
+                f"{result['ticks']:>6} {result['cpu_per_tick_ms']:>8.2f} "
+                f"{result['cpu_load']:>6.0%} {result['mcas_acquiring']:>8}",
+                file=file,
+            )
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Synthetic nbs-sim configs for scale testing"
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    generate = commands.add_parser("generate", help="Write a synthetic config")
+    generate.add_argument("directory", help="Where to write the config files")
+    generate.add_argument(
+        "-n", type=int, default=10, help="Number of devices of each kind"
+    )
+    for kind in KINDS:
+        generate.add_argument(
+            f"--{kind}", type=int, default=None, help=f"Number of {kind} (default N)"
+        )
+    generate.add_argument("--nrois", type=int, default=4, help="ROIs per MCA")
+
+    report = commands.add_parser(
+        "scale-report", help="Measure startup and tick cost against config size"
+    )
+    report.add_argument(
+        "--sizes", type=int, nargs="+", default=[10, 30, 100, 300, 1000]
+    )
+    report.add_argument(
+        "--kinds",
+        nargs="+",
+        choices=KINDS,
+        default=list(KINDS),
+        help="Device kinds to scale (default: all)",
+    )
+    report.add_argument(
+        "--seconds", type=float, default=5.0, help="Run time per size"
+    )
+    report.add_argument(
+        "--acquiring",
+        type=fraction,
+        default=1.0,
+        help="Fraction of MCAs acquiring while measured (default 1)",
+    )
+    report.add_argument(
+        "--keep", default=None, help="Directory to keep the generated configs in"
+    )
+
+    measure_cmd = commands.add_parser(
+        "measure", help="Measure one config in this process, as JSON"
+    )
+    measure_cmd.add_argument("startup_dir")
+    measure_cmd.add_argument("--seconds", type=float, default=5.0)
+    measure_cmd.add_argument("--acquiring", type=fraction, default=1.0)
+
+    args = parser.parse_args(argv)
+    if args.command == "generate":
+        counts = {
+            kind: args.n if getattr(args, kind) is None else getattr(args, kind)
+            for kind in KINDS
+        }
+        devices, sim_conf = generate_config(nrois=args.nrois, **counts)
+        write_config(args.directory, devices, sim_conf)
+        print(f"Wrote {len(devices)} devices to {args.directory}")
+    elif args.command == "scale-report":
+        scale_report(
+            args.sizes, args.kinds, args.seconds, args.keep, acquiring=args.acquiring
+        )
+    else:
+        print(json.dumps(measure(args.startup_dir, args.seconds, args.acquiring)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,306 @@
+import asyncio
+import inspect
+import math
+import time
+
+from caproto import AlarmSeverity, AlarmStatus
+from caproto.server import PVGroup, pvproperty
+
+from .clock import clock_of
+
+SCAN_POLICY_KEYS = ("period", "deadband", "rel_deadband", "max_rate")
+
+
+class ScanJob:
+    """
+    A periodic PV update owned by the TickScheduler.
+
+    ``func`` computes the new value, and may be a plain function or a
+    coroutine function. ``owner`` is the device the job belongs to.
+
+    A new value is only written if it differs from the last written value by
+    more than ``deadband``, or ``rel_deadband`` times its magnitude, and at
+    most ``max_rate`` times per second (0 for no limit).
+    """
+
+    def __init__(self, instance, func, period, owner=None):
+        self.instance = instance
+        self.func = func
+        self.period = period
+        self.owner = owner
+        self.is_async = inspect.iscoroutinefunction(func)
+        self.deadband = 0.0
+        self.rel_deadband = 0.0
+        self.max_rate = 0.0
+        self._last_value = None
+        self._last_write = -math.inf
+
+    async def compute(self):
+        if self.is_async:
+            return await self.func()
+        return self.func()
+
+    def should_write(self, value, now):
+        last = self._last_value
+        if last is not None:
+            if abs(value - last) <= max(self.deadband, self.rel_deadband * abs(last)):
+                return False
+            if self.max_rate and now - self._last_write < 1.0 / self.max_rate:
+                return False
+        self._last_value = value
+        self._last_write = now
+        return True
+
+
+async def _scan_failed(instance):
+    instance.log.exception("Scan exception")
+    await instance.alarm.write(
+        status=AlarmStatus.SCAN, severity=AlarmSeverity.MAJOR_ALARM
+    )
+
+
+async def _scan_recovered(instance):
+    alarm = instance.alarm
+    if (alarm.severity, alarm.status) == (
+        AlarmSeverity.MAJOR_ALARM,
+        AlarmStatus.SCAN,
+    ):
+        await alarm.write(status=AlarmStatus.NO_ALARM, severity=AlarmSeverity.NO_ALARM)
+
+
+class _RateClass:
+    def __init__(self, period, deadline):
+        self.period = period
+        self.deadline = deadline
+        self.jobs = []
+
+
+class TickScheduler(PVGroup):
+    """
+    Runs all periodic PV updates of the simulation from a single task.
+
+    Jobs are grouped into rate classes by period. Deadlines are aligned to
+    multiples of the period, so classes whose periods divide each other wake
+    up together. On each tick the values of every due job are computed first
+    and then written in one batch, so all PVs of a tick see the same beam
+    state. A job that raises is logged and its PV put in a SCAN alarm, as
+    caproto's own scan loops do, without stopping the other jobs; the alarm
+    clears on its next good update. TICK_RATE, BUSY, LATENCY and TICK_TIME
+    report the scheduling overhead, updated every ``stats_period`` seconds.
+    Deadlines, latency and TICK_RATE are in simulation time; BUSY and
+    TICK_TIME in real time.
+    """
+
+    TICKS = pvproperty(value=0, read_only=True, doc="Scheduler ticks")
+    JOBS = pvproperty(value=0, read_only=True, doc="Scheduled jobs")
+    TICK_RATE = pvproperty(value=0.0, read_only=True, doc="Ticks per second")
+    BUSY = pvproperty(
+        value=0.0, read_only=True, doc="Fraction of wall time spent in ticks"
+    )
+    LATENCY = pvproperty(
+        value=0.0, read_only=True, doc="Mean wakeup latency (ms)", precision=3
+    )
+    TICK_TIME = pvproperty(
+        value=0.0, read_only=True, doc="Mean time per tick (ms)", precision=3
+    )
+    SUPPRESSED = pvproperty(
+        value=0.0, read_only=True, doc="Fraction of updates suppressed"
+    )
+
+    stats_period = 1.0
+
+    def __init__(self, prefix, parent=None, **kwargs):
+        super().__init__(prefix, parent=parent)
+        self.clock = clock_of(parent)
+        self.rate_classes = {}
+        self.jobs = []
+        self._changed = asyncio.Event()
+        self.ticks = 0
+        self._busy = 0.0
+        self._latency = 0.0
+        self._window_ticks = 0
+        self._computed = 0
+        self._suppressed = 0
+
+    def add(self, instance, func, period, owner=None):
+        """Schedule ``instance.write(func())`` every ``period`` seconds."""
+        job = ScanJob(instance, func, period, owner)
+        self.jobs.append(job)
+        self._add_to_rate_class(job)
+        return job
+
+    def remove(self, job):
+        self.jobs.remove(job)
+        self.rate_classes[job.period].jobs.remove(job)
+
+    def reschedule(self, job, period):
+        """Move ``job`` to the rate class of ``period``."""
+        self.rate_classes[job.period].jobs.remove(job)
+        job.period = period
+        self._add_to_rate_class(job)
+
+    def configure(self, owner, policy):
+        """Apply a scan policy from ``resolve_scan_policies`` to ``owner``."""
+        for job in [job for job in self.jobs if job.owner is owner]:
+            job.deadband = policy.get("deadband", job.deadband)
+            job.rel_deadband = policy.get("rel_deadband", job.rel_deadband)
+            job.max_rate = policy.get("max_rate", job.max_rate)
+            period = policy.get("period", job.period)
+            if period != job.period:
+                self.reschedule(job, period)
+
+    def _add_to_rate_class(self, job):
+        rate_class = self.rate_classes.get(job.period)
+        if rate_class is None:
+            deadline = math.ceil(self.clock.monotonic() / job.period) * job.period
+            rate_class = _RateClass(job.period, deadline)
+            self.rate_classes[job.period] = rate_class
+        rate_class.jobs.append(job)
+        self._changed.set()
+
+    async def tick(self, now):
+        """Run every rate class that is due at ``now``."""
+        due = [rc for rc in self.rate_classes.values() if rc.deadline <= now]
+        values = []
+        for rate_class in due:
+            for job in rate_class.jobs:
+                try:
+                    values.append((job, await job.compute()))
+                except Exception:
+                    await _scan_failed(job.instance)
+            rate_class.deadline += rate_class.period
+            if rate_class.deadline <= now:
+                # Fell a whole period behind; skip the missed ticks.
+                rate_class.deadline = (
+                    math.floor(now / rate_class.period) + 1
+                ) * rate_class.period
+        self._computed += len(values)
+        for job, value in values:
+            try:
+                if job.should_write(value, now):
+                    await job.instance.write(value)
+                else:
+                    self._suppressed += 1
+            except Exception:
+                await _scan_failed(job.instance)
+            else:
+                await _scan_recovered(job.instance)
+        self.ticks += 1
+
+    @TICKS.startup
+    async def TICKS(self, instance, async_lib):
+        clock = self.clock
+        last_stats = clock.monotonic()
+        last_real = time.perf_counter()
+        while True:
+            self._changed.clear()
+            now = clock.monotonic()
+            classes = [rc for rc in self.rate_classes.values() if rc.jobs]
+            next_stats = last_stats + self.stats_period
+            deadline = min([rc.deadline for rc in classes] + [next_stats])
+            if deadline > now:
+                try:
+                    await clock.wait_for(self._changed.wait(), deadline - now)
+                except asyncio.TimeoutError:
+                    pass
+                else:
+                    continue
+            start = clock.monotonic()
+            due = [rc.deadline for rc in classes if rc.deadline <= start]
+            if due:
+                self._latency += start - min(due)
+                real_start = time.perf_counter()
+                await self.tick(start)
+                self._window_ticks += 1
+                self._busy += time.perf_counter() - real_start
+            if start >= next_stats:
+                real = time.perf_counter()
+                await self._publish_stats(start - last_stats, real - last_real)
+                last_stats = start
+                last_real = real
+
+    async def _publish_stats(self, elapsed, real_elapsed):
+        n = self._window_ticks
+        await self.TICKS.write(self.ticks)
+        await self.JOBS.write(len(self.jobs))
+        await self.TICK_RATE.write(n / elapsed)
+        await self.BUSY.write(self._busy / real_elapsed)
+        await self.LATENCY.write(1e3 * self._latency / n if n else 0.0)
+        await self.TICK_TIME.write(1e3 * self._busy / n if n else 0.0)
+        if self._computed:
+            await self.SUPPRESSED.write(self._suppressed / self._computed)
+        self._computed = 0
+        self._suppressed = 0
+        self._busy = 0.0
+        self._latency = 0.0
+        self._window_ticks = 0
+
+
+def scheduler_of(parent):
+    """The TickScheduler of the nearest ancestor that has one, else None."""
+    while parent is not None:
+        scheduler = getattr(parent, "scheduler", None)
+        if isinstance(scheduler, TickScheduler):
+            return scheduler
+        parent = getattr(parent, "parent", None)
+    return None
+
+
+async def scan_loop(instance, func, period, clock):
+    """
+    Write ``func()`` to ``instance`` every ``period`` seconds from its own
+    task, for devices built without a TickScheduler. Failures are reported
+    as the scheduler reports them.
+    """
+    job = ScanJob(instance, func, period)
+    while True:
+        try:
+            await instance.write(await job.compute())
+        except Exception:
+            await _scan_failed(instance)
+        else:
+            await _scan_recovered(instance)
+        await clock.sleep(period)
+
+
+def resolve_scan_policies(scan, groups, roles, device_config):
+    """
+    Merge the ``[scan]`` table of sim_conf.toml into one policy per device.
+
+    Later layers override earlier ones: ``scan.defaults``, then
+    ``scan.groups.<group>`` and ``scan.roles.<role>`` for every group and
+    role of the device, then ``scan.devices.<key>`` and finally the device's
+    own ``_scan`` table. Each layer may set period, deadband, rel_deadband
+    and max_rate.
+
+    Returns
+    -------
+    dict
+        ``{device_key: policy}`` for every device with a non-empty policy.
+    """
+    scan = scan or {}
+    device_groups = {}
+    for group, keys in groups.items():
+        for key in keys:
+            device_groups.setdefault(key, []).append(group)
+    device_roles = {}
+    for role, key in roles.items():
+        device_roles.setdefault(key, []).append(role)
+
+    policies = {}
+    for key, info in device_config.items():
+        if not isinstance(info, dict):
+            continue
+        policy = dict(scan.get("defaults", {}))
+        for group in device_groups.get(key, []):
+            policy.update(scan.get("groups", {}).get(group, {}))
+        for role in device_roles.get(key, []):
+            policy.update(scan.get("roles", {}).get(role, {}))
+        policy.update(scan.get("devices", {}).get(key, {}))
+        policy.update(info.get("_scan", {}))
+        unknown = set(policy) - set(SCAN_POLICY_KEYS)
+        if unknown:
+            raise ValueError(f"Unknown scan settings for {key}: {sorted(unknown)}")
+        if policy:
+            policies[key] = policy
+    return policies
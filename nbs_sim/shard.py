@@ -0,0 +1,490 @@
+"""
+Running one simulation as several IOC processes.
+
+``partition_config`` splits the device config into shards. Shard 0 hosts
+the devices that feed the beam physics (source, manipulators, shutters,
+slits and everything else that is not a detector), and the detectors are
+spread over the other shards, unless a ``[shards]`` table in sim_conf.toml
+assigns groups or devices explicitly::
+
+    [shards]
+    detectors = 1
+    tes = 2
+
+Every process builds a Beamline from its own part of the config, with a
+ShardLink to a shared-memory segment. Each shard publishes the beam inputs
+of the devices it hosts there once per tick, and shards that do not host
+the energy, primary manipulator or transmission devices read them through
+proxies, so the beam state code is the same in every process.
+"""
+
+import multiprocessing
+import signal
+import sys
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
+from caproto.server import PVGroup, pvproperty
+
+from .devices.energy import fly_times, trajectory_energy, SST1MonoMotor
+from .geometry import SampleHolder
+from .resolution import MonoResolution
+from .undulator import UndulatorModel
+
+SHARED_FIELDS = (
+    "transmission",
+    "energy",
+    "undulator",
+    "tracking",
+    "gap",
+    "grating",
+    "cff",
+    "distance",
+    "sample",
+    "traj_t0",
+    "traj_e0",
+    "traj_e1",
+    "traj_velocity",
+    "flights",
+    "fly_t0",
+    "fly_e0",
+    "fly_e1",
+    "fly_velocity",
+    "fly_rate",
+)
+FIELD_INDEX = {name: i + 1 for i, name in enumerate(SHARED_FIELDS)}
+
+
+class SharedBeamInputs:
+    """
+    One row of beam inputs per shard in a shared-memory segment.
+
+    Each row is written by its own shard only, under a seqlock: the first
+    element is a sequence number that is odd while the row is being
+    written, so readers retry until they copy a row with the same even
+    number before and after. Readers yield the CPU between retries, and
+    after ``max_retries`` (a writer that died mid-update) fall back to the
+    last row they read consistently, or raise if there is none.
+
+    Parameters
+    ----------
+    nshards : int
+        Number of rows.
+    name : str, optional
+        Name of an existing segment to attach to. A new one is created
+        otherwise, and unlinked by ``close``.
+    max_retries : int
+        Reads of a row before giving up on a consistent copy.
+    """
+
+    def __init__(self, nshards, name=None, max_retries=1000):
+        shape = (nshards, len(SHARED_FIELDS) + 1)
+        size = int(np.prod(shape)) * 8
+        self.owner = name is None
+        self.shm = shared_memory.SharedMemory(name=name, create=self.owner, size=size)
+        self.rows = np.ndarray(shape, dtype=np.float64, buffer=self.shm.buf)
+        if self.owner:
+            self.rows[:] = np.nan
+            self.rows[:, 0] = 0
+        self.name = self.shm.name
+        self.nshards = nshards
+        self.max_retries = max_retries
+        self._last_good = {}
+
+    def publish(self, shard, values):
+        row = self.rows[shard]
+        row[0] += 1
+        row[1:] = values
+        row[0] += 1
+
+    def read(self, shard):
+        row = self.rows[shard]
+        for attempt in range(self.max_retries):
+            seq = row[0]
+            if seq % 2 == 0:
+                values = row[1:].copy()
+                if row[0] == seq:
+                    self._last_good[shard] = values
+                    return values
+            if attempt:
+                time.sleep(0)
+        values = self._last_good.get(shard)
+        if values is None:
+            raise RuntimeError(f"Shard {shard} beam inputs are stuck mid-update")
+        return values.copy()
+
+    def close(self):
+        self.rows = None
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+def exit_on_signals(signals=(signal.SIGTERM, signal.SIGHUP)):
+    """
+    Turn ``signals`` into SystemExit, so that ``finally`` blocks run and the
+    shared-memory segment is unlinked when the process is terminated.
+    """
+
+    def handler(signum, frame):
+        sys.exit(128 + signum)
+
+    for signum in signals:
+        signal.signal(signum, handler)
+
+
+def partition_config(config, nshards, assignments=None):
+    """
+    Split ``config`` into ``nshards`` device configs.
+
+    ``assignments`` maps device keys or group names to shard indices; a
+    device key takes precedence over its groups. Unassigned detectors are
+    spread round-robin over shards 1 and up, and all other unassigned
+    devices go to shard 0. Entries that are not device tables are copied
+    into every shard.
+    """
+    assignments = assignments or {}
+    shards = [{} for _ in range(nshards)]
+    next_detector = 0
+    for key, info in config.items():
+        if not isinstance(info, dict):
+            for shard in shards:
+                shard[key] = info
+            continue
+        groups = info.get("_group", [])
+        if isinstance(groups, str):
+            groups = [groups]
+        index = assignments.get(key)
+        if index is None:
+            index = next((assignments[g] for g in groups if g in assignments), None)
+        if index is None:
+            if "detectors" in groups and nshards > 1:
+                index = 1 + next_detector % (nshards - 1)
+                next_detector += 1
+            else:
+                index = 0
+        if not 0 <= index < nshards:
+            raise ValueError(f"Shard {index} of {key} is not in 0..{nshards - 1}")
+        shards[index][key] = info
+    return shards
+
+
+def _role_device(config, role):
+    for key, info in config.items():
+        if isinstance(info, dict) and info.get("_role") == role:
+            return key, info
+    return None, None
+
+
+class ShardLink:
+    """
+    A Beamline's view of the shared beam inputs.
+
+    Parameters
+    ----------
+    shared : SharedBeamInputs
+    index : int
+        This shard.
+    config : dict
+        The full, unpartitioned device config, used to find which shard
+        hosts each role and to build the proxies.
+    shard_configs : list of dict
+        The partition of ``config``.
+    """
+
+    def __init__(self, shared, index, config, shard_configs):
+        self.shared = shared
+        self.index = index
+        self.config = config
+        self.shard_configs = shard_configs
+        self.beamline = None
+        self._seen_flights = {}
+        self._sample_indices = {}
+
+    def owner(self, key):
+        for index, shard_config in enumerate(self.shard_configs):
+            if key in shard_config:
+                return index
+        return None
+
+    def read(self, shard, name):
+        return self.shared.read(shard)[FIELD_INDEX[name] - 1]
+
+    def attach(self, beamline):
+        """Install proxies on ``beamline`` for roles hosted by other shards."""
+        self.beamline = beamline
+        key, info = _role_device(self.config, "energy")
+        if beamline.energy is None and key is not None:
+            beamline.energy = RemoteEnergy(self, self.owner(key), info)
+        key, info = _role_device(self.config, "primary_manipulator")
+        if beamline.primary_manipulator is None and key is not None:
+            beamline.primary_manipulator = RemoteManipulator(
+                self, self.owner(key), info
+            )
+        manipulator = beamline.primary_manipulator
+        if manipulator is not None and not isinstance(manipulator, RemoteManipulator):
+            self._sample_indices = {
+                sample: index
+                for index, sample in enumerate(sample_order(manipulator.holder))
+            }
+        for shard in range(self.shared.nshards):
+            if shard != self.index:
+                beamline._polled_transmission.append(RemoteTransmission(self, shard))
+        self.status = ShardStatus(
+            f"{beamline.prefix}SHARD{self.index}:", link=self, parent=beamline
+        )
+        beamline.pvdb.update(self.status.pvdb)
+
+    def local_inputs(self):
+        """The beam inputs of the devices hosted by this shard."""
+        beamline = self.beamline
+        values = np.full(len(SHARED_FIELDS), np.nan)
+
+        def put(name, value):
+            values[FIELD_INDEX[name] - 1] = value
+
+        transmission = beamline.transmission_product.value
+        for device in beamline._polled_transmission:
+            if not isinstance(device, RemoteTransmission):
+                transmission *= device.transmission.value
+        put("transmission", transmission)
+        energy = beamline.energy
+        if energy is not None and not isinstance(energy, RemoteEnergy):
+            put("energy", energy.value)
+            put("undulator", beamline.undulator_factor())
+            if getattr(energy, "undulator", None) is not None:
+                put("tracking", energy.tracking.value)
+                put("gap", energy.gap_readback)
+            if hasattr(energy, "mono_setting"):
+                grating, cff = energy.mono_setting()
+                put("grating", grating)
+                put("cff", cff)
+            trajectory = getattr(energy, "trajectory", None)
+            if trajectory is not None:
+                for name, value in zip(
+                    ("traj_t0", "traj_e0", "traj_e1", "traj_velocity"), trajectory
+                ):
+                    put(name, value)
+            motor = getattr(getattr(energy, "mono", None), "mono", None)
+            if isinstance(motor, SST1MonoMotor):
+                put("flights", motor.flights)
+                if motor.last_fly is not None:
+                    for name, value in zip(
+                        ("fly_t0", "fly_e0", "fly_e1", "fly_velocity", "fly_rate"),
+                        motor.last_fly,
+                    ):
+                        put(name, value)
+        manipulator = beamline.primary_manipulator
+        if manipulator is not None and not isinstance(manipulator, RemoteManipulator):
+            dist, sample = beamline.beam_target()
+            put("distance", dist)
+            put("sample", -1 if sample is None else self._sample_indices[sample])
+        return values
+
+    def publish(self):
+        self.shared.publish(self.index, self.local_inputs())
+
+    async def replay_flies(self):
+        """Record flies of a remote mono on the detectors of this shard."""
+        energy = self.beamline.energy
+        if not isinstance(energy, RemoteEnergy):
+            return
+        row = self.shared.read(energy.shard)
+        flights = row[FIELD_INDEX["flights"] - 1]
+        seen = self._seen_flights.get(energy.shard)
+        self._seen_flights[energy.shard] = flights
+        if seen is None or np.isnan(flights) or flights == seen:
+            return
+        t0, e0, e1, velocity, rate = (
+            row[FIELD_INDEX[name] - 1]
+            for name in ("fly_t0", "fly_e0", "fly_e1", "fly_velocity", "fly_rate")
+        )
+        duration = abs(e1 - e0) / velocity if velocity > 0 else 0.0
+        times = fly_times(t0, duration, rate, SST1MonoMotor.MAXPOINTS)
+        energies = trajectory_energy((t0, e0, e1, velocity), times)
+        await self.beamline.record_fly(times, energies)
+
+
+def sample_order(holder):
+    """Sample ids of ``holder`` in the order their shared indices refer to."""
+    return sorted(holder.sample_info)
+
+
+class RemoteTransmission:
+    """The transmission product of the devices hosted by another shard."""
+
+    def __init__(self, link, shard):
+        self.link = link
+        self.shard = shard
+
+    @property
+    def transmission(self):
+        return self
+
+    @property
+    def value(self):
+        value = self.link.read(self.shard, "transmission")
+        return 1.0 if np.isnan(value) else value
+
+
+class RemoteEnergy:
+    """
+    Stands in for the energy device of another shard.
+
+    With an ``undulator`` table in the device config the proxy builds the
+    same UndulatorModel, so fly traces get the tracked flux, or the flux at
+    the published gap, just as on the shard that hosts the mono.
+    """
+
+    def __init__(self, link, shard, info):
+        self.link = link
+        self.shard = shard
+        resolution = info.get("resolution")
+        self.resolution = None if resolution is None else MonoResolution(**resolution)
+        self.undulator = None
+        undulator = info.get("undulator")
+        if undulator is not None:
+            undulator = {k: v for k, v in undulator.items() if k != "gap_velocity"}
+            self.undulator = UndulatorModel(**undulator)
+
+    def _row(self):
+        return self.link.shared.read(self.shard)
+
+    def _get(self, row, name):
+        return row[FIELD_INDEX[name] - 1]
+
+    @property
+    def value(self):
+        return self._get(self._row(), "energy")
+
+    @property
+    def trajectory(self):
+        row = self._row()
+        trajectory = tuple(
+            self._get(row, name)
+            for name in ("traj_t0", "traj_e0", "traj_e1", "traj_velocity")
+        )
+        return None if np.isnan(trajectory[0]) else trajectory
+
+    def energy_at(self, times):
+        trajectory = self.trajectory
+        if trajectory is None:
+            return np.full(np.shape(times), self.value, dtype=float)
+        return trajectory_energy(trajectory, times)
+
+    def mono_setting(self):
+        row = self._row()
+        return int(self._get(row, "grating")), self._get(row, "cff")
+
+    def resolving_power(self, setting=None):
+        if self.resolution is None:
+            return None
+        if setting is None:
+            setting = self.mono_setting()
+        return self.resolution.resolving_power(*setting)
+
+    def flux_factor(self, energy=None):
+        row = self._row()
+        if energy is None or self.undulator is None:
+            value = self._get(row, "undulator")
+            return 1.0 if np.isnan(value) else value
+        return self.undulator.flux_factor(energy, self._get(row, "gap"))
+
+    def flux_trace(self, energies):
+        if self.undulator is None:
+            return np.ones(np.shape(energies))
+        row = self._row()
+        if self._get(row, "tracking"):
+            return self.undulator.tracked_flux.evaluate(energies)
+        return self.undulator.flux_factor(energies, self._get(row, "gap"))
+
+
+class RemoteManipulator:
+    """Stands in for the primary manipulator of another shard."""
+
+    def __init__(self, link, shard, info):
+        self.link = link
+        self.shard = shard
+        self.holder = SampleHolder.from_config(
+            holder=info.get("holder"),
+            faces=info.get("faces"),
+            samples=info.get("samples"),
+            sample_file=info.get("sample_file"),
+        )
+        self._samples = sample_order(self.holder)
+
+    def beam_target(self):
+        row = self.link.shared.read(self.shard)
+        dist = row[FIELD_INDEX["distance"] - 1]
+        index = row[FIELD_INDEX["sample"] - 1]
+        sample = None if np.isnan(index) or index < 0 else self._samples[int(index)]
+        return (0.0 if np.isnan(dist) else dist), sample
+
+    def distance_to_beam(self):
+        return self.beam_target()[0]
+
+    def sample_info(self, sample):
+        return self.holder.sample_info.get(sample, {})
+
+
+class ShardStatus(PVGroup):
+    """Publishes this shard's beam inputs every tick of the beamline."""
+
+    PUBLISHED = pvproperty(
+        value=0, read_only=True, doc="Beam input updates published by this shard"
+    )
+
+    def __init__(self, prefix, link, parent=None, **kwargs):
+        super().__init__(prefix, parent=parent)
+        self.link = link
+
+    @PUBLISHED.startup
+    async def PUBLISHED(self, instance, async_lib):
+        beamline = self.link.beamline
+        clock = beamline.clock
+        count = 0
+        while True:
+            self.link.publish()
+            await self.link.replay_flies()
+            count += 1
+            if count % 20 == 0:
+                await instance.write(count)
+            await clock.sleep(beamline.tick_period)
+
+
+def run_shard(index, shm_name, nshards, config, shard_configs, options):
+    """Entry point of a worker process: build and serve one shard."""
+    from caproto.server import run
+    from .beamline import Beamline
+    from .clock import SimClock
+
+    exit_on_signals()
+    shared = SharedBeamInputs(nshards, name=shm_name)
+    link = ShardLink(shared, index, config, shard_configs)
+    start, real_origin = options.pop("clock_origin")
+    clock = SimClock(
+        time_scale=options.pop("time_scale"), start=start, real_origin=real_origin
+    )
+    run_options = options.pop("run_options")
+    ioc = Beamline(config=shard_configs[index], clock=clock, shard=link, **options)
+    try:
+        run(ioc.pvdb, **run_options)
+    finally:
+        shared.close()
+
+
+def start_workers(shared, config, shard_configs, options):
+    """Start one process for every shard but 0, which the caller serves."""
+    context = multiprocessing.get_context("spawn")
+    workers = []
+    for index in range(1, len(shard_configs)):
+        worker = context.Process(
+            target=run_shard,
+            args=(index, shared.name, shared.nshards, config, shard_configs, dict(options)),
+            name=f"nbs-sim-shard{index}",
+            daemon=True,
+        )
+        worker.start()
+        workers.append(worker)
+    return workers
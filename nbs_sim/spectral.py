@@ -0,0 +1,132 @@
+import warnings
+from functools import cached_property
+
+import numpy as np
+
+# Tables up to this many points keep a list copy of their values for scalar
+# lookups; the default all_edges and all_ref tables have about 288k. Larger
+# ones index the array so that they are not loaded into memory as Python
+# floats.
+LIST_LOOKUP_MAX = 2**20
+
+
+class SpectralTable:
+    """
+    A spectrum tabulated on a dense, uniform energy grid.
+
+    Lookups use linear interpolation between grid points, so a scalar read is
+    a couple of list accesses (array accesses for tables over
+    LIST_LOOKUP_MAX points) and a batch read over a whole trajectory is a
+    single vectorized array operation. Energies outside the grid are clamped
+    to the end values, and NaN energies give NaN.
+
+    Parameters
+    ----------
+    x0 : float
+        Energy of the first grid point.
+    step : float
+        Grid spacing.
+    values : array-like
+        Spectrum values on the grid.
+    max_error : float, optional
+        Interpolation error bound the table was built to.
+    """
+
+    def __init__(self, x0, step, values, max_error=0.0):
+        self.x0 = float(x0)
+        self.step = float(step)
+        self.values = np.asarray(values, dtype=float)
+        self.max_error = max_error
+        self._inv_step = 1.0 / self.step
+        self._last_index = len(self.values) - 1
+
+    @cached_property
+    def _list(self):
+        # Python floats make scalar lookups much cheaper than indexing numpy
+        # arrays; built on first use, and only for small tables.
+        if len(self.values) > LIST_LOOKUP_MAX:
+            return self.values
+        return self.values.tolist()
+
+    @property
+    def x_max(self):
+        return self.x0 + self.step * self._last_index
+
+    @property
+    def grid(self):
+        return self.x0 + self.step * np.arange(len(self.values))
+
+    @classmethod
+    def from_samples(
+        cls, x, y, resolution=0.05, tolerance=1e-4, max_points=2**22
+    ):
+        """
+        Fit an interpolating spline to ``(x, y)`` once and tabulate it.
+
+        The grid spacing starts at ``resolution`` and is halved until the
+        linear interpolation error at the grid midpoints is below
+        ``tolerance``, or the table would exceed ``max_points``, in which
+        case a RuntimeWarning reports the error reached.
+        """
+        from scipy.interpolate import UnivariateSpline
+
+        spline = UnivariateSpline(x, y, s=0)
+        return cls.from_function(
+            spline, x[0], x[-1], resolution, tolerance, max_points
+        )
+
+    @classmethod
+    def from_function(
+        cls, func, xmin, xmax, resolution=0.05, tolerance=1e-4, max_points=2**22
+    ):
+        step = resolution
+        while True:
+            npts = int(np.ceil((xmax - xmin) / step)) + 1
+            grid = xmin + step * np.arange(npts)
+            values = func(grid)
+            midpoints = func(grid[:-1] + 0.5 * step)
+            error = np.max(np.abs(midpoints - 0.5 * (values[:-1] + values[1:])))
+            if error <= tolerance or 2 * npts > max_points:
+                break
+            step *= 0.5
+        if error > tolerance:
+            warnings.warn(
+                f"SpectralTable reached a midpoint error of {error:.3g} at "
+                f"{npts} points, above the tolerance of {tolerance:.3g}; "
+                f"raise max_points or the tolerance",
+                RuntimeWarning,
+                stacklevel=2,
+            )
+        return cls(xmin, step, values, max_error=float(error))
+
+    def __call__(self, energy):
+        if isinstance(energy, (float, int)) or np.ndim(energy) == 0:
+            return self.scalar(energy)
+        return self.evaluate(energy)
+
+    def scalar(self, energy):
+        u = (energy - self.x0) * self._inv_step
+        if u != u:
+            return float("nan")
+        if u <= 0:
+            return self._list[0]
+        if u >= self._last_index:
+            return self._list[-1]
+        i = int(u)
+        lo = self._list[i]
+        return lo + (self._list[i + 1] - lo) * (u - i)
+
+    def evaluate(self, energies):
+        u = (np.asarray(energies, dtype=float) - self.x0) * self._inv_step
+        nan = np.isnan(u)
+        has_nan = nan.any()
+        if has_nan:
+            u[nan] = 0.0
+        np.clip(u, 0, self._last_index, out=u)
+        i = np.minimum(u.astype(np.intp), self._last_index - 1)
+        u -= i
+        lo = self.values[i]
+        result = lo + (self.values[i + 1] - lo) * u
+        if has_nan:
+            result[nan] = np.nan
+        return result
@@ -0,0 +1,150 @@
+"""
+Memory-mapped database of per-sample spectra.
+
+A database is a directory holding
+
+- ``spectra.npy``: one row per spectrum, ``(nspectra, npoints)``
+- ``index.json``: the grid parameters and the row of each sample id
+
+The spectra array is opened with a read-only memory map, so only the rows
+of samples that are actually hit are paged in. Build one with::
+
+    python -m nbs_sim.spectral_db build DB_DIR sample1=a.npz sample2=b.npz
+"""
+
+import argparse
+import json
+import os
+from collections import OrderedDict
+from os.path import basename, join, splitext
+
+import numpy as np
+
+from .spectral import SpectralTable
+
+
+class SpectralDatabase:
+    """
+    Lazily loaded spectra keyed by sample id.
+
+    Parameters
+    ----------
+    directory : str
+        Database directory.
+    maxsize : int, optional
+        Number of tables kept in the LRU cache.
+    """
+
+    def __init__(self, directory, maxsize=64):
+        self.directory = directory
+        self.maxsize = maxsize
+        with open(join(directory, "index.json")) as f:
+            index = json.load(f)
+        self.x0 = index["x0"]
+        self.step = index["step"]
+        self.rows = index["samples"]
+        self.spectra = np.load(join(directory, "spectra.npy"), mmap_mode="r")
+        self._tables = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __contains__(self, sample):
+        return sample in self.rows
+
+    def __len__(self):
+        return len(self.rows)
+
+    def table(self, sample):
+        """Return the SpectralTable of ``sample``, or None if it has none."""
+        table = self._tables.get(sample)
+        if table is not None:
+            self._tables.move_to_end(sample)
+            self.hits += 1
+            return table
+        row = self.rows.get(sample)
+        if row is None:
+            return None
+        self.misses += 1
+        table = SpectralTable(self.x0, self.step, self.spectra[row])
+        self._tables[sample] = table
+        if len(self._tables) > self.maxsize:
+            self._tables.popitem(last=False)
+        return table
+
+    @classmethod
+    def build(cls, directory, spectra, step=0.05, xmin=None, xmax=None, dtype="f8"):
+        """
+        Write a database of ``spectra``, a mapping of sample id to ``(x, y)``.
+
+        Each spectrum is resampled onto the shared grid with an interpolating
+        spline. The grid spans the union of the inputs unless ``xmin`` and
+        ``xmax`` are given; spectra are clamped to their end values outside
+        their own range.
+        """
+        from scipy.interpolate import UnivariateSpline
+
+        spectra = dict(spectra)
+        if xmin is None:
+            xmin = min(np.min(x) for x, _ in spectra.values())
+        if xmax is None:
+            xmax = max(np.max(x) for x, _ in spectra.values())
+        npts = int(np.ceil((xmax - xmin) / step)) + 1
+        energy = xmin + step * np.arange(npts)
+        os.makedirs(directory, exist_ok=True)
+        out = np.lib.format.open_memmap(
+            join(directory, "spectra.npy"),
+            mode="w+",
+            dtype=dtype,
+            shape=(len(spectra), npts),
+        )
+        rows = {}
+        for row, (sample, (x, y)) in enumerate(spectra.items()):
+            x = np.asarray(x, dtype=float)
+            spline = UnivariateSpline(x, y, s=0)
+            out[row] = spline(np.clip(energy, x[0], x[-1]))
+            rows[str(sample)] = row
+        out.flush()
+        del out
+        index = {"x0": float(xmin), "step": float(step), "samples": rows}
+        with open(join(directory, "index.json"), "w") as f:
+            json.dump(index, f, indent=1)
+        return cls(directory)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="nbs-sim spectral database")
+    sub = parser.add_subparsers(dest="command", required=True)
+    build = sub.add_parser("build", help="Build a database from .npz spectra")
+    build.add_argument("directory")
+    build.add_argument(
+        "spectra",
+        nargs="+",
+        help="ID=FILE.npz, or FILE.npz to use the file name as the id. "
+        "Each file holds 'x' and 'y' arrays.",
+    )
+    build.add_argument("--step", type=float, default=0.05, help="Grid spacing (eV)")
+    build.add_argument("--xmin", type=float)
+    build.add_argument("--xmax", type=float)
+    build.add_argument("--float32", action="store_true", help="Store as float32")
+    args = parser.parse_args(argv)
+
+    spectra = {}
+    for item in args.spectra:
+        sample, _, path = item.rpartition("=")
+        if not sample:
+            sample = splitext(basename(path))[0]
+        data = np.load(path)
+        spectra[sample] = (data["x"], data["y"])
+    db = SpectralDatabase.build(
+        args.directory,
+        spectra,
+        step=args.step,
+        xmin=args.xmin,
+        xmax=args.xmax,
+        dtype="f4" if args.float32 else "f8",
+    )
+    print(f"Wrote {len(db)} spectra to {args.directory}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,214 @@
+"""
+Planar undulator model for gap/phase tracking and flux.
+
+The peak field follows Halbach's law ``B0 = a * exp(b * g / period)``, the
+harmonic energies the undulator equation, and the on-axis brightness of
+harmonic ``n`` the Bessel-function factor ``F_n(K)``. Everything that
+depends on more than a table lookup is precomputed on uniform grids when
+the model is built:
+
+- ``gap_tables``: gap versus photon energy for each harmonic
+- ``harmonic_table``: the brightest reachable harmonic for each energy
+- ``tracked_flux``: relative flux versus energy with the gap tracking
+- ``flux_grids``: relative flux of each harmonic on an (energy, detuning)
+  grid, where detuning is the relative offset of the harmonic line from
+  the photon energy, so a flux read is a bilinear lookup per harmonic
+"""
+
+import math
+
+import numpy as np
+from scipy.special import jv
+
+from .spectral import SpectralTable
+
+
+class UndulatorModel:
+    """
+    Parameters
+    ----------
+    period : float
+        Undulator period in mm.
+    nperiods : int
+        Number of periods, which sets the width of each harmonic line.
+    electron_energy : float
+        Storage ring energy in GeV.
+    field : (float, float)
+        Halbach coefficients ``(a, b)`` of the peak field in Tesla.
+    gap_range : (float, float)
+        Minimum and maximum gap in mm.
+    energy_range : (float, float)
+        Photon energy range of the tables in eV.
+    harmonics : sequence of int
+        Harmonics available for tracking.
+    phases : dict, optional
+        Phase motor position (mm) for each polarization mode.
+    energy_spread : float
+        Relative energy spread of the electron beam, which broadens the
+        harmonic lines.
+    energy_step, detuning_step : float
+        Spacing of the flux grids in energy (eV) and relative detuning.
+    """
+
+    def __init__(
+        self,
+        period=60.0,
+        nperiods=33,
+        electron_energy=3.0,
+        field=(2.076, -3.24),
+        gap_range=(16.0, 200.0),
+        energy_range=(100.0, 2500.0),
+        harmonics=(1, 3, 5),
+        phases=None,
+        energy_spread=9e-4,
+        energy_step=2.0,
+        detuning_step=5e-4,
+    ):
+        self.period = period
+        self.nperiods = nperiods
+        self.electron_energy = electron_energy
+        self.field = tuple(field)
+        self.gap_range = tuple(gap_range)
+        self.energy_range = tuple(energy_range)
+        self.harmonics = tuple(harmonics)
+        if phases is None:
+            phases = {0: 0.0, 1: period / 2, 2: period / 4}
+        self.phases = {int(k): float(v) for k, v in phases.items()}
+        self.energy_spread = energy_spread
+        self._build_tracking()
+        self._build_flux_grid(energy_step, detuning_step)
+        energies = self._tracking_energies
+        gaps = np.empty(len(energies))
+        for n, table in self.gap_tables.items():
+            mask = self._harmonics == n
+            gaps[mask] = table.evaluate(energies[mask])
+        self.tracked_flux = SpectralTable(
+            energies[0], energies[1] - energies[0], self.flux_factor(energies, gaps)
+        )
+
+    def k_value(self, gap):
+        a, b = self.field
+        b0 = a * np.exp(b * np.asarray(gap) / self.period)
+        return 0.0934 * self.period * b0
+
+    def harmonic_energy(self, gap, n=1):
+        """Photon energy of harmonic ``n`` at ``gap``."""
+        k = self.k_value(gap)
+        e1 = 9.50 * self.electron_energy**2 / (self.period / 10.0) * 100
+        return n * e1 / (1 + k * k / 2)
+
+    def brightness(self, k, n):
+        """On-axis brightness factor ``F_n(K)`` of a planar undulator."""
+        k2 = k * k
+        xi = n * k2 / (4 + 2 * k2)
+        bessel = jv((n - 1) // 2, xi) - jv((n + 1) // 2, xi)
+        return (n * k / (1 + k2 / 2)) ** 2 * bessel**2
+
+    def _build_tracking(self, step=0.5):
+        gmin, gmax = self.gap_range
+        emin, emax = self.energy_range
+        gaps = np.linspace(gmin, gmax, 4096)
+        e1 = self.harmonic_energy(gaps)
+        energies = np.arange(emin, emax + step, step)
+        self.gap_tables = {}
+        best = np.zeros(len(energies), dtype=int)
+        best_flux = np.zeros(len(energies))
+        for n in self.harmonics:
+            # harmonic_energy increases with gap, so invert by interpolation.
+            gap = np.interp(energies / n, e1, gaps)
+            self.gap_tables[n] = SpectralTable(emin, step, gap)
+            reachable = (energies / n >= e1[0]) & (energies / n <= e1[-1])
+            flux = np.where(reachable, self.brightness(self.k_value(gap), n), 0)
+            better = flux > best_flux
+            best[better] = n
+            best_flux[better] = flux[better]
+        best[best == 0] = self.harmonics[0]
+        self._tracking_energies = energies
+        self._harmonics = best
+        self.harmonic_table = best.tolist()
+        self._harmonic_x0 = emin
+        self._harmonic_inv_step = 1.0 / step
+
+    def _build_flux_grid(self, energy_step, detuning_step, max_detuning=0.05):
+        emin, emax = self.energy_range
+        energies = np.arange(emin, emax + energy_step, energy_step)
+        detuning = np.arange(-max_detuning, max_detuning + detuning_step / 2, detuning_step)
+        e1_min = self.harmonic_energy(self.gap_range[0])
+        e1_max = self.harmonic_energy(np.inf)
+        self.flux_grids = {}
+        for n in self.harmonics:
+            # Harmonic n sits at energy / (1 + detuning); invert the undulator
+            # equation for the K that puts it there.
+            e1 = energies[:, None] / (n * (1 + detuning[None, :]))
+            k = np.sqrt(2 * np.clip(e1_max / e1 - 1, 0, None))
+            width = np.hypot(0.36 / (n * self.nperiods), 2 * self.energy_spread)
+            line = np.exp(-0.5 * (detuning / width) ** 2)
+            grid = self.brightness(k, n) * line[None, :]
+            grid[(e1 < e1_min) | (e1 > e1_max)] = 0
+            self.flux_grids[n] = grid
+        peak = max(grid.max() for grid in self.flux_grids.values())
+        for grid in self.flux_grids.values():
+            grid /= peak
+        self._grid_origin = (emin, -max_detuning)
+        self._grid_step = (energy_step, detuning_step)
+        self._e1_max = float(e1_max)
+
+    def harmonic(self, energy):
+        """Harmonic used to track ``energy``."""
+        i = int((energy - self._harmonic_x0) * self._harmonic_inv_step + 0.5)
+        return self.harmonic_table[min(max(i, 0), len(self.harmonic_table) - 1)]
+
+    def gap(self, energy, harmonic=None):
+        """Gap that tunes ``harmonic`` (default: the tracked one) to ``energy``."""
+        if harmonic is None:
+            harmonic = self.harmonic(energy)
+        return self.gap_tables[harmonic](energy)
+
+    def phase(self, mode):
+        return self.phases.get(int(round(mode)), 0.0)
+
+    def flux_factor(self, energy, gap):
+        """
+        Relative flux at photon ``energy`` with the undulator at ``gap``.
+
+        Each harmonic contributes the bilinear interpolation of its flux grid
+        at the energy and the detuning of the harmonic from it; the largest
+        contribution wins. ``energy`` and ``gap`` may be arrays.
+        """
+        (e0, d0), (de, dd) = self._grid_origin, self._grid_step
+        if np.ndim(energy) or np.ndim(gap):
+            e1 = self.harmonic_energy(gap)
+            energy = np.broadcast_to(np.asarray(energy, dtype=float), np.shape(e1 * energy))
+            factor = np.zeros(energy.shape)
+            for n, grid in self.flux_grids.items():
+                np.maximum(
+                    factor,
+                    _bilinear(grid, (energy - e0) / de, (energy / (n * e1) - 1 - d0) / dd),
+                    out=factor,
+                )
+            return factor
+        a, b = self.field
+        k = 0.0934 * self.period * a * math.exp(b * gap / self.period)
+        e1 = self._e1_max / (1 + k * k / 2)
+        factor = 0.0
+        u = (energy - e0) / de
+        for n, grid in self.flux_grids.items():
+            v = (energy / (n * e1) - 1 - d0) / dd
+            if 0 <= v <= grid.shape[1] - 1:
+                factor = max(factor, float(_bilinear(grid, u, v)))
+        return factor
+
+
+def _bilinear(grid, u, v):
+    """Interpolate ``grid`` at fractional indices ``u, v``; zero outside in v."""
+    nu, nv = grid.shape
+    inside = (v >= 0) & (v <= nv - 1)
+    u = np.clip(u, 0, nu - 1)
+    v = np.clip(v, 0, nv - 1)
+    i = np.minimum(np.asarray(u, dtype=np.intp), nu - 2)
+    j = np.minimum(np.asarray(v, dtype=np.intp), nv - 2)
+    u = u - i
+    v = v - j
+    lo = grid[i, j] + (grid[i, j + 1] - grid[i, j]) * v
+    hi = grid[i + 1, j] + (grid[i + 1, j + 1] - grid[i + 1, j]) * v
+    return np.where(inside, lo + (hi - lo) * u, 0.0)
@@ -7,5 +7,11 @@ setup(
     name="nbs-sim",
     packages=find_packages(),
     package_data={"nbs-sim": ["*.npz"]},
-    entry_points={"console_scripts": ["nbs-sim = nbs_sim.beamline:main"]},
+    entry_points={
+        "console_scripts": [
+            "nbs-sim = nbs_sim.beamline:main",
+            "nbs-sim-pulses = nbs_sim.devices.pulses:main",
+            "nbs-sim-config = nbs_sim.scale:main",
+        ]
+    },
 )
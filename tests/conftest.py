@@ -0,0 +1,39 @@
+import pytest
+
+from nbs_sim.headless import HeadlessSim
+
+ENERGY = {
+    "_target": "nbs_sim.devices.energy.SST1Energy",
+    "_role": "energy",
+    "_group": "source",
+    "prefix": "EN:",
+}
+
+
+@pytest.fixture
+def energy_config():
+    """Make the config of an SST1Energy at EN:, with extra ``options``."""
+
+    def make(**options):
+        return dict(ENERGY, **options)
+
+    return make
+
+
+@pytest.fixture
+def energy_sim(energy_config):
+    """Make an unstarted HeadlessSim of an SST1Energy and ``devices``."""
+
+    def make(devices=None, **options):
+        return HeadlessSim(dict(devices or {}, en=energy_config(**options)), seed=0)
+
+    return make
+
+
+@pytest.fixture(
+    params=[{}, {"undulator": {}}, {"resolution": {}}],
+    ids=["plain", "undulator", "resolution"],
+)
+def energy_options(request):
+    """The energy device options of every opt-in model, one at a time."""
+    return request.param
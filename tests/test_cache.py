@@ -0,0 +1,66 @@
+import numpy as np
+
+from nbs_sim.cache import ModelCache
+
+
+def write_spectrum(path, center=530.0):
+    x = np.linspace(500.0, 560.0, 601)
+    y = np.exp(-0.5 * ((x - center) / 2.0) ** 2)
+    np.savez(path, x=x, y=y)
+
+
+def test_spectral_table_round_trip(tmp_path):
+    spectrum = tmp_path / "edge.npz"
+    write_spectrum(spectrum)
+    cache = ModelCache(tmp_path / "cache")
+    fitted = cache.spectral_table(spectrum, 0.05, 1e-4)
+    loaded = ModelCache(tmp_path / "cache").spectral_table(spectrum, 0.05, 1e-4)
+    assert (cache.hits, cache.misses) == (0, 1)
+    assert not loaded.values.flags.writeable
+    assert (loaded.x0, loaded.step, loaded.max_error) == (
+        fitted.x0,
+        fitted.step,
+        fitted.max_error,
+    )
+    assert np.array_equal(loaded.values, fitted.values)
+    assert loaded(530.123) == fitted(530.123)
+
+
+def test_spectral_table_misses_on_changed_input(tmp_path):
+    spectrum = tmp_path / "edge.npz"
+    write_spectrum(spectrum)
+    cache = ModelCache(tmp_path / "cache")
+    cache.spectral_table(spectrum, 0.05, 1e-4)
+    cache.spectral_table(spectrum, 0.1, 1e-4)
+    write_spectrum(spectrum, center=540.0)
+    table = cache.spectral_table(spectrum, 0.05, 1e-4)
+    assert (cache.hits, cache.misses) == (0, 3)
+    assert table(540.0) > table(530.0)
+
+
+def test_device_config_round_trip(tmp_path):
+    device_file = tmp_path / "devices.toml"
+    config_file = tmp_path / "sim_conf.toml"
+    device_file.write_text('[i0]\n_target = "SSTADC"\nprefix = "I0:"\n')
+    config_file.write_text("")
+    calls = []
+
+    def generate(device_file, config_file):
+        calls.append(device_file)
+        return {
+            "i0": {
+                "_target": "SSTADC",
+                "prefix": "I0:",
+                "limits": [0, 1],
+                "origin": (0.0, 1.0),
+                "gains": {1: 1e6, 2: 1e7},
+            }
+        }
+
+    cache = ModelCache(tmp_path / "cache")
+    first = cache.device_config(device_file, config_file, generate)
+    second = cache.device_config(device_file, config_file, generate)
+    assert second == first
+    assert second["i0"]["origin"] == (0.0, 1.0)
+    assert list(second["i0"]["gains"]) == [1, 2]
+    assert len(calls) == 1 and cache.hits == 1
@@ -0,0 +1,52 @@
+import asyncio
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+from caproto.asyncio.server import AsyncioAsyncLayer
+from caproto.server import PVGroup
+
+from nbs_sim.devices.detectors import SSTBufferedADC
+
+
+class Source(PVGroup):
+    def beam_trace(self, times):
+        return SimpleNamespace(intensity=2.0 + np.asarray(times) - times[0])
+
+
+def test_buffer_times_and_values():
+    adc = SSTBufferedADC("ADC:", kind="i0", parent=Source("P:"))
+    adc.sigma = 0.0
+    values, times = adc.acquire_buffer(10.0, 11.0)
+    assert len(values) == adc.nsamples == 1000
+    assert np.allclose(np.diff(times), 0.001) and times[0] == 10.0
+    assert np.allclose(values, 2.0 + times - 10.0)
+
+
+async def buffered(frames, count_time, sample_rate):
+    adc = SSTBufferedADC("ADC:", kind="i0", parent=Source("P:"))
+    await adc.SAMPLE_RATE.write(sample_rate)
+    await adc.COUNT_TIME.write(count_time)
+    for value in (0, -1.0):
+        with pytest.raises(ValueError):
+            await adc.COUNT_TIME.write(value)
+    task = asyncio.ensure_future(adc.ACQUIRE.server_startup(AsyncioAsyncLayer()))
+    await asyncio.sleep(0)
+    await adc.ACQUIRE.write(frames)
+    for _ in range(100):
+        await asyncio.sleep(count_time)
+        if adc.ACQUIRE.value == 0:
+            break
+    task.cancel()
+    await asyncio.gather(task, return_exceptions=True)
+    return adc
+
+
+def test_buffered_acquisition():
+    adc = asyncio.run(buffered(2, 0.05, 400.0))
+    assert adc.ACQUIRE.value == 0
+    assert adc.NSAMPLES.value == 20
+    assert len(adc.BUFFER.value) == len(adc.TIMESTAMPS.value) == 20
+    assert np.allclose(np.diff(adc.TIMESTAMPS.value), 0.05 / 20, atol=1e-6)
+    assert adc.MEAN.value == pytest.approx(np.mean(adc.BUFFER.value))
+    assert adc.STD.value == pytest.approx(np.std(adc.BUFFER.value))
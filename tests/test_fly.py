@@ -0,0 +1,66 @@
+import asyncio
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from nbs_sim.devices.energy import fly_times, trajectory_energy
+from nbs_sim.headless import HeadlessSim
+
+MCA = {"_target": "nbs_sim.devices.caproto_mca.MCASIM", "_group": "detectors", "prefix": "MCA:"}
+
+
+def test_fly_times_cover_the_move():
+    times = fly_times(10.0, 2.05, 10.0, 10000)
+    assert times[0] == 10.0 and times[-1] == pytest.approx(12.05)
+    assert np.allclose(np.diff(times)[:-1], 0.1)
+    energies = trajectory_energy((10.0, 500.0, 541.0, 20.0), times)
+    assert energies[0] == 500.0 and energies[-1] == pytest.approx(541.0)
+
+
+async def record(times):
+    async with HeadlessSim({"mca": MCA}, seed=0) as sim:
+        trace = SimpleNamespace(
+            timestamp=times,
+            energy=np.full(len(times), 530.0),
+            sample_overlap=np.ones(len(times)),
+            intensity=np.full(len(times), 1e4),
+            sample_yield=np.ones(len(times)),
+        )
+        await sim.devices["mca"].record_fly(trace)
+        return sim.get("MCA:FLY_COUNTS")
+
+
+def test_last_fly_point_has_counts():
+    counts = asyncio.run(record(np.arange(20) * 0.1))
+    assert len(counts) == 20
+    assert counts[-1] > 0
+    assert abs(counts[-1] - counts[:-1].mean()) < 5 * np.sqrt(counts[:-1].mean())
+
+
+def test_single_point_fly():
+    counts = asyncio.run(record(np.zeros(1)))
+    assert list(counts) == [0]
+
+
+async def bad_rate(sim):
+    async with sim:
+        with pytest.raises(ValueError):
+            await sim.put("EN:MonoMtr:FLY_RATE", 0)
+        return sim.get("EN:MonoMtr:FLY_RATE")
+
+
+def test_fly_rate_must_be_positive(energy_sim, energy_options):
+    assert asyncio.run(bad_rate(energy_sim(**energy_options))) == 20.0
+
+
+async def bad_velocity(sim):
+    async with sim:
+        for value in (0, -10.0):
+            with pytest.raises(ValueError):
+                await sim.put("EN:MonoMtr:ENERGY_VELO", value)
+        return sim.get("EN:MonoMtr:ENERGY_VELO")
+
+
+def test_fly_velocity_must_be_positive(energy_sim, energy_options):
+    assert asyncio.run(bad_velocity(energy_sim(**energy_options))) == 200.0
@@ -0,0 +1,70 @@
+import numpy as np
+import pytest
+
+from nbs_sim.devices.manipulator import Manipulator
+from nbs_sim.geometry import GridIndex, SampleHolder, polygon_edges, signed_distance
+
+
+def random_positions(n, seed=0):
+    rng = np.random.default_rng(seed)
+    return np.column_stack(
+        [
+            rng.uniform(-40, 40, n),
+            np.zeros(n),
+            rng.uniform(-80, 300, n),
+            rng.uniform(-180, 180, n),
+        ]
+    )
+
+
+def reference_distance(position):
+    return min(panel.distance_to_beam(*position) for panel in Manipulator.geometry)
+
+
+def test_distances_match_nbs_bl():
+    positions = random_positions(200)
+    reference = np.array([reference_distance(p) for p in positions])
+    faces = Manipulator.faces
+    assert np.allclose(faces.batch_distance_to_beam(positions), reference)
+    assert np.allclose([faces.distance_to_beam(*p) for p in positions], reference)
+
+
+def test_manipulator_distance_matches_nbs_bl():
+    manipulator = Manipulator("MANIP:")
+    distance, sample = manipulator.beam_target()
+    position = np.zeros(4) - Manipulator.origin
+    assert distance == pytest.approx(reference_distance(position))
+    assert sample is None
+    positions = random_positions(50, seed=1) + Manipulator.origin
+    expected = [reference_distance(p) for p in positions - Manipulator.origin]
+    assert np.allclose(manipulator.batch_distance_to_beam(positions), expected)
+
+
+def test_grid_index_finds_every_polygon_in_reach():
+    rng = np.random.default_rng(2)
+    centers = rng.uniform(-50, 50, (300, 2))
+    half = rng.uniform(0.5, 5.0, (300, 1))
+    px = centers[:, :1] + half * np.array([-1, 1, 1, -1])
+    pz = centers[:, 1:] + half * np.array([-1, -1, 1, 1])
+    index = GridIndex(px, pz, reach=2.0)
+    edges = polygon_edges(px, pz)
+    for qx, qz in rng.uniform(-60, 60, (500, 2)):
+        near = np.flatnonzero(signed_distance(edges, qx, qz) <= 2.0)
+        assert set(near) <= set(index.candidates(qx, qz))
+
+
+def test_sample_under_the_beam():
+    # Two samples facing each other on opposite sides of a square bar, at
+    # the same height and across the bar from each other.
+    holder = SampleHolder.from_config(
+        samples={
+            "a": {"position": {"side": 1, "coordinates": [5, 10, 15, 20]}},
+            "c": {"position": {"side": 3, "coordinates": [9.5, 10, 19.5, 20]}},
+        }
+    )
+    assert holder.beam_target(-2.25, 0, -200, 90)[1] == "a"
+    assert holder.beam_target(2.25, 0, -200, 270)[1] == "c"
+    # On the bar but off the samples: below them, and with the bare sides
+    # facing the beam.
+    assert holder.beam_target(-2.25, 0, -150, 90) == pytest.approx((-10.0, None))
+    assert holder.beam_target(-2.25, 0, -200, 0) == pytest.approx((-10.0, None))
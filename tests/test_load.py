@@ -0,0 +1,63 @@
+import pytest
+from caproto.server import PVGroup, pvproperty
+
+from nbs_sim.load import PVCollector, createIOCDevice, split_deferred
+
+
+class Mutating(PVGroup):
+    value = pvproperty(value=0.0)
+
+    def __init__(self, prefix, limits, options, parent=None):
+        super().__init__(prefix, parent=parent)
+        limits.append(99)
+        options["seen"] = True
+        options["nested"]["x"] = 1
+
+
+def Parent():
+    return PVGroup("P:")
+
+
+def test_devices_cannot_modify_the_config():
+    info = {
+        "_target": "ignored",
+        "_group": "misc",
+        "prefix": "A:",
+        "limits": [0, 1],
+        "options": {"nested": {}},
+    }
+    parent = Parent()
+    createIOCDevice("a", info, cls=Mutating, parent=parent)
+    assert info["limits"] == [0, 1]
+    assert info["options"] == {"nested": {}}
+    assert "_target" in info and "prefix" in info
+    assert "A:value" in parent.pvdb
+
+
+def test_duplicate_pvs_are_reported():
+    parent = Parent()
+    info = {"prefix": "A:", "limits": [], "options": {"nested": {}}}
+    createIOCDevice("a", info, cls=Mutating, parent=parent)
+    collector = PVCollector()
+    collector.add("b", {"B:value": 1, "A:value": 2})
+    collector.add("c", {"B:value": 3})
+    with pytest.raises(ValueError) as excinfo:
+        collector.merge_into(parent.pvdb)
+    assert "'A:value': ['<existing>', 'b']" in str(excinfo.value)
+    assert "'B:value': ['b', 'c']" in str(excinfo.value)
+    assert list(parent.pvdb) == ["A:value"]
+
+
+def test_split_deferred():
+    config = {
+        "a": {"_group": "detectors"},
+        "b": {"_group": ["vacuum", "misc"]},
+        "c": {"_group": "motors", "_defer_loading": True},
+        "loaders": {"x": "y"},
+        "name": "beamline",
+    }
+    eager, deferred = split_deferred(config, ["vacuum"])
+    assert sorted(eager) == ["a", "loaders", "name"]
+    assert sorted(deferred) == ["b", "c"]
+    assert deferred["c"]["_defer_loading"] is False
+    assert config["c"]["_defer_loading"] is True
@@ -0,0 +1,105 @@
+import asyncio
+
+import numpy as np
+import pytest
+from caproto import ChannelType
+
+from nbs_sim.devices.caproto_mca import MCAArray, MCASIM
+
+
+async def bad_count_time():
+    mca = MCASIM("MCA:")
+    for value in (0, -1.0):
+        with pytest.raises(ValueError):
+            await mca.COUNT_TIME.write(value)
+    return mca.COUNT_TIME.value
+
+
+def test_count_time_must_be_positive():
+    assert asyncio.run(bad_count_time()) == 1.0
+
+
+def roi_sums(centers, spectrum, limits):
+    return [int(spectrum[(centers >= lo) & (centers <= hi)].sum()) for lo, hi in limits]
+
+
+async def frame(mca, counts):
+    mca._acquire_frame = lambda: counts
+    await mca._frame(0.0, 1.0)
+    if mca.roi_bank is not None:
+        return [roi.COUNTS.value for roi in mca.roi_bank.roi_groups]
+
+
+ROIS = [[300.0, 400.0], {"name": "peak", "llim": 520.5, "ulim": 540.0}, [0.0, 1.0]]
+LIMITS = [(300.0, 400.0), (520.5, 540.0), (0.0, 1.0)]
+
+
+def test_rois_match_the_spectrum():
+    mca = MCASIM("MCA:", rois=ROIS, nrois=4)
+    counts = np.random.default_rng(0).poisson(50.0, mca.engine.nbins)
+    rois = asyncio.run(frame(mca, counts))
+    expected = roi_sums(mca.engine.centers, mca.SPECTRUM.value, LIMITS)
+    assert rois == expected + [0]
+    assert expected[0] > 0 and expected[2] == 0
+
+
+def test_rois_do_not_saturate_with_compact_counts():
+    mca = MCASIM("MCA:", rois=ROIS, counts_dtype="int16")
+    counts = np.full(mca.engine.nbins, 40000, dtype=np.int64)
+    rois = asyncio.run(frame(mca, counts))
+    assert mca.SPECTRUM.value.max() == np.iinfo(np.int16).max
+    assert rois == roi_sums(mca.engine.centers, counts, LIMITS)
+    assert rois[0] == 100 * 40000
+
+
+async def pixel_frame(mca, pixel):
+    await mca.PIXEL_SELECT.write(pixel)
+    counts = mca.engine.generate(550.0, 1e4)
+    await frame(mca, counts)
+    return counts
+
+
+def test_mca_array_sums_the_pixels():
+    mca = MCAArray("TES:", npixels=16, seed=0)
+    counts = asyncio.run(pixel_frame(mca, 5))
+    assert counts.shape == (16, mca.engine.nbins)
+    spectrum = counts.sum(axis=0)
+    assert np.array_equal(mca.SPECTRUM.value, spectrum)
+    assert np.array_equal(mca.PIXEL_COUNTS.value, counts.sum(axis=1))
+    assert np.array_equal(mca.PIXEL_SPECTRUM.value, counts[5])
+    assert mca.COUNTS.value == counts.sum() > 0
+
+
+def test_default_dtypes():
+    mca = MCASIM("MCA:")
+    assert type(mca) is MCASIM
+    assert mca.SPECTRUM.data_type == ChannelType.LONG
+    assert mca.CENTERS.data_type == ChannelType.DOUBLE
+
+
+def test_compact_dtypes_are_selected():
+    mca = MCASIM("MCA:", counts_dtype="int16", centers_dtype="float32")
+    array = MCAArray("TES:", npixels=4, counts_dtype="int16")
+    assert isinstance(mca, MCASIM) and isinstance(array, MCAArray)
+    same = MCASIM("MCA2:", counts_dtype="int16", centers_dtype="float32")
+    assert type(same) is type(mca)
+    assert mca.SPECTRUM.data_type == ChannelType.INT
+    assert mca.FLY_COUNTS.data_type == ChannelType.INT
+    assert mca.CENTERS.data_type == ChannelType.FLOAT
+    assert array.PIXEL_SPECTRUM.data_type == ChannelType.INT
+    assert array.CENTERS.data_type == ChannelType.DOUBLE
+
+
+def test_unknown_dtype_is_rejected():
+    with pytest.raises(ValueError, match="Unsupported waveform dtype"):
+        MCASIM("MCA:", counts_dtype="uint8")
+
+
+def test_int16_counts_saturate():
+    mca = MCASIM("MCA:", counts_dtype="int16")
+    counts = np.arange(mca.engine.nbins, dtype=np.int64) * 100
+    asyncio.run(frame(mca, counts))
+    spectrum = mca.SPECTRUM.value
+    assert spectrum.dtype == np.int16 and len(spectrum) == mca.engine.nbins
+    assert np.array_equal(spectrum, np.minimum(counts, 32767))
+    assert mca.COUNTS.value == counts.sum()
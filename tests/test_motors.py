@@ -0,0 +1,59 @@
+import asyncio
+
+import pytest
+
+from nbs_sim.headless import HeadlessSim
+
+CONFIG = {
+    "mtr": {
+        "_target": "nbs_sim.devices.motors.SimMotor",
+        "_group": "motors",
+        "prefix": "MTR:",
+        "velocity": 10.0,
+        "user_limits": [-100.0, 100.0],
+    }
+}
+
+
+def readback(sim):
+    return sim.pvdb["MTR:"].field_inst.user_readback_value.value
+
+
+def done(sim):
+    return sim.pvdb["MTR:"].field_inst.done_moving_to_value.value == 1
+
+
+async def retarget():
+    async with HeadlessSim(CONFIG, seed=0) as sim:
+        await sim.put("MTR:", 50.0, wait=False)
+        await sim.step(1.0)
+        assert 0.0 < readback(sim) < 50.0
+        await sim.put("MTR:", -20.0, wait=False)
+        await sim.step(0.5)
+        await sim.wait_until(lambda: done(sim), timeout=60.0)
+        return readback(sim), sim.get("MTR:")
+
+
+def test_retarget_during_move():
+    final, setpoint = asyncio.run(retarget())
+    assert setpoint == -20.0
+    assert final == pytest.approx(-20.0)
+
+
+async def stop_during_move():
+    async with HeadlessSim(CONFIG, seed=0) as sim:
+        await sim.put("MTR:", 50.0, wait=False)
+        await sim.step(1.0)
+        await sim.pvdb["MTR:"].field_inst.stop.write(1)
+        await sim.step(0.5)
+        await sim.wait_until(lambda: done(sim), timeout=10.0)
+        stopped = readback(sim)
+        await sim.step(10.0)
+        return stopped, readback(sim), sim.get("MTR:")
+
+
+def test_stop_does_not_start_a_new_move():
+    stopped, later, setpoint = asyncio.run(stop_during_move())
+    assert 0.0 < stopped < 50.0
+    assert later == stopped
+    assert setpoint == pytest.approx(stopped)
@@ -0,0 +1,53 @@
+import asyncio
+import json
+
+import pytest
+
+from nbs_sim.devices.pulses import PulseStreamPublisher, default_calibration
+from nbs_sim.headless import HeadlessSim
+
+
+def tes(prefix):
+    return {
+        "_target": "nbs_sim.devices.caproto_mca.TESPulseMCA",
+        "_group": "detectors",
+        "prefix": prefix,
+        "rate": 2e4,
+    }
+
+
+async def two_streams():
+    config = {"tes1": tes("TES1:"), "tes2": tes("TES2:")}
+    async with HeadlessSim(config, stepped=False, seed=0) as sim:
+        await sim.put("TES1:ACQUIRE", -1)
+        await sim.put("TES2:ACQUIRE", -1)
+        await asyncio.sleep(1.3)
+        return [
+            (device.publisher.events_sent, device._events)
+            for device in sim.devices.values()
+        ]
+
+
+def test_simulated_streams_do_not_collide():
+    events = asyncio.run(two_streams())
+    assert all(sent > 0 and received > 0 for sent, received in events)
+
+
+def test_short_calibration_is_rejected():
+    with pytest.raises(ValueError, match="covers 10 channels"):
+        PulseStreamPublisher(
+            "inproc://test", nchannels=20, calibration=default_calibration(10)
+        )
+
+
+def test_short_cal_file_is_rejected(tmp_path):
+    cal_file = tmp_path / "cal.json"
+    cal_file.write_text(json.dumps({str(i): [1.0, 0.0] for i in range(10)}))
+    sim = HeadlessSim({"tes": dict(tes("TES:"), cal_file=str(cal_file))})
+    with pytest.raises(ValueError, match="covers 10 channels"):
+        sim.devices["tes"].load_cal_file(str(cal_file))
+
+
+def test_external_stream_needs_an_address():
+    with pytest.raises(ValueError, match="address is required"):
+        HeadlessSim({"tes": dict(tes("TES:"), simulate=False)})
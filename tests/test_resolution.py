@@ -0,0 +1,43 @@
+import gc
+
+import numpy as np
+
+from nbs_sim.resolution import BroadeningCache, broaden
+from nbs_sim.spectral import SpectralTable
+
+
+def edge(center=530.0):
+    x = np.arange(400.0, 700.0, 0.01)
+    return SpectralTable(x[0], 0.01, 0.5 * (1.0 + np.tanh((x - center) / 0.1)))
+
+
+def test_broadening_preserves_grid_and_smooths():
+    table = edge()
+    broadened = broaden(table, 3000.0)
+    assert (broadened.x0, broadened.step) == (table.x0, table.step)
+    assert np.max(np.abs(np.diff(broadened.values))) < np.max(np.abs(np.diff(table.values)))
+    assert np.isclose(broadened(450.0), table(450.0), atol=1e-12)
+    assert np.isclose(broadened(690.0), table(690.0), atol=1e-12)
+
+
+def test_cache_hits_and_drops_dead_tables():
+    cache = BroadeningCache(maxsize=2)
+    kept, dropped = edge(), edge(540.0)
+    first = cache.table(kept, (1200, 1.55), 10000.0)
+    assert cache.table(kept, (1200, 1.55), 10000.0) is first
+    cache.table(dropped, (1200, 1.55), 10000.0)
+    assert (cache.hits, cache.misses) == (1, 2)
+    del dropped
+    gc.collect()
+    assert len(cache._settings[(1200, 1.55)]) == 1
+    for cff in (1.6, 1.7):
+        cache.table(kept, (1200, cff), 10000.0)
+    assert list(cache._settings) == [(1200, 1.6), (1200, 1.7)]
+
+
+def test_broadening_is_opt_in(energy_sim):
+    table = edge()
+    plain = energy_sim().beamline
+    assert plain.resolved(table) is table
+    broadening = energy_sim(resolution={}).beamline
+    assert broadening.resolved(table) is not table
@@ -0,0 +1,34 @@
+import tomllib
+
+import pytest
+
+from nbs_sim.scale import generate_config, main, measure, write_config
+
+
+def test_generated_config_round_trips(tmp_path):
+    devices, sim_conf = generate_config(motors=2, mcas=3)
+    write_config(tmp_path, devices, sim_conf)
+    with open(tmp_path / "devices.toml", "rb") as f:
+        assert tomllib.load(f) == devices
+    with open(tmp_path / "sim_conf.toml", "rb") as f:
+        assert tomllib.load(f) == sim_conf
+
+
+def test_measure_starts_a_fraction_of_mcas(tmp_path):
+    write_config(tmp_path, *generate_config(mcas=4))
+    assert measure(str(tmp_path), seconds=0.1)["mcas_acquiring"] == 4
+    assert measure(str(tmp_path), seconds=0.1, acquiring=0.5)["mcas_acquiring"] == 2
+    assert measure(str(tmp_path), seconds=0.1, acquiring=0)["mcas_acquiring"] == 0
+
+
+@pytest.mark.parametrize("command", [["measure", "DIR"], ["scale-report"]])
+@pytest.mark.parametrize("acquiring", ["-0.5", "1.5", "half"])
+def test_acquiring_must_be_a_fraction(command, acquiring, capsys):
+    with pytest.raises(SystemExit):
+        main(command + ["--acquiring", acquiring])
+    assert "--acquiring" in capsys.readouterr().err
+
+
+def test_measure_rejects_bad_fraction():
+    with pytest.raises(ValueError, match="between 0 and 1"):
+        measure("DIR", acquiring=1.5)
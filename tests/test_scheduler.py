@@ -0,0 +1,111 @@
+import asyncio
+from types import SimpleNamespace
+
+from caproto import AlarmSeverity, AlarmStatus
+from caproto.asyncio.server import AsyncioAsyncLayer
+from caproto.server import PVGroup, pvproperty
+
+from nbs_sim.devices.detectors import SSTADC
+from nbs_sim.devices.signals import RingCurrent
+from nbs_sim.headless import HeadlessSim
+from nbs_sim.scheduler import TickScheduler
+
+
+class Holder(PVGroup):
+    value = pvproperty(value=0.0, read_only=True)
+
+
+def adc(prefix, kind):
+    return {
+        "_target": "nbs_sim.devices.detectors.SSTADC",
+        "_group": "detectors",
+        "prefix": prefix,
+        "kind": kind,
+    }
+
+
+async def failing_job():
+    config = {"good": adc("GOOD:", "i0"), "bad": adc("BAD:", "nonsense")}
+    async with HeadlessSim(config, seed=0) as sim:
+        values = []
+        for _ in range(4):
+            await sim.step(1.0)
+            values.append(sim.get("GOOD:Volt"))
+        return values, sim.pvdb["BAD:Volt"].alarm, sim.pvdb["GOOD:Volt"].alarm
+
+
+def test_failing_job_does_not_stop_the_others():
+    values, bad_alarm, good_alarm = asyncio.run(failing_job())
+    assert len(set(values)) == len(values)
+    assert (bad_alarm.status, bad_alarm.severity) == (
+        AlarmStatus.SCAN,
+        AlarmSeverity.MAJOR_ALARM,
+    )
+    assert good_alarm.severity == AlarmSeverity.NO_ALARM
+
+
+async def run_ticks(values, times, **policy):
+    holder = Holder("TEST:")
+    scheduler = TickScheduler("TEST:SCHED:")
+    source = iter(values)
+    job = scheduler.add(holder.value, lambda: next(source), 1.0)
+    for key, setting in policy.items():
+        setattr(job, key, setting)
+    written = []
+    for now in times:
+        scheduler.rate_classes[1.0].deadline = now
+        await scheduler.tick(now)
+        written.append(holder.value.value)
+    return written, scheduler._suppressed
+
+
+def test_deadband_suppresses_small_changes():
+    written, suppressed = asyncio.run(
+        run_ticks([1.0, 1.05, 1.2, 1.25, 0.9], range(5), deadband=0.1)
+    )
+    assert written == [1.0, 1.0, 1.2, 1.2, 0.9]
+    assert suppressed == 2
+
+
+def test_relative_deadband():
+    written, _ = asyncio.run(
+        run_ticks([100.0, 100.5, 102.0], range(3), rel_deadband=0.01)
+    )
+    assert written == [100.0, 100.0, 102.0]
+
+
+def test_max_rate_limits_writes():
+    written, suppressed = asyncio.run(
+        run_ticks([1.0, 2.0, 3.0, 4.0], [0.0, 0.2, 0.4, 0.6], max_rate=2.0)
+    )
+    assert written == [1.0, 1.0, 1.0, 4.0]
+    assert suppressed == 2
+
+
+class Source(PVGroup):
+    def beam_state(self):
+        return SimpleNamespace(intensity=2.0, current=400.0)
+
+
+async def unscheduled():
+    parent = Source("P:")
+    adc = SSTADC("ADC:", kind="i0", parent=parent)
+    ring = RingCurrent("RING:", parent=parent)
+    orphan = SSTADC("ORPHAN:", kind="i0")
+    async_lib = AsyncioAsyncLayer()
+    tasks = [
+        asyncio.ensure_future(pv.server_startup(async_lib))
+        for pv in (adc.Volt, ring.current, orphan.Volt)
+    ]
+    await asyncio.sleep(0.05)
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    return adc.Volt.value, ring.current.value, orphan.Volt.alarm
+
+
+def test_devices_without_a_scheduler_scan_themselves():
+    volt, current, orphan_alarm = asyncio.run(unscheduled())
+    assert abs(volt - 2.0) < 0.5
+    assert current == 400.0
+    assert orphan_alarm.status == AlarmStatus.SCAN
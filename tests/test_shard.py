@@ -0,0 +1,181 @@
+import asyncio
+import threading
+
+import numpy as np
+import pytest
+
+from nbs_sim.headless import HeadlessSim
+from nbs_sim.shard import (
+    SHARED_FIELDS,
+    RemoteEnergy,
+    SharedBeamInputs,
+    ShardLink,
+    partition_config,
+)
+
+
+@pytest.fixture
+def shared():
+    shared = SharedBeamInputs(2, max_retries=50)
+    yield shared
+    shared.close()
+
+
+def test_publish_and_attach(shared):
+    values = np.arange(len(SHARED_FIELDS), dtype=float)
+    shared.publish(1, values)
+    other = SharedBeamInputs(2, name=shared.name)
+    try:
+        assert np.array_equal(other.read(1), values)
+        assert np.isnan(other.read(0)).all()
+    finally:
+        other.close()
+    assert shared.rows[1, 0] == 2
+
+
+def test_reads_are_consistent_under_concurrent_writes(shared):
+    done = threading.Event()
+
+    def writer():
+        n = 0
+        while not done.is_set():
+            n += 1
+            shared.publish(0, np.full(len(SHARED_FIELDS), float(n)))
+
+    thread = threading.Thread(target=writer)
+    thread.start()
+    try:
+        for _ in range(20000):
+            row = shared.read(0)
+            assert np.all(row == row[0])
+    finally:
+        done.set()
+        thread.join()
+
+
+def test_stuck_writer_falls_back_to_last_good_row(shared):
+    with pytest.raises(RuntimeError, match="stuck"):
+        shared.rows[0, 0] = 1
+        shared.read(0)
+    shared.rows[0, 0] = 0
+    shared.publish(0, np.ones(len(SHARED_FIELDS)))
+    shared.read(0)
+    shared.publish(0, np.zeros(len(SHARED_FIELDS)))
+    shared.rows[0, 0] += 1
+    assert np.array_equal(shared.read(0), np.ones(len(SHARED_FIELDS)))
+
+
+CONFIG = {
+    "ring": {"_target": "RingCurrent", "_group": "source", "_role": "beam_current"},
+    "en": {"_target": "SST1Energy", "_group": "source", "_role": "energy"},
+    "eslit": {"_target": "Slit", "_group": "apertures"},
+    "i0": {"_target": "SSTADC", "_group": "detectors"},
+    "sc": {"_target": "SSTADC", "_group": "detectors"},
+    "tes": {"_target": "MCASIM", "_group": ["spectrometers", "detectors"]},
+    "loaders": "not a device",
+}
+
+
+def keys(shard):
+    return sorted(k for k, v in shard.items() if isinstance(v, dict))
+
+
+def test_partition_defaults():
+    shards = partition_config(CONFIG, 3)
+    assert keys(shards[0]) == ["en", "eslit", "ring"]
+    assert keys(shards[1]) == ["i0", "tes"]
+    assert keys(shards[2]) == ["sc"]
+    assert all(shard["loaders"] == "not a device" for shard in shards)
+
+
+def test_partition_assignments():
+    shards = partition_config(
+        CONFIG, 3, {"detectors": 1, "spectrometers": 2, "sc": 0}
+    )
+    assert keys(shards[0]) == ["en", "eslit", "ring", "sc"]
+    assert keys(shards[1]) == ["i0"]
+    assert keys(shards[2]) == ["tes"]
+
+
+def test_partition_single_shard_and_bad_index():
+    assert keys(partition_config(CONFIG, 1)[0]) == keys(CONFIG)
+    with pytest.raises(ValueError, match="Shard 3 of i0"):
+        partition_config(CONFIG, 3, {"i0": 3})
+
+
+ADC = {
+    "_target": "nbs_sim.devices.detectors.SSTADC",
+    "_group": "detectors",
+    "prefix": "I0:",
+    "kind": "i0",
+}
+
+
+async def start_shards(shared, config):
+    parts = partition_config(config, 2)
+    sims = [
+        HeadlessSim(parts[i], shard=ShardLink(shared, i, config, parts), seed=0)
+        for i in range(2)
+    ]
+    for sim in sims:
+        await sim.start()
+    return sims
+
+
+async def remote_flux(shared, energy):
+    sims = await start_shards(shared, {"en": energy, "i0": ADC})
+    local, remote = (sim.beamline.energy for sim in sims)
+    await sims[0].put("EN:MonoMtr:ENERGY_SP", 900.0)
+    await sims[0].step(0.5)
+    sims[0].beamline.shard.publish()
+    energies = np.linspace(400.0, 1400.0, 50)
+    traces = [local.flux_trace(energies), remote.flux_trace(energies)]
+    await sims[0].put("EN:TRACKING", 0)
+    sims[0].beamline.shard.publish()
+    traces += [local.flux_trace(energies), remote.flux_trace(energies)]
+    factors = [local.flux_factor(), remote.flux_factor(), remote.value]
+    for sim in sims:
+        await sim.stop()
+    return remote, traces, factors
+
+
+def test_remote_energy_flux_trace(shared, energy_config):
+    remote, traces, factors = asyncio.run(
+        remote_flux(shared, energy_config(undulator={}))
+    )
+    assert isinstance(remote, RemoteEnergy)
+    assert np.allclose(traces[0], traces[1])
+    assert np.allclose(traces[2], traces[3])
+    assert not np.allclose(traces[0], traces[2])
+    assert factors[0] == pytest.approx(factors[1])
+    assert factors[2] == 900.0
+
+
+MANIPULATOR = {
+    "_target": "nbs_sim.devices.manipulator.Manipulator",
+    "_role": "primary_manipulator",
+    "_group": "manipulators",
+    "prefix": "MANIP:",
+    "samples": {
+        "c": {"position": {"side": 3, "coordinates": [9.5, 10, 19.5, 20]}},
+        "a": {"position": {"side": 1, "coordinates": [5, 10, 15, 20]}},
+    },
+}
+
+
+async def remote_samples(shared):
+    sims = await start_shards(shared, {"manip": MANIPULATOR, "i0": ADC})
+    local, remote = (sim.beamline.primary_manipulator for sim in sims)
+    targets = []
+    for position in [(-2.25, 0, 264, 90), (2.25, 0, 264, 270), (-2.25, 0, 264, 0)]:
+        local.readbacks = lambda: position
+        sims[0].beamline.shard.publish()
+        targets.append((local.beam_target()[1], remote.beam_target()[1]))
+    for sim in sims:
+        await sim.stop()
+    return targets
+
+
+def test_remote_manipulator_sample(shared):
+    targets = asyncio.run(remote_samples(shared))
+    assert targets == [("a", "a"), ("c", "c"), (None, None)]
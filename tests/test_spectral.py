@@ -0,0 +1,58 @@
+import warnings
+
+import numpy as np
+import pytest
+
+from nbs_sim.spectral import LIST_LOOKUP_MAX, SpectralTable
+
+
+def lorentzian(x):
+    return 1.0 / (1.0 + ((x - 530.0) / 0.8) ** 2)
+
+
+def test_error_bound_holds_between_grid_points():
+    table = SpectralTable.from_function(lorentzian, 500.0, 560.0, tolerance=1e-4)
+    assert table.max_error <= 1e-4
+    x = np.linspace(500.0, 560.0, 100003)
+    assert np.max(np.abs(table(x) - lorentzian(x))) <= 1e-4 * 1.01
+
+
+def test_scalar_matches_batch():
+    table = SpectralTable.from_function(lorentzian, 500.0, 560.0)
+    x = np.array([499.0, 500.0, 529.97, 530.0, 545.5, 560.0, 600.0])
+    assert np.allclose([table(v) for v in x], table(x))
+
+
+def test_unreached_tolerance_warns():
+    with pytest.warns(RuntimeWarning, match="above the tolerance"):
+        table = SpectralTable.from_function(
+            lorentzian, 500.0, 560.0, resolution=1.0, tolerance=1e-9, max_points=64
+        )
+    assert table.max_error > 1e-9
+
+
+def test_reached_tolerance_does_not_warn():
+    with warnings.catch_warnings():
+        warnings.simplefilter("error")
+        SpectralTable.from_function(lorentzian, 500.0, 560.0, tolerance=1e-3)
+
+
+def test_nan_energy():
+    table = SpectralTable(0.0, 1.0, [0.0, 1.0, 2.0])
+    assert np.isnan(table(float("nan")))
+    result = table(np.array([0.5, np.nan, 5.0]))
+    assert result[0] == 0.5 and np.isnan(result[1]) and result[2] == 2.0
+
+
+def test_large_tables_index_the_array():
+    values = np.linspace(0.0, 1.0, LIST_LOOKUP_MAX + 1)
+    table = SpectralTable(0.0, 1.0, values)
+    assert table._list is table.values
+    assert table(10.5) == pytest.approx(values[10] + 0.5 * (values[11] - values[10]))
+
+
+
+def test_default_sized_tables_use_lists():
+    # all_edges and all_ref tabulate to about 288k points.
+    table = SpectralTable(0.0, 1.0, np.zeros(300000))
+    assert isinstance(table._list, list)
@@ -0,0 +1,60 @@
+import os
+
+import numpy as np
+import pytest
+
+from nbs_sim.beamline import Beamline
+from nbs_sim.geometry import read_sample_csv
+from nbs_sim.spectral_db import SpectralDatabase
+
+
+def peak(center):
+    x = np.linspace(500.0, 560.0, 601)
+    return x, np.exp(-0.5 * ((x - center) / 2.0) ** 2)
+
+
+def test_database_round_trip(tmp_path):
+    db = SpectralDatabase.build(
+        tmp_path, {"a": peak(520.0), "b": peak(540.0)}, step=0.05
+    )
+    assert sorted(os.listdir(tmp_path)) == ["index.json", "spectra.npy"]
+    reopened = SpectralDatabase(tmp_path)
+    assert len(reopened) == 2 and "a" in reopened and "c" not in reopened
+    assert reopened.table("a")(520.0) == pytest.approx(1.0, abs=1e-6)
+    assert reopened.table("b")(520.0) == pytest.approx(db.table("b")(520.0))
+    assert reopened.table("c") is None
+
+
+def test_sample_spectrum_is_relative_to_the_config(tmp_path):
+    x, y = peak(520.0)
+    np.savez(tmp_path / "a.npz", x=x, y=y)
+    config = {
+        "manipulator": {
+            "_target": "nbs_sim.devices.manipulator.Manipulator",
+            "_role": "primary_manipulator",
+            "_group": "manipulators",
+            "prefix": "MANIP:",
+            "samples": {
+                "a": {
+                    "position": {"side": 1, "coordinates": [0, 0, 10, 10]},
+                    "spectrum": "a.npz",
+                }
+            },
+        }
+    }
+    beamline = Beamline(config=config, prefix="SIM:", config_dir=str(tmp_path))
+    table = beamline.sample_table("a")
+    assert table is not beamline.yspl
+    assert table(520.0) == pytest.approx(1.0, abs=1e-3)
+
+
+def test_sample_file_spectrum_is_relative_to_the_file(tmp_path):
+    path = tmp_path / "samples.csv"
+    path.write_text(
+        "sample_id, sample_name, side, x1, y1, x2, y2, spectrum\n"
+        "a, A, 1, 0, 0, 10, 10, spectra/a.npz\n"
+        "b, B, 1, 0, 20, 10, 30, /data/b.npz\n"
+    )
+    samples = read_sample_csv(str(path))
+    assert samples["a"]["spectrum"] == str(tmp_path / "spectra" / "a.npz")
+    assert samples["b"]["spectrum"] == "/data/b.npz"
@@ -0,0 +1,58 @@
+import numpy as np
+import pytest
+from scipy.stats import norm
+
+from nbs_sim.devices.spectrum import PixelArrayEngine, SpectrumEngine
+
+
+def reference(centers, energy, lines, width):
+    return sum(
+        rel * norm.pdf(centers, loc=energy + offset, scale=width)
+        for offset, rel in lines
+    )
+
+
+def test_template_matches_the_line_shape():
+    engine = SpectrumEngine(200.0, 1000.0, 800, seed=0)
+    for energy in (550.0, 550.3, 250.0, 995.0):
+        expected = reference(engine.centers, energy, engine.default_lines, 1.5)
+        assert np.allclose(engine.template(energy), expected, rtol=0, atol=1e-12)
+
+
+def test_template_follows_layout_changes():
+    engine = SpectrumEngine(200.0, 1000.0, 800, seed=0)
+    engine.template(550.0)
+    assert engine.set_layout(400.0, 700.0, 3000)
+    assert not engine.set_layout(400.0, 700.0, 3000)
+    expected = reference(engine.centers, 550.0, engine.default_lines, 1.5)
+    assert np.allclose(engine.template(550.0), expected, rtol=0, atol=1e-12)
+
+
+def test_counts_are_poisson_around_the_template():
+    engine = SpectrumEngine(200.0, 1000.0, 800, seed=0)
+    scale = 1000.0
+    frames = np.array([engine.generate(550.0, scale) for _ in range(400)])
+    expected = scale * engine.template(550.0)
+    assert frames.dtype.kind == "i"
+    assert np.all(frames[:, expected == 0] == 0)
+    mean = frames.mean(axis=0)
+    peak = expected > 10
+    assert np.allclose(mean[peak], expected[peak], rtol=0.1)
+    assert frames.sum(axis=1).mean() == pytest.approx(expected.sum(), rel=0.01)
+
+
+def test_generate_is_seeded():
+    a = SpectrumEngine(200.0, 1000.0, 800, seed=3).generate(550.0, 100.0)
+    b = SpectrumEngine(200.0, 1000.0, 800, seed=3).generate(550.0, 100.0)
+    assert np.array_equal(a, b)
+
+
+def test_pixel_templates_follow_gain_and_width():
+    gains = np.array([0.99, 1.0, 1.02])
+    widths = np.array([1.0, 1.5, 2.5])
+    engine = PixelArrayEngine(200.0, 1000.0, 1600, gains=gains, widths=widths)
+    template = engine.template(550.0)
+    for pixel, (gain, width) in enumerate(zip(gains, widths)):
+        lines = [(gain * (550.0 + offset) - 550.0, rel) for offset, rel in engine.lines]
+        expected = reference(engine.centers, 550.0, lines, width) / len(gains)
+        assert np.allclose(template[pixel], expected, rtol=0, atol=1e-12)
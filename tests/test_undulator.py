@@ -0,0 +1,40 @@
+import asyncio
+
+import pytest
+
+
+
+def gap_velocity(sim):
+    return sim.pvdb["EN:GapMtr"].field_inst.velocity.value
+
+
+async def energy_move(sim):
+    async with sim:
+        energy = sim.beamline.energy
+        gap = energy.gap_readback
+        await sim.put("EN:MonoMtr:ENERGY_SP", 1000.0)
+        await sim.step(0.15)
+        lagging = sim.beamline.undulator_factor()
+        await sim.step(200.0)
+        return {
+            "velocity": gap_velocity(sim),
+            "gap_moved": energy.gap_readback != gap,
+            "lagging": lagging,
+            "settled": sim.beamline.undulator_factor(),
+            "expected_gap": None if energy.undulator is None else energy.undulator.gap(1000.0),
+            "gap": energy.gap_readback,
+        }
+
+
+def test_undulator_is_off_by_default(energy_sim):
+    result = asyncio.run(energy_move(energy_sim()))
+    assert result["velocity"] == 5000.0
+    assert not result["gap_moved"]
+    assert result["lagging"] == result["settled"] == 1.0
+
+
+def test_undulator_tracks_the_mono(energy_sim):
+    result = asyncio.run(energy_move(energy_sim(undulator={"gap_velocity": 0.5})))
+    assert result["velocity"] == 0.5
+    assert result["gap"] == pytest.approx(result["expected_gap"], abs=1e-3)
+    assert result["lagging"] < result["settled"]